@@ -7,6 +7,11 @@ export const WebSocketProvider = ({ children }) => {
   const [isConnected, setIsConnected] = useState(false);
   const [error, setError] = useState(null);
   const [stockData, setStockData] = useState({});
+  // Watchlist rows by symbol, rebuilt from snapshots and patched by deltas
+  const watchlistRef = useRef(new Map());
+  const seqRef = useRef(0);
+  // The server stops sending when too many frames go unacknowledged
+  const ackEveryRef = useRef(0);
 
   const connectWebSocket = useCallback(() => {
     if (socketRef.current) {
@@ -26,16 +31,54 @@ export const WebSocketProvider = ({ children }) => {
 
     socket.onopen = () => {
       console.log('WebSocket connection established');
+      seqRef.current = 0;
       setIsConnected(true);
       setError(null);
     };
 
+    const publishWatchlist = () => {
+      // Components keep consuming the full list as a watchlist_update
+      setStockData({ type: 'watchlist_update', stocks: Array.from(watchlistRef.current.values()) });
+    };
+
     socket.onmessage = (event) => {
+      let data;
       try {
-        const data = JSON.parse(event.data);
-        setStockData(data);
+        data = JSON.parse(event.data);
       } catch (err) {
         console.error('Error parsing websocket message:', err);
+        return;
+      }
+
+      // A skipped sequence number means a lost delta, ask for a fresh snapshot
+      const expected = seqRef.current + 1;
+      seqRef.current = data.seq;
+      if (data.ack_every) {
+        ackEveryRef.current = data.ack_every;
+      }
+      if (ackEveryRef.current && data.seq % ackEveryRef.current === 0) {
+        socket.send(JSON.stringify({ type: 'ack', seq: data.seq }));
+      }
+      if (data.type === 'watchlist_snapshot') {
+        watchlistRef.current = new Map(data.stocks.map((row) => [row.stock__symbol, row]));
+        publishWatchlist();
+        return;
+      }
+      if (data.seq !== expected) {
+        socket.send(JSON.stringify({ type: 'resync' }));
+        return;
+      }
+
+      if (data.type === 'watchlist_delta') {
+        data.stocks.forEach((change) => {
+          const row = watchlistRef.current.get(change.stock__symbol);
+          if (row) {
+            watchlistRef.current.set(change.stock__symbol, { ...row, ...change });
+          }
+        });
+        publishWatchlist();
+      } else {
+        setStockData(data);
       }
     };
 
@@ -0,0 +1,69 @@
+import numpy as np
+from .vectorized import condition_mask
+
+DAILY = 'daily'
+
+
+def day_starts(timestamp):
+    """Indices of the first bar of each trading day in oldest-first timestamps"""
+    day = timestamp.astype('U10')
+    return np.flatnonzero(np.insert(day[1:] != day[:-1], 0, True))
+
+
+def to_daily(arrays):
+    """Merge oldest-first intraday bars into one bar per trading day"""
+    if not len(arrays['close']):
+        return arrays
+    starts = day_starts(arrays['timestamp'])
+    ends = np.append(starts[1:], len(arrays['close'])) - 1
+    return {
+        'timestamp': arrays['timestamp'][starts].astype('U10'),
+        'open': arrays['open'][starts],
+        'high': np.maximum.reduceat(arrays['high'], starts),
+        'low': np.minimum.reduceat(arrays['low'], starts),
+        'close': arrays['close'][ends],
+        'volume': np.add.reduceat(arrays['volume'], starts),
+    }
+
+
+def quote_series(arrays):
+    """Rebuild what a quote would have said at the close of every bar.
+
+    Like the GLOBAL_QUOTE a live alert is checked against: price is the bar
+    close, change_percent is measured from the previous day's last close and
+    volume is the day's volume so far. Bars on the first day have no
+    previous close, so their change_percent is NaN.
+    """
+    close = arrays['close']
+    starts = day_starts(arrays['timestamp'])
+    lengths = np.diff(np.append(starts, len(close)))
+
+    previous_close = np.full(len(starts), np.nan)
+    previous_close[1:] = close[starts[1:] - 1]
+    previous_close = np.repeat(previous_close, lengths)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_percent = np.round((close - previous_close) / previous_close * 100, 4)
+
+    cum_volume = np.cumsum(arrays['volume'])
+    day_base = np.repeat(np.insert(cum_volume[starts[1:] - 1], 0, 0.0), lengths)
+    return close, change_percent, cum_volume - day_base
+
+
+def replay(arrays, alert_type, threshold):
+    """Replay one alert over oldest-first bars.
+
+    The condition is evaluated at every bar at once. A trigger is counted
+    each time the condition goes from unmet to met, as if the alert was
+    reset as soon as the condition cleared.
+    """
+    price, change_percent, volume = quote_series(arrays)
+    met = condition_mask(alert_type, float(threshold), price, change_percent, volume)
+    triggers = np.flatnonzero(met & ~np.insert(met[:-1], 0, False))
+    return {
+        'bars': len(met),
+        'bars_met': int(met.sum()),
+        'trigger_count': len(triggers),
+        'triggers': arrays['timestamp'][triggers].tolist(),
+        'start': arrays['timestamp'][0] if len(met) else None,
+        'end': arrays['timestamp'][-1] if len(met) else None,
+    }
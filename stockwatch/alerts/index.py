@@ -0,0 +1,210 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from django.conf import settings
+from django.core.cache import cache
+from stocks.utils import to_decimal
+from .models import Alert, AlertType
+
+# Alert changes are published as a numbered log: VERSION_KEY holds the latest number and
+# each change list is stored under CHANGE_KEY_PREFIX:<number>, so every process's index
+# can apply changes made elsewhere instead of reloading everything
+VERSION_KEY = 'alerts:index:version'
+CHANGE_KEY_PREFIX = 'alerts:index:changes'
+
+
+class AlertIndex:
+    """In-memory index of armed alerts keyed by symbol and alert type.
+
+    Each (symbol, alert type) keeps its thresholds in a sorted list with a
+    parallel list of alert ids, so the alerts crossed by a quote are one
+    contiguous slice found with a bisect: O(log n + k) in the number of
+    alerts that fire. Conditions match AlertService.check_alert.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._books = {}   # symbol -> {alert_type: (thresholds, ids)}
+        self._alerts = {}  # alert id -> (symbol, alert_type, threshold key)
+        self.built_at = None
+        self.version = None
+
+    @staticmethod
+    def threshold_key(alert_type, threshold):
+        threshold = to_decimal(threshold)
+        if alert_type == AlertType.VOLUME_ABOVE:
+            return int(threshold)
+        return threshold
+
+    def rebuild(self, rows, version=None):
+        """Replace the index with (id, symbol, alert_type, threshold) rows read at `version`"""
+        books = {}
+        alerts = {}
+        for alert_id, symbol, alert_type, threshold in rows:
+            symbol = symbol.upper()
+            key = self.threshold_key(alert_type, threshold)
+            alerts[alert_id] = (symbol, alert_type, key)
+            books.setdefault(symbol, {}).setdefault(alert_type, []).append((key, alert_id))
+
+        for by_type in books.values():
+            for alert_type, entries in by_type.items():
+                entries.sort()
+                by_type[alert_type] = ([key for key, _ in entries], [alert_id for _, alert_id in entries])
+
+        with self._lock:
+            self._books = books
+            self._alerts = alerts
+            self.built_at = time.monotonic()
+            self.version = version
+
+    def add(self, alert_id, symbol, alert_type, threshold):
+        """Insert or move an alert"""
+        symbol = symbol.upper()
+        key = self.threshold_key(alert_type, threshold)
+        with self._lock:
+            if self._alerts.get(alert_id) == (symbol, alert_type, key):
+                return
+            self.remove(alert_id)
+            thresholds, ids = self._books.setdefault(symbol, {}).setdefault(alert_type, ([], []))
+            position = bisect_right(thresholds, key)
+            thresholds.insert(position, key)
+            ids.insert(position, alert_id)
+            self._alerts[alert_id] = (symbol, alert_type, key)
+
+    def remove(self, alert_id):
+        """Drop an alert if it is indexed"""
+        with self._lock:
+            entry = self._alerts.pop(alert_id, None)
+            if entry is None:
+                return
+            symbol, alert_type, key = entry
+            by_type = self._books[symbol]
+            thresholds, ids = by_type[alert_type]
+            start = bisect_left(thresholds, key)
+            end = bisect_right(thresholds, key, start)
+            position = start + ids[start:end].index(alert_id)
+            del thresholds[position]
+            del ids[position]
+            if not ids:
+                del by_type[alert_type]
+                if not by_type:
+                    del self._books[symbol]
+
+    def apply(self, changes):
+        """Apply (id, symbol, alert_type, threshold, armed) changes"""
+        with self._lock:
+            for alert_id, symbol, alert_type, threshold, armed in changes:
+                if armed:
+                    self.add(alert_id, symbol, alert_type, threshold)
+                else:
+                    self.remove(alert_id)
+
+    def advance(self, version, changes=()):
+        """Apply changes published as `version`, if the index is at the version before it"""
+        with self._lock:
+            self.apply(changes)
+            if self.version is not None and self.version == version - 1:
+                self.version = version
+
+    def symbols(self):
+        with self._lock:
+            return list(self._books)
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def match(self, symbol, quote):
+        """Return ids of the alerts on a symbol whose condition the quote meets"""
+        with self._lock:
+            by_type = self._books.get(symbol.upper())
+            if not by_type:
+                return []
+
+            matched = []
+            for alert_type, (thresholds, ids) in by_type.items():
+                if alert_type == AlertType.PRICE_ABOVE:
+                    # price > threshold
+                    matched.extend(ids[:bisect_left(thresholds, quote['price'])])
+                elif alert_type == AlertType.PRICE_BELOW:
+                    # price < threshold
+                    matched.extend(ids[bisect_right(thresholds, quote['price']):])
+                elif alert_type == AlertType.PERCENT_CHANGE:
+                    # abs(change_percent) >= threshold
+                    matched.extend(ids[:bisect_right(thresholds, abs(quote['change_percent']))])
+                elif alert_type == AlertType.VOLUME_ABOVE:
+                    # volume > int(threshold)
+                    matched.extend(ids[:bisect_left(thresholds, quote['volume'])])
+            return matched
+
+
+alert_index = AlertIndex()
+
+
+def alert_change(alert, armed=None):
+    """Describe a saved or deleted alert as an index change"""
+    if armed is None:
+        armed = alert.is_active and not alert.is_triggered
+    # Removals need only the id, so a deleted alert's stock is never loaded
+    symbol = alert.stock.symbol if armed else None
+    return alert.id, symbol, alert.alert_type, to_decimal(alert.threshold_value), armed
+
+
+def publish_index_changes(changes):
+    """Publish alert changes for every process's index and apply them to this one.
+
+    Called once the changes are committed. Returns the version they were
+    published as, or None if the shared version could not be advanced.
+    """
+    changes = list(changes)
+    if not changes:
+        return None
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        return None
+    cache.set(f"{CHANGE_KEY_PREFIX}:{version}", changes, settings.ALERT_INDEX_REBUILD_INTERVAL)
+    if alert_index.built_at is not None:
+        alert_index.advance(version, changes)
+    return version
+
+
+def _load_changes(since, version):
+    """Return the change lists published after `since` up to `version`, or None if any is missing"""
+    if version - since > settings.ALERT_INDEX_MAX_CHANGES:
+        return None
+    keys = [f"{CHANGE_KEY_PREFIX}:{number}" for number in range(since + 1, version + 1)]
+    logged = cache.get_many(keys)
+    if len(logged) != len(keys):
+        return None
+    return [logged[key] for key in keys]
+
+
+def get_alert_index():
+    """Return this process's alert index, brought up to date with changes made elsewhere.
+
+    Changes published since the index's version are applied one by one.
+    The index is reloaded from the database only when it was never built,
+    every ALERT_INDEX_REBUILD_INTERVAL, or when the change log has a gap.
+    """
+    built_at = alert_index.built_at
+    version = cache.get(VERSION_KEY, 0)
+    if built_at is not None and time.monotonic() - built_at <= settings.ALERT_INDEX_REBUILD_INTERVAL:
+        if alert_index.version == version:
+            return alert_index
+        if alert_index.version is not None and alert_index.version < version:
+            logged = _load_changes(alert_index.version, version)
+            if logged is not None:
+                with alert_index._lock:
+                    for changes in logged:
+                        alert_index.advance(alert_index.version + 1, changes)
+                return alert_index
+
+    # The version is read before the rows, so changes published during the load are applied later
+    alert_index.rebuild(
+        Alert.objects.filter(is_active=True, is_triggered=False)
+        .values_list('id', 'stock__symbol', 'alert_type', 'threshold_value')
+        .iterator(),
+        version
+    )
+    return alert_index
@@ -0,0 +1,78 @@
+import random
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from alerts.models import AlertType
+from alerts.services import AlertService
+from alerts.vectorized import AlertBatch
+
+
+class Command(BaseCommand):
+    help = 'Compare per-alert and vectorized alert evaluation on synthetic alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--symbols', type=int, default=5000, help='Distinct symbols the alerts are spread over')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def synthetic_quotes(self, rng, count):
+        quotes = {}
+        for i in range(count):
+            price = Decimal(rng.randint(100, 100_000)) / 100
+            quotes[f'S{i:05d}'] = {
+                'price': price,
+                'change_percent': Decimal(rng.randint(-1000, 1000)) / 100,
+                'volume': rng.randint(0, 10_000_000),
+            }
+        return quotes
+
+    def synthetic_alerts(self, rng, quotes, size):
+        symbols = list(quotes)
+        alert_types = AlertType.values
+        rows = []
+        for alert_id in range(size):
+            alert_type = rng.choice(alert_types)
+            if alert_type == AlertType.VOLUME_ABOVE:
+                threshold = Decimal(rng.randint(0, 10_000_000))
+            elif alert_type == AlertType.PERCENT_CHANGE:
+                threshold = Decimal(rng.randint(0, 1000)) / 100
+            else:
+                threshold = Decimal(rng.randint(100, 100_000)) / 100
+            rows.append((alert_id, rng.choice(symbols), alert_type, threshold))
+        return rows
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        quotes = self.synthetic_quotes(rng, options['symbols'])
+        self.stdout.write(
+            f"{'alerts':>10} {'per-alert':>11} {'build':>9} {'evaluate':>9} {'batch':>9} {'speedup':>8} {'fired':>9}"
+        )
+
+        for size in options['sizes']:
+            rows = self.synthetic_alerts(rng, quotes, size)
+            alerts = [
+                SimpleNamespace(id=alert_id, symbol=symbol, alert_type=alert_type, threshold_value=threshold)
+                for alert_id, symbol, alert_type, threshold in rows
+            ]
+
+            started = time.perf_counter()
+            expected = [alert.id for alert in alerts if AlertService.condition_met(alert, quotes[alert.symbol])]
+            per_alert = time.perf_counter() - started
+
+            started = time.perf_counter()
+            batch = AlertBatch(rows)
+            build = time.perf_counter() - started
+
+            started = time.perf_counter()
+            fired = batch.evaluate(quotes)
+            evaluate = time.perf_counter() - started
+
+            if sorted(fired) != expected:
+                self.stderr.write(self.style.ERROR(f"Results differ at {size} alerts"))
+            # The sweep builds a fresh batch every run, so the speedup counts the build too
+            batch_total = build + evaluate
+            self.stdout.write(
+                f"{size:>10} {per_alert * 1000:>9.1f}ms {build * 1000:>7.1f}ms {evaluate * 1000:>7.1f}ms "
+                f"{batch_total * 1000:>7.1f}ms {per_alert / batch_total:>7.1f}x {len(fired):>9}"
+            )
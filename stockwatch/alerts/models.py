@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from stocks.models import Stock
 from decimal import Decimal
 from bson.decimal128 import Decimal128
@@ -27,4 +28,40 @@ class Alert(models.Model):
         super(Alert, self).save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.user.username} - {self.stock.symbol}"
\ No newline at end of file
+        return f"{self.user.username} - {self.stock.symbol}"
+
+class NotificationStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Pending'
+    SENT = 'SENT', 'Sent'
+    FAILED = 'FAILED', 'Failed'
+
+class AlertNotification(models.Model):
+    """Outbox row for an email waiting to be sent by the notification dispatcher"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='alert_notifications')
+    alert = models.ForeignKey(Alert, on_delete=models.SET_NULL, null=True, blank=True)
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    status = models.CharField(max_length=10, choices=NotificationStatus.choices, default=NotificationStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} - {self.subject}"
+
+class NotificationPreference(models.Model):
+    """Per-user alert email settings, blank values fall back to the site defaults"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_preference')
+    digest_window = models.PositiveIntegerField(null=True, blank=True, help_text='Seconds to collect alerts into one email')
+    max_emails_per_hour = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.username} notification preferences"
@@ -0,0 +1,252 @@
+import logging
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from .models import AlertNotification, AlertType, NotificationPreference, NotificationStatus
+
+logger = logging.getLogger(__name__)
+
+# (subject, body) templates per alert type, filled from the alert and its stock
+ALERT_EMAILS = {
+    AlertType.PRICE_ABOVE: (
+        "Price Alert: {symbol} is above ${threshold}",
+        "Your price alert for {name} ({symbol}) has been triggered.\n"
+        "Current price: ${price} is above your target of ${threshold}.\n\n"
+        "Change: {change_percent}%\n"
+        "Volume: {volume}\n\n",
+    ),
+    AlertType.PRICE_BELOW: (
+        "Price Alert: {symbol} is below ${threshold}",
+        "Your price alert for {name} ({symbol}) has been triggered.\n"
+        "Current price: ${price} is below your target of ${threshold}.\n\n"
+        "Change: {change_percent}%\n"
+        "Volume: {volume}\n\n",
+    ),
+    AlertType.PERCENT_CHANGE: (
+        "Change Alert: {symbol} moved by {change_percent}%",
+        "Your percent change alert for {name} ({symbol}) has been triggered.\n"
+        "Current change: {change_percent}% has exceeded your threshold of {threshold}%.\n\n"
+        "Current price: ${price}\n"
+        "Volume: {volume}\n\n",
+    ),
+    AlertType.VOLUME_ABOVE: (
+        "Volume Alert: {symbol} volume is above {threshold}",
+        "Your volume alert for {name} ({symbol}) has been triggered.\n"
+        "Current volume: {volume} has exceeded your threshold of {threshold}.\n\n"
+        "Current price: ${price}\n"
+        "Change: {change_percent}%\n\n",
+    ),
+}
+GREETING = "Hi {username},\n\n"
+DIGEST_INTRO = "{count} of your alerts have been triggered.\n\n"
+SIGNATURE = "Best regards,\nStock Watchlist Alert System"
+
+
+def alert_email_context(alert):
+    stock = alert.stock
+    return {
+        'symbol': stock.symbol,
+        'name': stock.name,
+        'price': stock.last_price,
+        'change_percent': stock.change_percent,
+        'volume': stock.volume,
+        'threshold': alert.threshold_value,
+    }
+
+
+def build_alert_email(alert):
+    """Return the (subject, body) for a triggered alert, without greeting or signature"""
+    subject, body = ALERT_EMAILS[alert.alert_type]
+    context = alert_email_context(alert)
+    return subject.format(**context), body.format(**context)
+
+
+def compose_email(user, notifications):
+    """Return the (subject, message) for one or more notifications to a user"""
+    greeting = GREETING.format(username=user.username)
+    if len(notifications) == 1:
+        notification = notifications[0]
+        return notification.subject, greeting + notification.message + SIGNATURE
+
+    subject = f"Stock Alerts: {len(notifications)} alerts triggered"
+    sections = [f"{notification.subject}\n{notification.message}" for notification in notifications]
+    return subject, greeting + DIGEST_INTRO.format(count=len(notifications)) + ''.join(sections) + SIGNATURE
+
+
+def get_preferences(user_ids):
+    """Return {user_id: (digest_window, max_emails_per_hour)} with site defaults filled in"""
+    preferences = dict.fromkeys(user_ids, (None, None))
+    preferences.update({
+        user_id: (digest_window, max_emails_per_hour)
+        for user_id, digest_window, max_emails_per_hour in NotificationPreference.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'digest_window', 'max_emails_per_hour')
+    })
+    return {
+        user_id: (
+            settings.ALERT_DIGEST_WINDOW if digest_window is None else digest_window,
+            settings.ALERT_MAX_EMAILS_PER_HOUR if max_emails_per_hour is None else max_emails_per_hour,
+        )
+        for user_id, (digest_window, max_emails_per_hour) in preferences.items()
+    }
+
+
+def queue_alert_notifications(alerts):
+    """Write outbox rows for triggered alerts in one insert, returning them.
+
+    Rows are held for the user's digest window so alerts that fire close
+    together go out as one message.
+    """
+    now = timezone.now()
+    preferences = get_preferences({alert.user_id for alert in alerts})
+    notifications = []
+    for alert in alerts:
+        subject, message = build_alert_email(alert)
+        digest_window = preferences[alert.user_id][0]
+        notifications.append(AlertNotification(
+            user=alert.user,
+            alert=alert,
+            recipient=alert.user.email,
+            subject=subject,
+            message=message,
+            next_attempt_at=now + timedelta(seconds=digest_window),
+        ))
+    return AlertNotification.objects.bulk_create(notifications)
+
+
+class NotificationDispatcher:
+    """Sends pending outbox rows as per-user digests over one reused mail connection.
+
+    Once any of a user's rows is due, all of that user's pending rows are
+    merged into one email, so alerts firing within the digest window cost
+    one message. Users over their hourly cap are deferred to the next hour,
+    when everything pending is coalesced again. A failed email only
+    reschedules its own rows, with exponential backoff and jitter, until
+    ALERT_NOTIFICATION_MAX_ATTEMPTS is reached.
+    """
+
+    lock_key = 'alerts:notification_dispatch:lock'
+
+    def __init__(self, batch_size=None, max_attempts=None, backoff_base=None):
+        self.batch_size = settings.ALERT_NOTIFICATION_BATCH_SIZE if batch_size is None else batch_size
+        self.max_attempts = settings.ALERT_NOTIFICATION_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.backoff_base = settings.ALERT_NOTIFICATION_BACKOFF_BASE if backoff_base is None else backoff_base
+
+    def due(self):
+        """Return {user: [pending notifications]} for up to batch_size users with a due row"""
+        user_ids = list(
+            AlertNotification.objects.filter(
+                status=NotificationStatus.PENDING,
+                next_attempt_at__lte=timezone.now()
+            ).order_by('user_id').values_list('user_id', flat=True).distinct()[:self.batch_size]
+        )
+        pending = AlertNotification.objects.filter(
+            status=NotificationStatus.PENDING,
+            user_id__in=user_ids
+        ).select_related('user').order_by('created_at')
+
+        by_user = {}
+        for notification in pending:
+            by_user.setdefault(notification.user, []).append(notification)
+        return by_user
+
+    def dispatch(self):
+        """Send every due digest, returning the number of emails sent"""
+        if not cache.add(self.lock_key, 1, settings.ALERT_NOTIFICATION_LOCK_TIMEOUT):
+            return 0
+        try:
+            sent = 0
+            while True:
+                batch = self.due()
+                if not batch:
+                    return sent
+                batch_sent = self.send_batch(batch)
+                sent += batch_sent
+                if batch_sent == 0:
+                    # Nothing went through, leave the rest for the next run
+                    return sent
+        finally:
+            cache.delete(self.lock_key)
+
+    def send_batch(self, by_user):
+        sent = 0
+        notifications = [notification for rows in by_user.values() for notification in rows]
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as exc:
+            logger.error("Could not open mail connection: %s", exc)
+            for notification in notifications:
+                self.record_failure(notification, exc)
+        else:
+            try:
+                preferences = get_preferences({user.id for user in by_user})
+                for user, rows in by_user.items():
+                    if self.over_rate_cap(user, preferences[user.id][1], rows):
+                        continue
+                    if self.send(connection, user, rows):
+                        sent += 1
+            finally:
+                connection.close()
+
+        AlertNotification.objects.bulk_update(
+            notifications,
+            ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+        return sent
+
+    def hourly_key(self, user):
+        return f"alerts:emails_sent:{user.id}:{int(timezone.now().timestamp() // 3600)}"
+
+    def over_rate_cap(self, user, max_emails_per_hour, rows):
+        """Defer a user's rows to the next hour once their cap is used up"""
+        if cache.get(self.hourly_key(user), 0) < max_emails_per_hour:
+            return False
+        now = timezone.now()
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        for notification in rows:
+            notification.next_attempt_at = next_hour
+        return True
+
+    def build_message(self, user, rows, connection):
+        subject, message = compose_email(user, rows)
+        return EmailMessage(
+            subject,
+            message,
+            settings.EMAIL_HOST_USER,
+            [rows[-1].recipient],
+            connection=connection,
+        )
+
+    def send(self, connection, user, rows):
+        try:
+            connection.send_messages([self.build_message(user, rows, connection)])
+        except Exception as exc:
+            logger.warning("Sending notifications to user %s failed: %s", user.id, exc)
+            for notification in rows:
+                self.record_failure(notification, exc)
+            return False
+
+        key = self.hourly_key(user)
+        cache.add(key, 0, 2 * 60 * 60)
+        cache.incr(key)
+
+        now = timezone.now()
+        for notification in rows:
+            notification.attempts += 1
+            notification.status = NotificationStatus.SENT
+            notification.sent_at = now
+            notification.last_error = ''
+        return True
+
+    def record_failure(self, notification, exc):
+        notification.attempts += 1
+        notification.last_error = str(exc)
+        if notification.attempts >= self.max_attempts:
+            notification.status = NotificationStatus.FAILED
+            return
+        delay = self.backoff_base * 2 ** (notification.attempts - 1)
+        notification.next_attempt_at = timezone.now() + timedelta(seconds=random.uniform(delay / 2, delay))
@@ -0,0 +1,16 @@
+import csv
+import io
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """Parse a CSV body with a header row into a list of dicts"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            text = stream.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ParseError('CSV must be UTF-8 encoded')
+        return list(csv.DictReader(io.StringIO(text)))
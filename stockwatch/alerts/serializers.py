@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Alert
+from .models import Alert, AlertType, NotificationPreference
 from stocks.serializers import StockSerializer
 
 class AlertSerializer(serializers.ModelSerializer):
@@ -14,4 +14,23 @@ class AlertSerializer(serializers.ModelSerializer):
             'threshold_value', 'is_active', 'is_triggered',
             'created_at', 'last_triggered_at'
         ]
-        read_only_fields = ['created_at', 'last_triggered_at', 'is_triggered']
\ No newline at end of file
+        read_only_fields = ['created_at', 'last_triggered_at', 'is_triggered']
+
+class NotificationPreferenceSerializer(serializers.ModelSerializer):
+    digest_window = serializers.IntegerField(min_value=0, max_value=24 * 60 * 60, allow_null=True, required=False)
+    max_emails_per_hour = serializers.IntegerField(min_value=1, allow_null=True, required=False)
+
+    class Meta:
+        model = NotificationPreference
+        fields = ['digest_window', 'max_emails_per_hour']
+
+
+class AlertImportRowSerializer(serializers.Serializer):
+    """One row of a bulk alert import"""
+    symbol = serializers.CharField(max_length=10)
+    alert_type = serializers.ChoiceField(choices=AlertType.choices)
+    threshold_value = serializers.DecimalField(max_digits=10, decimal_places=2)
+    is_active = serializers.BooleanField(default=True)
+
+    def validate_symbol(self, value):
+        return value.strip().upper()
@@ -1,47 +1,45 @@
+import zlib
 from datetime import datetime
 from decimal import Decimal
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .index import alert_change, get_alert_index, publish_index_changes
 from .models import Alert, AlertType
+from .notifications import queue_alert_notifications
+from .vectorized import AlertBatch
+from stocks.buffer import stock_write_buffer
+from stocks.models import Stock
+from stocks.ratelimit import Priority
 from stocks.services import StockService
+from stocks.utils import to_decimal
+
+def shard_for(symbol, shards):
+    """Return the shard a symbol belongs to, stable across worker processes"""
+    return zlib.crc32(symbol.upper().encode()) % shards
 
 class AlertService:
     """Service for checking and processing stock alerts"""
     
     def __init__(self):
-        self.stock_service = StockService()
+        self.stock_service = StockService(priority=Priority.ALERT)
     
-    def check_alert(self, alert):
-        """Check if an alert condition is met"""
+    def check_alert(self, alert, quote=None):
+        """Check if an alert condition is met, fetching a quote unless one is given"""
         if not alert.is_active or alert.is_triggered:
             return False
             
         # Get current stock data
-        quote = self.stock_service.get_stock_quote(alert.stock.symbol)
+        if quote is None:
+            quote = self.stock_service.get_stock_quote(alert.stock.symbol)
         if not quote:
             return False
             
-        # Check condition based on alert type
-        is_triggered = False
-        
-        if alert.alert_type == AlertType.PRICE_ABOVE:
-            is_triggered = quote['price'] > alert.threshold_value
-            
-        elif alert.alert_type == AlertType.PRICE_BELOW:
-            is_triggered = quote['price'] < alert.threshold_value
-            
-        elif alert.alert_type == AlertType.PERCENT_CHANGE:
-            is_triggered = abs(quote['change_percent']) >= alert.threshold_value
-            
-        elif alert.alert_type == AlertType.VOLUME_ABOVE:
-            is_triggered = quote['volume'] > int(alert.threshold_value)
+        is_triggered = self.condition_met(alert, quote)
             
         # Update stock data
         if is_triggered:
-            alert.stock.last_price = quote['price']
-            alert.stock.change_percent = quote['change_percent']
-            alert.stock.volume = quote['volume']
-            alert.stock.save()
+            stock_write_buffer.add(alert.stock, quote)
             
             alert.is_triggered = True
             alert.last_triggered_at = datetime.now()
@@ -49,61 +47,188 @@ class AlertService:
             
         return is_triggered
     
-    def send_alert_notification(self, alert):
-        """Send email notification for triggered alert"""
-        stock = alert.stock
-        user = alert.user
+    @staticmethod
+    def condition_met(alert, quote):
+        """Check an alert's condition against a quote"""
+        threshold_value = to_decimal(alert.threshold_value)
         
         if alert.alert_type == AlertType.PRICE_ABOVE:
-            subject = f"Price Alert: {stock.symbol} is above ${alert.threshold_value}"
-            message = f"Hi {user.username},\n\n"
-            message += f"Your price alert for {stock.name} ({stock.symbol}) has been triggered.\n"
-            message += f"Current price: ${stock.last_price} is above your target of ${alert.threshold_value}.\n\n"
-            message += f"Change: {stock.change_percent}%\n"
-            message += f"Volume: {stock.volume}\n\n"
-            message += "Best regards,\nStock Watchlist Alert System"
+            return quote['price'] > threshold_value
             
         elif alert.alert_type == AlertType.PRICE_BELOW:
-            subject = f"Price Alert: {stock.symbol} is below ${alert.threshold_value}"
-            message = f"Hi {user.username},\n\n"
-            message += f"Your price alert for {stock.name} ({stock.symbol}) has been triggered.\n"
-            message += f"Current price: ${stock.last_price} is below your target of ${alert.threshold_value}.\n\n"
-            message += f"Change: {stock.change_percent}%\n"
-            message += f"Volume: {stock.volume}\n\n"
-            message += "Best regards,\nStock Watchlist Alert System"
+            return quote['price'] < threshold_value
             
         elif alert.alert_type == AlertType.PERCENT_CHANGE:
-            subject = f"Change Alert: {stock.symbol} moved by {stock.change_percent}%"
-            message = f"Hi {user.username},\n\n"
-            message += f"Your percent change alert for {stock.name} ({stock.symbol}) has been triggered.\n"
-            message += f"Current change: {stock.change_percent}% has exceeded your threshold of {alert.threshold_value}%.\n\n"
-            message += f"Current price: ${stock.last_price}\n"
-            message += f"Volume: {stock.volume}\n\n"
-            message += "Best regards,\nStock Watchlist Alert System"
+            return abs(quote['change_percent']) >= threshold_value
             
         elif alert.alert_type == AlertType.VOLUME_ABOVE:
-            subject = f"Volume Alert: {stock.symbol} volume is above {alert.threshold_value}"
-            message = f"Hi {user.username},\n\n"
-            message += f"Your volume alert for {stock.name} ({stock.symbol}) has been triggered.\n"
-            message += f"Current volume: {stock.volume} has exceeded your threshold of {alert.threshold_value}.\n\n"
-            message += f"Current price: ${stock.last_price}\n"
-            message += f"Change: {stock.change_percent}%\n\n"
-            message += "Best regards,\nStock Watchlist Alert System"
+            return quote['volume'] > int(threshold_value)
+            
+        return False
+    
+    @staticmethod
+    def apply_quote(stock, quote):
+        """Copy a quote's price fields onto a stock without saving it"""
+        stock.last_price = quote['price']
+        stock.change_percent = quote['change_percent']
+        stock.volume = quote['volume']
+    
+    def send_alert_notification(self, alert):
+        """Queue an email notification for a triggered alert"""
+        self.queue_notifications([alert])
+        return True
+    
+    def create_alerts(self, alerts):
+        """Insert unsaved alerts with one bulk_create and index the armed ones"""
+        started = timezone.now()
+        alerts = Alert.objects.bulk_create(alerts)
+        if not all(alert.pk for alert in alerts):
+            self.reload_created(alerts, started)
         
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,
-            [user.email],
-            fail_silently=False,
-        )
+        # bulk_create skips signals, so publish the new alerts to the index here
+        changes = [alert_change(alert) for alert in alerts if alert.pk]
+        transaction.on_commit(lambda: publish_index_changes(changes))
+        return alerts
+    
+    @staticmethod
+    def reload_created(alerts, since):
+        """Set primary keys on just bulk-created alerts, which not every backend does.
         
-        return True
+        The inserted rows are read back and matched to the alerts on their
+        fields, in insertion order, so identical alerts get distinct keys.
+        """
+        places = Alert._meta.get_field('threshold_value').decimal_places
+        quantum = Decimal(1).scaleb(-places)
+        
+        def key(alert):
+            threshold = Decimal(str(to_decimal(alert.threshold_value))).quantize(quantum)
+            return alert.user_id, alert.stock_id, alert.alert_type, threshold, alert.is_active
+        
+        created = Alert.objects.filter(
+            user_id__in={alert.user_id for alert in alerts},
+            stock_id__in={alert.stock_id for alert in alerts},
+            created_at__gte=since
+        ).order_by('id')
+        ids = {}
+        for alert in created:
+            ids.setdefault(key(alert), []).append(alert.pk)
+        for alert in alerts:
+            matches = ids.get(key(alert))
+            if matches:
+                alert.pk = matches.pop(0)
+    
+    def queue_notifications(self, alerts):
+        """Add triggered alerts to the notification outbox.
+        
+        Emails are sent by the dispatcher task after the transaction commits,
+        so evaluation never waits on SMTP.
+        """
+        from .tasks import dispatch_alert_notifications
+        
+        if not alerts:
+            return []
+        notifications = queue_alert_notifications(alerts)
+        transaction.on_commit(dispatch_alert_notifications.delay)
+        return notifications
     
-    def process_alerts(self):
-        """Process all active alerts"""
-        active_alerts = Alert.objects.filter(is_active=True, is_triggered=False)
+    def process_symbol(self, symbol, quote):
+        """Evaluate only the alerts on one symbol that the quote crosses"""
+        alert_ids = get_alert_index().match(symbol, quote)
+        return self.trigger_alerts(alert_ids, {symbol.upper(): quote})
+    
+    def trigger_alerts(self, alert_ids, quotes):
+        """Trigger candidate alerts against shared per-symbol quotes.
+        
+        Alerts are loaded in batches with their stock and user, re-checked
+        against the quote for their symbol, and every stock and alert
+        change in a batch is written with one bulk_update each.
+        """
+        index = get_alert_index()
+        batch_size = settings.ALERT_BATCH_SIZE
+        alert_ids = list(alert_ids)
+        triggered = []
         
-        for alert in active_alerts:
-            if self.check_alert(alert):
-                self.send_alert_notification(alert)
\ No newline at end of file
+        for start in range(0, len(alert_ids), batch_size):
+            alerts = Alert.objects.filter(
+                id__in=alert_ids[start:start + batch_size],
+                is_active=True,
+                is_triggered=False
+            ).select_related('stock', 'user')
+            
+            now = timezone.now()
+            stocks = {}
+            fired = []
+            for alert in alerts:
+                quote = quotes.get(alert.stock.symbol.upper())
+                if not quote or not self.condition_met(alert, quote):
+                    continue
+                    
+                # Alerts on the same stock share one stock instance and one write
+                stock = stocks.setdefault(alert.stock_id, alert.stock)
+                alert.stock = stock
+                self.apply_quote(stock, quote)
+                stock.updated_at = now
+                
+                alert.is_triggered = True
+                alert.last_triggered_at = now
+                fired.append(alert)
+                
+            if not fired:
+                continue
+                
+            Stock.objects.bulk_update(stocks.values(), ['last_price', 'change_percent', 'volume', 'updated_at'])
+            Alert.objects.bulk_update(fired, ['is_triggered', 'last_triggered_at'])
+            
+            # bulk_update skips signals, so drop the fired alerts from the index here
+            for alert in fired:
+                index.remove(alert.id)
+            changes = [alert_change(alert) for alert in fired]
+            transaction.on_commit(lambda changes=changes: publish_index_changes(changes))
+            triggered.extend(fired)
+            
+        self.queue_notifications(triggered)
+        return len(triggered)
+    
+    @staticmethod
+    def shard_symbols(shards):
+        """Split the symbols with armed alerts into `shards` lists by symbol hash"""
+        symbols = set(
+            Alert.objects.filter(is_active=True, is_triggered=False).values_list('stock__symbol', flat=True)
+        )
+        by_shard = [[] for _ in range(shards)]
+        for symbol in sorted(symbols):
+            by_shard[shard_for(symbol, shards)].append(symbol)
+        return by_shard
+    
+    def process_alerts(self, symbols=None):
+        """Process active alerts with one quote per distinct symbol.
+        
+        The sweep reads armed alerts straight from the database rather than
+        this process's index, so it also catches alerts saved by other
+        processes since the index was built, and evaluates them all at once
+        with AlertBatch. A shard of a sweep passes its `symbols` (see
+        shard_symbols), so only its own alerts are loaded.
+        
+        Building the batch's columns costs more than it saves below about
+        ALERT_VECTORIZE_MIN_ALERTS alerts (the crossover measured with
+        benchmark_alert_eval), so smaller sweeps check alerts one by one.
+        """
+        if symbols is not None and not symbols:
+            return 0
+        rows = AlertBatch.armed_rows(symbols)
+            
+        quotes = self.stock_service.get_stock_quotes(
+            sorted({row.stock__symbol.upper() for row in rows}),
+            timeout=settings.ALERT_QUOTE_FETCH_TIMEOUT
+        )
+        quotes = {symbol: quote for symbol, quote in quotes.items() if quote}
+        
+        if len(rows) >= settings.ALERT_VECTORIZE_MIN_ALERTS:
+            return self.trigger_alerts(AlertBatch(rows).evaluate(quotes), quotes)
+            
+        fired = []
+        for row in rows:
+            quote = quotes.get(row.stock__symbol.upper())
+            if quote and self.condition_met(row, quote):
+                fired.append(row.id)
+        return self.trigger_alerts(fired, quotes)
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from stocks.signals import price_updated
+from .index import alert_change, get_alert_index, publish_index_changes
+from .models import Alert
+from .tasks import encode_quote, evaluate_symbol_alerts
+
+
+@receiver(post_save, sender=Alert)
+def alert_saved(sender, instance, **kwargs):
+    """Publish the saved alert to every process's index once it is committed"""
+    change = alert_change(instance)
+    transaction.on_commit(lambda: publish_index_changes([change]))
+
+
+@receiver(post_delete, sender=Alert)
+def alert_deleted(sender, instance, **kwargs):
+    change = alert_change(instance, armed=False)
+    transaction.on_commit(lambda: publish_index_changes([change]))
+
+
+@receiver(price_updated)
+def price_changed(sender, symbol, quote, **kwargs):
+    """Evaluate a symbol's alerts as soon as its price moves.
+
+    The local index acts as a cheap filter: a task is only queued when at
+    least one alert here would fire on the new quote. Alerts saved by other
+    processes reach it through the published change log.
+    """
+    if not get_alert_index().match(symbol, quote):
+        return
+    payload = encode_quote(quote)
+    transaction.on_commit(lambda: evaluate_symbol_alerts.delay(symbol, payload))
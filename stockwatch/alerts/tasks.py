@@ -1,8 +1,100 @@
-from celery import shared_task
+import logging
+import time
+from decimal import Decimal
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from .notifications import NotificationDispatcher
 from .services import AlertService
 
+logger = logging.getLogger(__name__)
+
+QUOTE_DECIMAL_FIELDS = ('price', 'change', 'change_percent')
+SWEEP_LOCK_KEY = 'alerts:sweep:lock'
+
+
+def encode_quote(quote):
+    """Make a quote JSON-safe for the task queue, keeping Decimals exact as strings"""
+    return {
+        key: str(value) if key in QUOTE_DECIMAL_FIELDS else value
+        for key, value in quote.items()
+    }
+
+
+def decode_quote(quote):
+    return {
+        key: Decimal(value) if key in QUOTE_DECIMAL_FIELDS else value
+        for key, value in quote.items()
+    }
+
 @shared_task
 def check_and_process_alerts():
-    """Task to check and process alerts - to be run periodically"""
+    """Task to check and process alerts - a low-frequency safety net for missed price updates.
+
+    The sweep is split into ALERT_SWEEP_SHARDS tasks by symbol hash and run
+    as a chord, so every worker takes a share. The symbols are split once
+    here and each shard only loads the alerts on its own symbols. The lock is held until the
+    summary callback runs, which keeps a slow sweep from overlapping the next.
+    """
+    if not cache.add(SWEEP_LOCK_KEY, time.time(), settings.ALERT_SWEEP_LOCK_TIMEOUT):
+        logger.info("Skipping alert sweep, the previous one is still running")
+        return None
+
+    shards = settings.ALERT_SWEEP_SHARDS
+    if shards <= 1:
+        try:
+            alert_service = AlertService()
+            return alert_service.process_alerts()
+        finally:
+            cache.delete(SWEEP_LOCK_KEY)
+
+    try:
+        result = chord(
+            process_alert_shard.s(shard, symbols)
+            for shard, symbols in enumerate(AlertService.shard_symbols(shards))
+        )(summarize_alert_sweep.s(time.time()).on_error(release_alert_sweep_lock.si()))
+    except Exception:
+        cache.delete(SWEEP_LOCK_KEY)
+        raise
+    return result.id
+
+@shared_task
+def process_alert_shard(shard, symbols):
+    """Task to process the alerts on the symbols in one shard of a sweep"""
+    started = time.monotonic()
+    alert_service = AlertService()
+    triggered = alert_service.process_alerts(symbols)
+    return {'shard': shard, 'triggered': triggered, 'seconds': round(time.monotonic() - started, 3)}
+
+@shared_task
+def release_alert_sweep_lock():
+    """Chord error callback so a failed shard does not hold the lock until it expires"""
+    cache.delete(SWEEP_LOCK_KEY)
+
+@shared_task
+def summarize_alert_sweep(results, started):
+    """Chord callback that reports a sharded sweep and releases its lock"""
+    cache.delete(SWEEP_LOCK_KEY)
+    summary = {
+        'shards': len(results),
+        'triggered': sum(result['triggered'] for result in results),
+        'slowest_shard_seconds': max((result['seconds'] for result in results), default=0.0),
+        'seconds': round(time.time() - started, 3),
+    }
+    logger.info(
+        "Alert sweep triggered %d alerts across %d shards in %.3fs (slowest shard %.3fs)",
+        summary['triggered'], summary['shards'], summary['seconds'], summary['slowest_shard_seconds']
+    )
+    return summary
+
+@shared_task
+def evaluate_symbol_alerts(symbol, quote):
+    """Task to evaluate one symbol's alerts after its price changed"""
     alert_service = AlertService()
-    alert_service.process_alerts()
\ No newline at end of file
+    return alert_service.process_symbol(symbol, decode_quote(quote))
+
+@shared_task
+def dispatch_alert_notifications():
+    """Task to send queued alert emails in batches"""
+    dispatcher = NotificationDispatcher()
+    return dispatcher.dispatch()
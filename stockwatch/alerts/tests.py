@@ -1,9 +1,25 @@
+import time
+import numpy as np
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from django.core import mail
+from django.core.cache import cache
+from unittest import mock
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
-from alerts.models import Alert, AlertType
+from alerts.index import CHANGE_KEY_PREFIX, AlertIndex, alert_index, get_alert_index
+from alerts.models import Alert, AlertNotification, AlertType, NotificationPreference, NotificationStatus
+from alerts.notifications import NotificationDispatcher
 from alerts.serializers import AlertSerializer
-from stocks.models import Stock
+from stocks.buffer import stock_write_buffer
+from stocks.indicators import bars_to_arrays
+from stocks.models import IntradayBar, Stock
+from alerts.services import AlertService, shard_for
+from alerts.backtest import replay, to_daily
+from alerts.vectorized import AlertBatch
+from alerts.tasks import SWEEP_LOCK_KEY, check_and_process_alerts, evaluate_symbol_alerts
 from stocks.services import StockService
 
 class AlertViewSetTestCase(APITestCase):
@@ -82,3 +98,536 @@ class AlertViewSetTestCase(APITestCase):
         response = self.client.post(f'/api/alerts/{self.alert.id}/reset/')
         self.assertResponse(response, status.HTTP_200_OK)
         self.assertEqual(response.data['message'], 'Alert has not been triggered yet')
+
+    def test_notification_settings(self):
+        """Test reading and updating the user's digest window and email cap"""
+        response = self.client.get('/api/alerts/notification_settings/')
+        self.assertResponse(response, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'digest_window': None, 'max_emails_per_hour': None})
+
+        response = self.client.put('/api/alerts/notification_settings/', {'digest_window': 300}, format='json')
+        self.assertResponse(response, status.HTTP_200_OK)
+        self.assertEqual(self.user.notification_preference.digest_window, 300)
+
+        response = self.client.put('/api/alerts/notification_settings/', {'max_emails_per_hour': -1}, format='json')
+        self.assertResponse(response, status.HTTP_400_BAD_REQUEST)
+
+
+class AlertIndexTestCase(TestCase):
+    """Test cases for the in-memory alert index"""
+
+    def setUp(self):
+        self.index = AlertIndex()
+        self.index.rebuild([
+            (1, 'aapl', AlertType.PRICE_ABOVE, Decimal('100.00')),
+            (2, 'AAPL', AlertType.PRICE_ABOVE, Decimal('150.00')),
+            (3, 'AAPL', AlertType.PRICE_BELOW, Decimal('140.00')),
+            (4, 'AAPL', AlertType.PRICE_BELOW, Decimal('160.00')),
+            (5, 'AAPL', AlertType.PERCENT_CHANGE, Decimal('2.00')),
+            (6, 'AAPL', AlertType.VOLUME_ABOVE, Decimal('5000.00')),
+            (7, 'TSLA', AlertType.PRICE_ABOVE, Decimal('1.00')),
+        ])
+        self.quote = {'price': Decimal('150.00'), 'change_percent': Decimal('-2.00'), 'volume': 5000}
+
+    def test_match(self):
+        """Test matches follow check_alert semantics, including boundaries"""
+        self.assertEqual(sorted(self.index.match('AAPL', self.quote)), [1, 4, 5])
+        self.quote['volume'] = 5001
+        self.assertIn(6, self.index.match('aapl', self.quote))
+
+    def test_add_and_remove(self):
+        """Test incremental updates move and drop alerts"""
+        self.index.add(2, 'AAPL', AlertType.PRICE_ABOVE, Decimal('120.00'))
+        self.assertIn(2, self.index.match('AAPL', self.quote))
+        self.index.remove(1)
+        self.index.remove(7)
+        self.assertNotIn(1, self.index.match('AAPL', self.quote))
+        self.assertEqual(sorted(self.index.symbols()), ['AAPL'])
+
+
+class AlertImportTestCase(APITestCase):
+    """Test cases for bulk alert imports"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.stock = Stock.objects.create(
+            symbol='AAPL', name='Apple Inc.', last_price=Decimal('150.00'),
+            change_percent=Decimal('0.50'), volume=1000
+        )
+
+    def resolve_symbol(self, _, symbol):
+        if symbol != 'MSFT':
+            return None
+        return Stock(symbol='MSFT', name='Microsoft Corp.', last_price=Decimal('410.00'),
+                     change_percent=Decimal('1.00'), volume=500)
+
+    def test_json_import(self):
+        """Test rows are validated up front and each new symbol is resolved once"""
+        rows = [
+            {'symbol': 'aapl', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '160.00'},
+            {'symbol': 'MSFT', 'alert_type': AlertType.PRICE_BELOW, 'threshold_value': '400'},
+            {'symbol': 'MSFT', 'alert_type': AlertType.VOLUME_ABOVE, 'threshold_value': '1000000'},
+            {'symbol': 'AAPL', 'alert_type': 'NOPE', 'threshold_value': '1'},
+            {'symbol': 'ZZZZ', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '1'},
+        ]
+        with mock.patch.object(StockService, 'resolve_symbol', autospec=True,
+                               side_effect=self.resolve_symbol) as resolve:
+            response = self.client.post('/api/alerts/bulk_import/', rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 2))
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['created', 'created', 'created', 'error', 'error'])
+        self.assertIn('alert_type', response.data['results'][3]['errors'])
+        self.assertEqual(sorted(call.args[1] for call in resolve.call_args_list), ['MSFT', 'ZZZZ'])
+        self.assertEqual(Stock.objects.filter(symbol='MSFT').count(), 1)
+        self.assertEqual(Alert.objects.filter(user=self.user, stock__symbol='MSFT').count(), 2)
+
+    def test_import_matches_stored_symbols_in_any_case(self):
+        """Test a symbol stored in lower case is reused instead of created again"""
+        Stock.objects.create(
+            symbol='msft', name='Microsoft Corp.', last_price=Decimal('410.00'),
+            change_percent=Decimal('1.00'), volume=500
+        )
+        rows = [{'symbol': 'MSFT', 'alert_type': AlertType.PRICE_BELOW, 'threshold_value': '400'}]
+        with mock.patch.object(StockService, 'resolve_symbol', autospec=True) as resolve:
+            response = self.client.post('/api/alerts/bulk_import/', rows, format='json')
+        self.assertEqual(response.data['created'], 1)
+        resolve.assert_not_called()
+        self.assertEqual(Stock.objects.filter(symbol__iexact='MSFT').count(), 1)
+
+    def test_csv_import(self):
+        """Test a CSV body is imported like a JSON array"""
+        body = 'symbol,alert_type,threshold_value\nAAPL,PERCENT_CHANGE,5\nAAPL,PRICE_BELOW,abc\n'
+        response = self.client.post('/api/alerts/bulk_import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['results'][0]['status'], 'created')
+        self.assertIn('threshold_value', response.data['results'][1]['errors'])
+        self.assertTrue(Alert.objects.filter(id=response.data['results'][0]['id']).exists())
+
+    def test_import_without_returned_keys(self):
+        """Test alerts get their ids on backends whose bulk_create does not set them"""
+        bulk_create = Alert.objects.bulk_create
+
+        def without_keys(alerts, *args, **kwargs):
+            alerts = bulk_create(alerts, *args, **kwargs)
+            for alert in alerts:
+                alert.pk = None
+            return alerts
+
+        rows = [
+            {'symbol': 'AAPL', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '160'},
+            {'symbol': 'AAPL', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '160.00'},
+            {'symbol': 'AAPL', 'alert_type': AlertType.PRICE_BELOW, 'threshold_value': '140.5'},
+        ]
+        with mock.patch.object(Alert.objects, 'bulk_create', side_effect=without_keys):
+            response = self.client.post('/api/alerts/bulk_import/', rows, format='json')
+        ids = [result['id'] for result in response.data['results']]
+        self.assertEqual(sorted(ids), sorted(Alert.objects.filter(user=self.user).values_list('id', flat=True)))
+        self.assertEqual(Alert.objects.get(id=ids[2]).alert_type, AlertType.PRICE_BELOW)
+
+    def test_empty_import(self):
+        """Test an empty or malformed payload is rejected"""
+        response = self.client.post('/api/alerts/bulk_import/', {'alerts': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AlertBatchTestCase(TestCase):
+    """Test cases for vectorized alert evaluation"""
+
+    def setUp(self):
+        self.quotes = {
+            'AAPL': {'price': Decimal('165.00'), 'change_percent': Decimal('-3.50'), 'volume': 5000},
+            'MSFT': {'price': Decimal('410.25'), 'change_percent': Decimal('0.75'), 'volume': 100},
+        }
+        self.rows = [
+            (1, 'AAPL', AlertType.PRICE_ABOVE, Decimal('160.00')),
+            (2, 'AAPL', AlertType.PRICE_ABOVE, Decimal('165.00')),
+            (3, 'aapl', AlertType.PRICE_BELOW, Decimal('165.01')),
+            (4, 'AAPL', AlertType.PERCENT_CHANGE, Decimal('3.50')),
+            (5, 'AAPL', AlertType.VOLUME_ABOVE, Decimal('4999.99')),
+            (6, 'MSFT', AlertType.PERCENT_CHANGE, Decimal('1.00')),
+            (7, 'MSFT', AlertType.VOLUME_ABOVE, Decimal('100.00')),
+            (8, 'TSLA', AlertType.PRICE_ABOVE, Decimal('1.00')),
+        ]
+
+    def test_matches_condition_met(self):
+        """Test the batch fires exactly the alerts check_alert would"""
+        expected = [
+            alert_id for alert_id, symbol, alert_type, threshold in self.rows
+            if symbol.upper() in self.quotes and AlertService.condition_met(
+                Alert(alert_type=alert_type, threshold_value=threshold), self.quotes[symbol.upper()]
+            )
+        ]
+        self.assertEqual(expected, [1, 3, 4, 5])
+        self.assertEqual(sorted(AlertBatch(self.rows).evaluate(self.quotes)), expected)
+
+    def test_subset_and_empty(self):
+        """Test selecting a subset of symbols and evaluating no alerts"""
+        batch = AlertBatch(self.rows).subset([symbol != 'AAPL' for symbol in ['AAPL', 'MSFT', 'TSLA']])
+        self.assertEqual(batch.symbols, ['MSFT', 'TSLA'])
+        self.assertEqual(batch.evaluate({'TSLA': {'price': 2, 'change_percent': 0, 'volume': 0}}), [8])
+        self.assertEqual(AlertBatch([]).evaluate(self.quotes), [])
+
+    def test_decimal128_thresholds(self):
+        """Test thresholds read back from MongoDB as Decimal128 evaluate the same"""
+        rows = [row[:3] + (Decimal128(row[3]),) for row in self.rows]
+        self.assertEqual(sorted(AlertBatch(rows).evaluate(self.quotes)), [1, 3, 4, 5])
+
+
+class AlertBacktestTestCase(APITestCase):
+    """Test cases for replaying alerts over stored bars"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_authenticate(user=self.user)
+        # Two days of 5 minute bars: day one closes at 100, day two climbs to 104
+        closes = [99.0, 100.0, 101.0, 103.0, 102.0, 104.0]
+        timestamps = ['2025-04-01 15:50:00', '2025-04-01 15:55:00', '2025-04-02 09:35:00',
+                      '2025-04-02 09:40:00', '2025-04-02 09:45:00', '2025-04-02 09:50:00']
+        self.rows = [(timestamp, close, close, close, close, 1000) for timestamp, close in zip(timestamps, closes)]
+        for symbol in ('AAPL', 'MSFT', 'SPY'):
+            Stock.objects.create(symbol=symbol, name=symbol, last_price=Decimal('100.00'),
+                                 change_percent=Decimal('0.00'), volume=1000)
+        IntradayBar.objects.bulk_create(
+            IntradayBar(symbol='AAPL', interval='5min', timestamp=timestamp, open=open_, high=high,
+                        low=low, close=close, volume=volume)
+            for timestamp, open_, high, low, close, volume in self.rows
+        )
+
+    def test_replay(self):
+        """Test triggers are counted on each crossing with check_alert semantics"""
+        arrays = bars_to_arrays(self.rows)
+        result = replay(arrays, AlertType.PRICE_ABOVE, Decimal('102.00'))
+        self.assertEqual((result['bars_met'], result['trigger_count']), (2, 2))
+        self.assertEqual(result['triggers'], ['2025-04-02 09:40:00', '2025-04-02 09:50:00'])
+
+        # Change is measured from the previous day's close of 100, day one has none
+        result = replay(arrays, AlertType.PERCENT_CHANGE, Decimal('3.00'))
+        self.assertEqual(result['triggers'], ['2025-04-02 09:40:00', '2025-04-02 09:50:00'])
+
+        # Volume is the day's running total
+        result = replay(arrays, AlertType.VOLUME_ABOVE, Decimal('2000'))
+        self.assertEqual(result['triggers'], ['2025-04-02 09:45:00'])
+
+        daily = to_daily(arrays)
+        self.assertEqual(daily['timestamp'].tolist(), ['2025-04-01', '2025-04-02'])
+        self.assertEqual(replay(daily, AlertType.PRICE_BELOW, Decimal('101.00'))['triggers'], ['2025-04-01'])
+
+    def test_replay_year_of_bars(self):
+        """Test a year of stored 5 minute bars loads inside 500ms and replays well inside 100ms"""
+        days = np.repeat(np.arange('2024-01-01', '2025-01-01', dtype='datetime64[D]'), 78)
+        minutes = np.tile(np.arange(78) * np.timedelta64(5, 'm'), len(days) // 78)
+        timestamps = np.datetime_as_string(days + np.timedelta64(570, 'm') + minutes, unit='s')
+        close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, len(days)))
+        IntradayBar.objects.bulk_create(
+            (IntradayBar(symbol='SPY', interval='5min', timestamp=timestamp.replace('T', ' '), open=price,
+                         high=price, low=price, close=price, volume=1000)
+             for timestamp, price in zip(timestamps.tolist(), close.tolist())),
+            batch_size=1000
+        )
+
+        with mock.patch.object(StockService, 'fetch_intraday_data', return_value=[]):
+            # The first request loads the store, later ones reuse its arrays until bars change
+            started = time.perf_counter()
+            response = self.client.post('/api/alerts/backtest/', {
+                'symbol': 'SPY', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '101.00'
+            }, format='json')
+            self.assertEqual(response.data['bars'], len(days))
+            self.assertLess(time.perf_counter() - started, 0.5)
+            started = time.perf_counter()
+            for alert_type in AlertType.values:
+                response = self.client.post('/api/alerts/backtest/', {
+                    'symbol': 'SPY', 'alert_type': alert_type, 'threshold_value': '101.00'
+                }, format='json')
+                self.assertEqual(response.data['bars'], len(days))
+            self.assertLess((time.perf_counter() - started) / len(AlertType.values), 0.1)
+
+    def test_backtest_endpoint(self):
+        """Test the endpoint validates input and replays stored bars"""
+        with mock.patch.object(StockService, 'fetch_intraday_data', return_value=[]):
+            response = self.client.post('/api/alerts/backtest/', {
+                'symbol': 'aapl', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '102.00'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['trigger_count'], 2)
+            self.assertEqual(response.data['bars'], 6)
+
+            response = self.client.post('/api/alerts/backtest/', {
+                'symbol': 'AAPL', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': 'abc'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+            response = self.client.post('/api/alerts/backtest/', {
+                'symbol': 'MSFT', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '1', 'interval': 'daily'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_untracked_symbol_is_not_fetched(self):
+        """Test symbols without a stored stock are rejected before any upstream call"""
+        with mock.patch.object(StockService, 'fetch_intraday_data', return_value=[]) as fetch:
+            response = self.client.post('/api/alerts/backtest/', {
+                'symbol': 'ZZZZ', 'alert_type': AlertType.PRICE_ABOVE, 'threshold_value': '1'
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        fetch.assert_not_called()
+
+
+class AlertProcessingTestCase(TestCase):
+    """Test cases for index-driven alert processing"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password', email='test@example.com')
+        self.stock = Stock.objects.create(
+            symbol='AAPL', name='Apple Inc.', last_price=Decimal('150.00'),
+            change_percent=Decimal('0.50'), volume=1000
+        )
+        self.above = Alert.objects.create(
+            user=self.user, stock=self.stock, alert_type=AlertType.PRICE_ABOVE, threshold_value=Decimal('160.00')
+        )
+        alert_index.built_at = None
+        get_alert_index()
+        self.addCleanup(setattr, alert_index, 'built_at', None)
+        self.quote = {'symbol': 'AAPL', 'price': Decimal('165.00'), 'change': Decimal('15.00'),
+                      'change_percent': Decimal('10.00'), 'volume': 2000, 'latest_trading_day': '2025-04-01'}
+
+    def test_signals_keep_index_current(self):
+        """Test saved and deleted alerts update the index without a rebuild"""
+        rebuild = mock.patch.object(alert_index, 'rebuild', wraps=alert_index.rebuild)
+        with rebuild as rebuilt, self.captureOnCommitCallbacks(execute=True):
+            below = Alert.objects.create(
+                user=self.user, stock=self.stock, alert_type=AlertType.PRICE_BELOW, threshold_value=Decimal('170.00')
+            )
+        self.assertEqual(sorted(get_alert_index().match('AAPL', self.quote)), [self.above.id, below.id])
+        with rebuild as rebuilt, self.captureOnCommitCallbacks(execute=True):
+            below.is_active = False
+            below.save()
+            self.above.delete()
+        self.assertEqual(get_alert_index().match('AAPL', self.quote), [])
+        rebuilt.assert_not_called()
+
+    def test_alerts_saved_elsewhere_reach_the_index(self):
+        """Test changes published by another process are applied from the log, gaps reload"""
+        with self.captureOnCommitCallbacks(execute=True):
+            below = Alert.objects.create(
+                user=self.user, stock=self.stock, alert_type=AlertType.PRICE_BELOW, threshold_value=Decimal('170.00')
+            )
+        # As if the save happened in another process, whose changes never reached this index
+        alert_index.remove(below.id)
+        alert_index.version -= 1
+        with mock.patch.object(alert_index, 'rebuild') as rebuild:
+            self.assertIn(below.id, get_alert_index().match('AAPL', self.quote))
+        rebuild.assert_not_called()
+
+        alert_index.version -= 1
+        cache.delete(f"{CHANGE_KEY_PREFIX}:{alert_index.version + 1}")
+        with mock.patch.object(alert_index, 'rebuild', wraps=alert_index.rebuild) as rebuild:
+            get_alert_index()
+        rebuild.assert_called_once()
+
+    def test_process_symbol(self):
+        """Test only crossed alerts are triggered and leave the index"""
+        self.assertEqual(AlertService().process_symbol('AAPL', self.quote), 1)
+        self.assertEqual(AlertNotification.objects.get().alert_id, self.above.id)
+        self.above.refresh_from_db()
+        self.assertTrue(self.above.is_triggered)
+        self.assertEqual(alert_index.match('AAPL', self.quote), [])
+
+    def test_process_alerts_one_quote_per_symbol(self):
+        """Test many alerts on one symbol share one quote and bulk writes"""
+        cache.clear()
+        for threshold in ('100.00', '110.00', '120.00'):
+            Alert.objects.create(
+                user=self.user, stock=self.stock, alert_type=AlertType.PRICE_ABOVE,
+                threshold_value=Decimal(threshold)
+            )
+        with mock.patch.object(StockService, 'fetch_stock_quote', return_value=self.quote) as fetch:
+            service = AlertService()
+            # One select each for the armed alerts and the fired ones, one bulk_update
+            # each for stocks and alerts, one lookup of notification preferences
+            # and one bulk_create for the outbox
+            with self.assertNumQueries(6):
+                self.assertEqual(service.process_alerts(), 4)
+        fetch.assert_called_once_with('AAPL')
+        self.assertEqual(AlertNotification.objects.count(), 4)
+        self.assertEqual(Alert.objects.filter(is_triggered=True).count(), 4)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.last_price, Decimal('165.00'))
+
+    def test_process_alerts_vectorized(self):
+        """Test sweeps above the crossover fire the same alerts through AlertBatch"""
+        cache.clear()
+        Alert.objects.create(
+            user=self.user, stock=self.stock, alert_type=AlertType.PRICE_ABOVE, threshold_value=Decimal('170.00')
+        )
+        with mock.patch.object(StockService, 'fetch_stock_quote', return_value=self.quote), \
+                mock.patch.object(AlertBatch, 'evaluate', autospec=True, side_effect=AlertBatch.evaluate) as evaluate, \
+                self.settings(ALERT_VECTORIZE_MIN_ALERTS=0):
+            self.assertEqual(AlertService().process_alerts(), 1)
+        evaluate.assert_called_once()
+        self.assertEqual(list(AlertNotification.objects.values_list('alert_id', flat=True)), [self.above.id])
+
+    def test_shards_split_symbols(self):
+        """Test each symbol is processed by exactly one shard"""
+        symbols = ['MSFT', 'GOOG', 'AMZN', 'TSLA', 'NVDA']
+        for symbol in symbols:
+            stock = Stock.objects.create(
+                symbol=symbol, name=symbol, last_price=Decimal('1.00'), change_percent=Decimal('0.00'), volume=0
+            )
+            Alert.objects.create(
+                user=self.user, stock=stock, alert_type=AlertType.PRICE_ABOVE, threshold_value=Decimal('10.00')
+            )
+        by_shard = AlertService.shard_symbols(3)
+        for shard, shard_symbols in enumerate(by_shard):
+            self.assertTrue(all(shard_for(symbol, 3) == shard for symbol in shard_symbols))
+
+        requested = []
+        with mock.patch.object(StockService, 'get_stock_quotes',
+                               lambda _, symbols, timeout=None: requested.append(symbols) or {}):
+            for shard_symbols in by_shard:
+                AlertService().process_alerts(shard_symbols)
+        self.assertEqual(sorted(sum(requested, [])), sorted(symbols + ['AAPL']))
+        self.assertEqual(requested, [shard_symbols for shard_symbols in by_shard if shard_symbols])
+        # A shard only loads the alerts on its own symbols
+        self.assertEqual(AlertBatch.armed(['MSFT', 'TSLA']).symbols, ['MSFT', 'TSLA'])
+
+    @override_settings(ALERT_SWEEP_SHARDS=3)
+    def test_sharded_sweep(self):
+        """Test the sweep fans out to shards, summarizes them and releases its lock"""
+        cache.clear()
+
+        def run_chord(header):
+            header = list(header)
+            self.assertEqual(len(header), 3)
+            return lambda body: body.apply(([task.apply().get() for task in header],))
+
+        with mock.patch.object(StockService, 'fetch_stock_quote', return_value=self.quote), \
+                mock.patch('alerts.tasks.chord', run_chord):
+            check_and_process_alerts()
+        self.above.refresh_from_db()
+        self.assertTrue(self.above.is_triggered)
+        self.assertIsNone(cache.get(SWEEP_LOCK_KEY))
+
+    def test_sweep_skipped_while_locked(self):
+        """Test a sweep does not start while the previous one holds the lock"""
+        cache.add(SWEEP_LOCK_KEY, 1)
+        self.addCleanup(cache.delete, SWEEP_LOCK_KEY)
+        with mock.patch.object(AlertService, 'process_alerts') as process_alerts:
+            self.assertIsNone(check_and_process_alerts())
+        process_alerts.assert_not_called()
+
+    def test_price_update_queues_symbol_evaluation(self):
+        """Test a price change queues evaluation of only that symbol's alerts"""
+        cache.clear()
+        self.addCleanup(stock_write_buffer.flush)
+        with mock.patch.object(StockService, 'fetch_stock_quote', return_value=self.quote), \
+                mock.patch.object(evaluate_symbol_alerts, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            StockService().update_stock_data(self.stock)
+        delay.assert_called_once()
+        symbol, payload = delay.call_args.args
+        self.assertEqual((symbol, payload['price']), ('AAPL', '165.00'))
+
+        self.assertEqual(evaluate_symbol_alerts(symbol, payload), 1)
+        self.above.refresh_from_db()
+        self.assertTrue(self.above.is_triggered)
+
+    def test_unchanged_or_uncrossed_price_queues_nothing(self):
+        """Test quotes that cross no alert do not queue work"""
+        cache.clear()
+        self.addCleanup(stock_write_buffer.flush)
+        self.quote['price'] = Decimal('155.00')
+        with mock.patch.object(StockService, 'fetch_stock_quote', return_value=self.quote), \
+                mock.patch.object(evaluate_symbol_alerts, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            StockService().update_stock_data(self.stock)
+        delay.assert_not_called()
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ALERT_DIGEST_WINDOW=0)
+class NotificationDispatcherTestCase(TestCase):
+    """Test cases for the alert notification outbox dispatcher"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password', email='test@example.com')
+        self.stock = Stock.objects.create(
+            symbol='AAPL', name='Apple Inc.', last_price=Decimal('165.00'),
+            change_percent=Decimal('10.00'), volume=2000
+        )
+        self.alert = Alert.objects.create(
+            user=self.user, stock=self.stock, alert_type=AlertType.PRICE_ABOVE,
+            threshold_value=Decimal('160.00'), is_triggered=True
+        )
+        other = User.objects.create_user(username='otheruser', password='password', email='other@example.com')
+        self.other_alert = Alert.objects.create(
+            user=other, stock=self.stock, alert_type=AlertType.PRICE_BELOW,
+            threshold_value=Decimal('170.00'), is_triggered=True
+        )
+
+    def test_queue_and_dispatch(self):
+        """Test a single notification is sent on its own over one connection"""
+        AlertService().queue_notifications([self.alert, self.other_alert])
+        with mock.patch('alerts.notifications.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(NotificationDispatcher().dispatch(), 2)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 2)
+        email = next(email for email in mail.outbox if email.to == ['test@example.com'])
+        self.assertEqual(email.subject, 'Price Alert: AAPL is above $160.00')
+        self.assertIn('Current price: $165.00 is above your target of $160.00.', email.body)
+        self.assertTrue(email.body.startswith('Hi testuser,'))
+        self.assertEqual(AlertNotification.objects.filter(status=NotificationStatus.SENT).count(), 2)
+
+    def test_notifications_are_coalesced_per_user(self):
+        """Test alerts firing together for one user go out as one digest"""
+        AlertService().queue_notifications([self.alert, self.alert, self.alert])
+        self.assertEqual(NotificationDispatcher().dispatch(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Stock Alerts: 3 alerts triggered')
+        self.assertEqual(mail.outbox[0].body.count('Price Alert: AAPL is above $160.00'), 3)
+        self.assertEqual(AlertNotification.objects.filter(status=NotificationStatus.SENT).count(), 3)
+
+    def test_digest_window_holds_notifications(self):
+        """Test notifications wait out the user's digest window"""
+        NotificationPreference.objects.create(user=self.user, digest_window=300)
+        AlertService().queue_notifications([self.alert, self.other_alert])
+        self.assertEqual(NotificationDispatcher().dispatch(), 1)
+        self.assertEqual(mail.outbox[0].to, ['other@example.com'])
+        self.assertEqual(AlertNotification.objects.filter(status=NotificationStatus.PENDING).count(), 1)
+
+    @override_settings(ALERT_MAX_EMAILS_PER_HOUR=1)
+    def test_hourly_cap_defers_notifications(self):
+        """Test users over their hourly cap are pushed to the next hour"""
+        AlertService().queue_notifications([self.alert])
+        self.assertEqual(NotificationDispatcher().dispatch(), 1)
+
+        notification, = AlertService().queue_notifications([self.alert])
+        self.assertEqual(NotificationDispatcher().dispatch(), 0)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, NotificationStatus.PENDING)
+        self.assertEqual((notification.next_attempt_at.minute, notification.next_attempt_at.second), (0, 0))
+        self.assertGreater(notification.next_attempt_at, notification.created_at)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failures_are_retried_with_backoff(self):
+        """Test one failing email is rescheduled without blocking the others"""
+        first, second = AlertService().queue_notifications([self.alert, self.other_alert])
+        original = NotificationDispatcher.build_message
+
+        def build_message(dispatcher, user, rows, connection):
+            if user == self.user:
+                raise ConnectionError('SMTP unavailable')
+            return original(dispatcher, user, rows, connection)
+
+        with mock.patch.object(NotificationDispatcher, 'build_message', build_message):
+            self.assertEqual(NotificationDispatcher(max_attempts=2).dispatch(), 1)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (NotificationStatus.PENDING, 1))
+        self.assertGreater(first.next_attempt_at, second.created_at)
+        self.assertEqual(len(mail.outbox), 1)
+
+        AlertNotification.objects.filter(id=first.id).update(next_attempt_at=first.created_at)
+        with mock.patch.object(NotificationDispatcher, 'build_message', build_message):
+            NotificationDispatcher(max_attempts=2).dispatch()
+        first.refresh_from_db()
+        self.assertEqual(first.status, NotificationStatus.FAILED)
@@ -0,0 +1,122 @@
+from itertools import chain, repeat
+from operator import itemgetter
+import numpy as np
+from bson.decimal128 import Decimal128
+from stocks.utils import to_decimal
+from .models import Alert, AlertType
+
+# Small integer codes for alert types so the type column is an int8 array
+TYPE_CODES = {alert_type: code for code, alert_type in enumerate(AlertType.values)}
+
+QUOTE_FIELDS = itemgetter('price', 'change_percent', 'volume')
+UNQUOTED = {'price': np.nan, 'change_percent': np.nan, 'volume': np.nan}
+
+
+def condition_mask(alert_type, threshold, price, change_percent, volume):
+    """Vectorized AlertService.condition_met for one alert type.
+
+    `threshold` and the quote fields may be scalars or arrays of the same
+    shape; NaN quote fields never meet a condition.
+    """
+    if alert_type == AlertType.PRICE_ABOVE:
+        return price > threshold
+    if alert_type == AlertType.PRICE_BELOW:
+        return price < threshold
+    if alert_type == AlertType.PERCENT_CHANGE:
+        return np.abs(change_percent) >= threshold
+    if alert_type == AlertType.VOLUME_ABOVE:
+        return volume > np.trunc(threshold)
+    return np.zeros(np.shape(price), dtype=bool)
+
+
+class AlertBatch:
+    """Armed alerts held as parallel NumPy columns for batch evaluation.
+
+    Every alert type is evaluated in a few vector ops: quote fields are
+    gathered per alert through the symbol codes, and one condition_mask per
+    type is OR-ed together. Prices and thresholds have at most four decimal
+    places, well inside float64 precision, so the comparisons give the same
+    answers as AlertService.condition_met on Decimals.
+    """
+
+    def __init__(self, rows):
+        """Build from (id, symbol, alert_type, threshold) rows.
+
+        Columns are read with C-level map/fromiter passes, and the only
+        per-symbol Python work (upper-casing, sorting) is done once per
+        distinct symbol rather than once per alert.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        count = len(rows)
+        self.ids = np.fromiter(map(itemgetter(0), rows), dtype=np.int64, count=count)
+
+        symbols = list(map(itemgetter(1), rows))
+        names = {symbol: symbol.upper() for symbol in dict.fromkeys(symbols)}
+        self.symbols = sorted(set(names.values()))
+        positions = {name: code for code, name in enumerate(self.symbols)}
+        codes = {symbol: positions[name] for symbol, name in names.items()}
+        self.symbol_codes = np.fromiter(map(codes.__getitem__, symbols), dtype=np.intp, count=count)
+
+        self.types = np.fromiter(map(TYPE_CODES.__getitem__, map(itemgetter(2), rows)), dtype=np.int8, count=count)
+
+        thresholds = map(itemgetter(3), rows)
+        if count and isinstance(rows[0][3], Decimal128):
+            # MongoDB hands Decimals back as Decimal128, which has no float()
+            thresholds = map(to_decimal, thresholds)
+        self.thresholds = np.fromiter(map(float, thresholds), dtype=float, count=count)
+
+    @staticmethod
+    def armed_rows(symbols=None):
+        """Return (id, stock__symbol, alert_type, threshold_value) named rows of active, untriggered alerts"""
+        alerts = Alert.objects.filter(is_active=True, is_triggered=False)
+        if symbols is not None:
+            alerts = alerts.filter(stock__symbol__in=symbols)
+        return list(alerts.values_list('id', 'stock__symbol', 'alert_type', 'threshold_value', named=True).iterator())
+
+    @classmethod
+    def armed(cls, symbols=None):
+        """Load active, untriggered alerts from the database, only on `symbols` if given"""
+        return cls(cls.armed_rows(symbols))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subset(self, mask_by_symbol):
+        """Return the alerts on the symbols selected by a boolean mask over self.symbols"""
+        batch = object.__new__(AlertBatch)
+        keep = np.asarray(mask_by_symbol, dtype=bool)
+        alert_mask = keep[self.symbol_codes] if len(self) else np.zeros(0, dtype=bool)
+        remap = np.cumsum(keep) - 1
+        batch.ids = self.ids[alert_mask]
+        batch.symbol_codes = remap[self.symbol_codes[alert_mask]]
+        batch.symbols = [symbol for symbol, kept in zip(self.symbols, keep) if kept]
+        batch.types = self.types[alert_mask]
+        batch.thresholds = self.thresholds[alert_mask]
+        return batch
+
+    def quote_arrays(self, quotes):
+        """Return price, change_percent and volume arrays aligned with self.symbols, NaN where unquoted.
+
+        Built in one fromiter pass over the flattened quote fields, with
+        the lookups and field reads done by map/itemgetter in C.
+        """
+        count = len(self.symbols)
+        fields = map(QUOTE_FIELDS, map(quotes.get, self.symbols, repeat(UNQUOTED, count)))
+        values = np.fromiter(map(float, chain.from_iterable(fields)), dtype=float, count=3 * count)
+        return values.reshape(count, 3).T
+
+    def evaluate(self, quotes):
+        """Return the ids of alerts whose condition their symbol's quote meets.
+
+        `quotes` maps upper-case symbols to quotes; alerts on symbols with
+        no quote never fire, since comparisons with NaN are False.
+        """
+        if not len(self):
+            return []
+        price, change_percent, volume = self.quote_arrays(quotes)[:, self.symbol_codes]
+        fired = np.zeros(len(self), dtype=bool)
+        for alert_type, code in TYPE_CODES.items():
+            fired |= (self.types == code) & condition_mask(
+                alert_type, self.thresholds, price, change_percent, volume
+            )
+        return self.ids[fired].tolist()
@@ -1,11 +1,18 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from .models import Alert, AlertType
-from .serializers import AlertSerializer
+from decimal import Decimal, InvalidOperation
+from .backtest import DAILY, replay, to_daily
+from .models import Alert, AlertType, NotificationPreference
+from .parsers import CSVParser
+from .serializers import AlertImportRowSerializer, AlertSerializer, NotificationPreferenceSerializer
+from .services import AlertService
 from stocks.models import Stock
+from stocks.intraday import INTERVALS
 from stocks.services import StockService
 
 class AlertViewSet(viewsets.ModelViewSet):
@@ -88,6 +95,142 @@ class AlertViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(alert)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, CSVParser, MultiPartParser, FormParser])
+    def bulk_import(self, request):
+        """Create many alerts from a JSON array or CSV, reporting a result per row.
+        
+        Accepts a JSON array (or {"alerts": [...]}), a text/csv body or a
+        multipart upload in `file`, with symbol, alert_type, threshold_value
+        and optional is_active columns. Every row is validated before any
+        lookups, each distinct symbol is resolved once and all alerts are
+        inserted with one bulk_create.
+        """
+        rows = request.data
+        if 'file' in getattr(request, 'FILES', {}):
+            rows = CSVParser().parse(request.FILES['file'])
+        elif isinstance(rows, dict):
+            rows = rows.get('alerts')
+            
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {'error': 'A non-empty list of alerts is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        if len(rows) > settings.ALERT_IMPORT_MAX_ROWS:
+            return Response(
+                {'error': f'At most {settings.ALERT_IMPORT_MAX_ROWS} alerts can be imported at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        # Validate every row before resolving any symbols
+        results = []
+        valid = {}
+        for row_number, row in enumerate(rows, start=1):
+            serializer = AlertImportRowSerializer(data=row if isinstance(row, dict) else {})
+            if serializer.is_valid():
+                valid[row_number] = serializer.validated_data
+                results.append({'row': row_number, 'status': 'created'})
+            else:
+                results.append({'row': row_number, 'status': 'error', 'errors': serializer.errors})
+                
+        service = StockService()
+        stocks = service.get_or_create_stocks(
+            {data['symbol'] for data in valid.values()},
+            timeout=settings.ALERT_IMPORT_RESOLVE_TIMEOUT
+        )
+        
+        alerts = []
+        for row_number, data in valid.items():
+            stock = stocks.get(data['symbol'])
+            if not stock:
+                results[row_number - 1] = {
+                    'row': row_number,
+                    'status': 'error',
+                    'errors': {'symbol': [f"Stock with symbol {data['symbol']} not found"]}
+                }
+                continue
+            alerts.append((row_number, Alert(
+                user=request.user,
+                stock=stock,
+                alert_type=data['alert_type'],
+                threshold_value=data['threshold_value'],
+                is_active=data['is_active']
+            )))
+            
+        AlertService().create_alerts([alert for _, alert in alerts])
+        for row_number, alert in alerts:
+            results[row_number - 1]['id'] = alert.pk
+            
+        return Response(
+            {'created': len(alerts), 'failed': len(rows) - len(alerts), 'results': results},
+            status=status.HTTP_201_CREATED if alerts else status.HTTP_400_BAD_REQUEST
+        )
+    
+    @action(detail=False, methods=['post'])
+    def backtest(self, request):
+        """Replay a candidate alert over a stock's stored bars"""
+        symbol = request.data.get('symbol')
+        alert_type = request.data.get('alert_type')
+        interval = request.data.get('interval', '5min')
+        
+        if not symbol:
+            return Response(
+                {'error': 'Stock symbol is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        if not alert_type or alert_type not in [choice[0] for choice in AlertType.choices]:
+            return Response(
+                {'error': 'Valid alert type is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        try:
+            threshold_value = Decimal(str(request.data.get('threshold_value')))
+        except InvalidOperation:
+            threshold_value = None
+        if threshold_value is None or not threshold_value.is_finite():
+            return Response(
+                {'error': 'Threshold value is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        if interval != DAILY and interval not in INTERVALS:
+            return Response(
+                {'error': f"Interval must be one of {', '.join(INTERVALS)}, {DAILY}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        # Only tracked stocks are replayed, so arbitrary symbols cannot spend upstream calls
+        symbol = symbol.strip().upper()
+        if not Stock.objects.filter(symbol__iexact=symbol).exists():
+            return Response(
+                {'error': f'Stock with symbol {symbol} not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+            
+        # Daily bars are built from the stored 5 minute bars
+        service = StockService()
+        arrays = service.get_intraday_arrays(symbol, '5min' if interval == DAILY else interval)
+        if interval == DAILY:
+            arrays = to_daily(arrays)
+            
+        if not len(arrays['close']):
+            return Response(
+                {'error': f'No price history stored for {symbol}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+            
+        result = replay(arrays, alert_type, threshold_value)
+        return Response({
+            'symbol': symbol,
+            'alert_type': alert_type,
+            'threshold_value': threshold_value,
+            'interval': interval,
+            **result
+        })
+    
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
         """Toggle the active status of an alert"""
@@ -113,4 +256,22 @@ class AlertViewSet(viewsets.ModelViewSet):
         alert.save()
         
         serializer = self.get_serializer(alert)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get', 'put'])
+    def notification_settings(self, request):
+        """Get or update how the user's alert emails are batched and capped"""
+        preference, _ = NotificationPreference.objects.get_or_create(user=request.user)
+        
+        if request.method == 'GET':
+            return Response(NotificationPreferenceSerializer(preference).data)
+            
+        serializer = NotificationPreferenceSerializer(preference, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(
+                {'error': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        serializer.save()
+        return Response(serializer.data)
@@ -0,0 +1,126 @@
+import atexit
+import logging
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .models import Stock
+from .utils import to_decimal
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ('last_price', 'change_percent', 'volume')
+
+
+def quote_fields(quote):
+    """Map a quote onto Stock's price fields, rounded to the places the model stores.
+
+    Quotes carry 4 decimals, so comparing them with stored values unrounded
+    would report every quote as a change.
+    """
+    values = {}
+    for field, value in zip(PRICE_FIELDS, (quote['price'], quote['change_percent'], quote['volume'])):
+        places = getattr(Stock._meta.get_field(field), 'decimal_places', None)
+        values[field] = value if places is None else Decimal(value).quantize(Decimal(1).scaleb(-places))
+    return values
+
+
+def stock_changed(stock, values):
+    """Whether rounded quote values (see quote_fields) differ from a stock's stored ones"""
+    return any(to_decimal(getattr(stock, field)) != value for field, value in values.items())
+
+
+class StockWriteBuffer:
+    """Write-behind buffer for Stock price fields.
+
+    Quotes that do not change a stock are dropped. Changed stocks are kept
+    (latest instance per row) and written with one bulk_update of only the
+    price fields once `max_size` rows are pending or the oldest pending
+    change is `max_age` seconds old, whichever comes first. A timer covers
+    the age limit when no further updates arrive.
+    """
+
+    fields = ['last_price', 'change_percent', 'volume', 'updated_at']
+
+    def __init__(self, max_size=None, max_age=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._pending = {}  # stock id -> Stock
+        self._oldest = None
+        self._timer = None
+
+    def get_max_size(self):
+        return settings.STOCK_WRITE_BUFFER_SIZE if self.max_size is None else self.max_size
+
+    def get_max_age(self):
+        return settings.STOCK_WRITE_BUFFER_MAX_AGE if self.max_age is None else self.max_age
+
+    @staticmethod
+    def changed(stock, quote):
+        return stock_changed(stock, quote_fields(quote))
+
+    def add(self, stock, quote):
+        """Apply a quote to a saved stock and queue the write if anything changed.
+
+        Returns whether the quote changed the stock.
+        """
+        values = quote_fields(quote)
+        if not stock_changed(stock, values):
+            return False
+
+        for field, value in values.items():
+            setattr(stock, field, value)
+        stock.updated_at = timezone.now()
+
+        with self._lock:
+            self._pending[stock.pk] = stock
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (
+                len(self._pending) >= self.get_max_size()
+                or time.monotonic() - self._oldest >= self.get_max_age()
+            )
+            if not due and self._timer is None:
+                self._timer = threading.Timer(self.get_max_age(), self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if due:
+            self.flush()
+        return True
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write every pending stock now, returning how many were written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._oldest = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return 0
+        try:
+            Stock.objects.bulk_update(pending.values(), self.fields)
+        except Exception:
+            # The next quote for these stocks will queue them again
+            logger.exception("Could not write %d buffered stock updates", len(pending))
+            return 0
+        return len(pending)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Timer threads get their own connection, don't leave it open
+            connection.close()
+
+
+stock_write_buffer = StockWriteBuffer()
+atexit.register(stock_write_buffer.flush)
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+import uuid
+import zlib
+from django.conf import settings
+from django.core.cache import caches
+
+
+class QuoteCache:
+    """Symbol-keyed TTL cache for real-time quotes.
+
+    Backed by Django's cache framework, so quotes are shared between
+    workers when a shared backend (e.g. Redis) is configured. Concurrent
+    misses for the same symbol are collapsed into a single upstream fetch:
+    threads in one process share one of a fixed set of striped locks, and
+    processes coordinate through a short-lived lock key in the cache that
+    only its owner releases. Symbols upstream has no quote for are
+    remembered for a shorter negative TTL.
+    """
+
+    key_prefix = 'quote'
+    poll_interval = 0.05
+    missing = '__missing__'  # cached in place of a quote upstream did not have
+
+    _locks = [threading.Lock() for _ in range(64)]
+
+    def __init__(self, ttl=None, lock_timeout=None, negative_ttl=None):
+        self.cache = caches[settings.STOCK_QUOTE_CACHE_ALIAS]
+        self.ttl = settings.STOCK_QUOTE_CACHE_TTL if ttl is None else ttl
+        self.lock_timeout = (
+            settings.STOCK_QUOTE_LOCK_TIMEOUT if lock_timeout is None else lock_timeout
+        )
+        self.negative_ttl = (
+            settings.STOCK_QUOTE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        )
+
+    def make_key(self, symbol):
+        return f"{self.key_prefix}:{symbol.strip().upper()}"
+
+    def get(self, symbol):
+        """Return the cached quote for a symbol, or None"""
+        quote = self.cache.get(self.make_key(symbol))
+        return None if quote == self.missing else quote
+
+    def set(self, symbol, quote):
+        """Store a quote for a symbol for the configured TTL"""
+        if quote is not None:
+            self.cache.set(self.make_key(symbol), quote, self.ttl)
+
+    def invalidate(self, symbol):
+        """Evict a symbol's quote so the next read goes upstream"""
+        self.cache.delete(self.make_key(symbol))
+
+    def get_or_fetch(self, symbol, fetch):
+        """Return the cached quote, calling fetch(symbol) once on a miss"""
+        key = self.make_key(symbol)
+        quote = self.cache.get(key)
+        if quote is not None:
+            return None if quote == self.missing else quote
+
+        with self._local_lock(key):
+            # Another thread may have filled the cache while we waited
+            quote = self.cache.get(key)
+            if quote is not None:
+                return None if quote == self.missing else quote
+
+            lock_key = f"{key}:lock"
+            token = uuid.uuid4().hex
+            owned = self.cache.add(lock_key, token, self.lock_timeout)
+            if not owned:
+                # Another worker is fetching this symbol, wait for its result
+                quote = self._wait_for(key, lock_key)
+                if quote is not None:
+                    return None if quote == self.missing else quote
+                owned = self.cache.add(lock_key, token, self.lock_timeout)
+
+            try:
+                quote = fetch(symbol)
+                if quote is None:
+                    self.cache.set(key, self.missing, self.negative_ttl)
+                else:
+                    self.set(symbol, quote)
+            finally:
+                # Never release a lock another worker took after ours expired
+                if owned and self.cache.get(lock_key) == token:
+                    self.cache.delete(lock_key)
+
+        return quote
+
+    def _wait_for(self, key, lock_key):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            quote = self.cache.get(key)
+            if quote is not None or self.cache.get(lock_key) is None:
+                return quote
+        return None
+
+    @classmethod
+    def _local_lock(cls, key):
+        return cls._locks[zlib.crc32(key.encode()) % len(cls._locks)]
+
+
+class SearchCache:
+    """Cache of search results keyed on the normalized query.
+
+    "aapl", "AAPL " and "Aapl" share one entry. Empty results are cached
+    under a shorter negative TTL so they are retried upstream sooner, and
+    nothing is cached when fetch raises (e.g. the API is unavailable). Hit
+    and miss counters are kept in the cache so they cover all workers.
+    """
+
+    key_prefix = 'search'
+    _missing = object()
+
+    def __init__(self, ttl=None, negative_ttl=None):
+        self.cache = caches[settings.STOCK_SEARCH_CACHE_ALIAS]
+        self.ttl = settings.STOCK_SEARCH_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = (
+            settings.STOCK_SEARCH_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        )
+
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.split()).upper()
+
+    def make_key(self, query):
+        digest = hashlib.md5(self.normalize(query).encode('utf-8')).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    def get_or_fetch(self, query, fetch):
+        """Return cached results for the query, calling fetch(normalized_query) on a miss"""
+        key = self.make_key(query)
+        results = self.cache.get(key, self._missing)
+        if results is not self._missing:
+            self._count('negative_hits' if not results else 'hits')
+            return results
+
+        self._count('misses')
+        results = fetch(self.normalize(query))
+        self.cache.set(key, results, self.ttl if results else self.negative_ttl)
+        return results
+
+    def _count(self, name):
+        key = f"{self.key_prefix}:stats:{name}"
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            pass
+
+    def stats(self):
+        """Return hit/miss counters and the overall hit rate"""
+        names = ('hits', 'negative_hits', 'misses')
+        values = self.cache.get_many([f"{self.key_prefix}:stats:{name}" for name in names])
+        stats = {name: values.get(f"{self.key_prefix}:stats:{name}", 0) for name in names}
+        lookups = sum(stats.values())
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        self.cache.delete_many([f"{self.key_prefix}:stats:{name}" for name in ('hits', 'negative_hits', 'misses')])
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+PROCESS_LOCAL_CHANNEL_LAYERS = (
+    'channels.layers.InMemoryChannelLayer',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the cache behind the rate limiter and task locks is private to each process"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint=(
+            "The API rate limiter, alert sweep and dispatch locks and hourly email caps "
+            "are only enforced per process. Set REDIS_URL when running more than one process."
+        ),
+        id='stocks.W001',
+    )]
+
+
+@register()
+def check_shared_channel_layer(app_configs, **kwargs):
+    """Warn when price updates published by the worker cannot reach the web process"""
+    backend = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CHANNEL_LAYERS:
+        return []
+    return [Warning(
+        f"The default channel layer ({backend}) is not shared between processes.",
+        hint=(
+            "Price updates published by the Celery worker never reach WebSockets, so every "
+            "socket polls the database instead. Set REDIS_URL when running more than one process."
+        ),
+        id='stocks.W002',
+    )]
@@ -0,0 +1,82 @@
+import numpy as np
+
+METHODS = ('ohlc', 'lttb')
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+
+def lttb_indices(y, points):
+    """Largest-Triangle-Three-Buckets: indices of the bars that best keep the shape of y.
+
+    Bars are treated as evenly spaced. The first and last bars are always
+    kept; every bucket in between contributes the bar forming the largest
+    triangle with the previously kept bar and the next bucket's average.
+    """
+    n = len(y)
+    if points >= n or points < MIN_POINTS:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=float)
+    every = (n - 2) / (points - 2)
+    edges = (np.arange(points - 1) * every).astype(int) + 1
+    edges[-1] = n - 1
+
+    selected = np.empty(points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def lttb(arrays, points):
+    """Keep the LTTB-selected bars (chosen on close) from oldest-first arrays"""
+    indices = lttb_indices(arrays['close'], points)
+    return {field: values[indices] for field, values in arrays.items()}
+
+
+def ohlc_buckets(arrays, points):
+    """Merge oldest-first bars into `points` OHLC bars.
+
+    Each bucket keeps its first timestamp and open, its highest high, lowest
+    low, last close and total volume, so candles and extremes survive.
+    """
+    n = len(arrays['close'])
+    if points >= n:
+        return arrays
+
+    starts = np.unique(np.linspace(0, n, points, endpoint=False).astype(int))
+    ends = np.append(starts[1:], n) - 1
+    return {
+        'timestamp': arrays['timestamp'][starts],
+        'open': arrays['open'][starts],
+        'high': np.maximum.reduceat(arrays['high'], starts),
+        'low': np.minimum.reduceat(arrays['low'], starts),
+        'close': arrays['close'][ends],
+        'volume': np.add.reduceat(arrays['volume'], starts),
+    }
+
+
+def downsample(arrays, points, method='ohlc'):
+    if method == 'lttb':
+        return lttb(arrays, points)
+    return ohlc_buckets(arrays, points)
+
+
+def arrays_to_bars(arrays):
+    """Convert oldest-first bar arrays to dicts, newest first"""
+    columns = [arrays[field][::-1].tolist() for field in ('timestamp', 'open', 'high', 'low', 'close')]
+    volume = arrays['volume'][::-1].astype(np.int64).tolist()
+    return [
+        {'timestamp': timestamp, 'open': open_, 'high': high, 'low': low, 'close': close, 'volume': vol}
+        for timestamp, open_, high, low, close, vol in zip(*columns, volume)
+    ]
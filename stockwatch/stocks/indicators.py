@@ -0,0 +1,178 @@
+import numpy as np
+
+# Default parameters for each indicator, in spec order (e.g. 'bollinger:20:2')
+INDICATORS = {
+    'sma': (20,),
+    'ema': (20,),
+    'rsi': (14,),
+    'vwap': (),
+    'bollinger': (20, 2.0),
+    'volatility': (20,),
+}
+
+
+class IndicatorError(ValueError):
+    """Raised for unknown indicators or invalid indicator parameters"""
+
+
+def parse_spec(spec):
+    """Parse 'name[:param[:param]]' into a canonical spec string, name and params"""
+    name, *raw_params = spec.strip().lower().split(':')
+    if name not in INDICATORS:
+        raise IndicatorError(f"Unknown indicator '{name}'")
+
+    defaults = INDICATORS[name]
+    if len(raw_params) > len(defaults):
+        raise IndicatorError(f"Too many parameters for '{name}'")
+    try:
+        params = tuple(
+            type(default)(raw) if raw else default
+            for default, raw in zip(defaults, raw_params + [''] * (len(defaults) - len(raw_params)))
+        )
+    except ValueError:
+        raise IndicatorError(f"Invalid parameters for '{name}'")
+    if params and (params[0] < 1 or params[0] > 1000):
+        raise IndicatorError(f"Window for '{name}' must be between 1 and 1000")
+
+    return ':'.join([name, *map(str, params)]), name, params
+
+
+def bars_to_arrays(rows):
+    """Convert (timestamp, open, high, low, close, volume) rows, oldest first, to arrays"""
+    if not rows:
+        empty = np.empty(0)
+        return {'timestamp': np.empty(0, dtype='U19'), 'open': empty, 'high': empty,
+                'low': empty, 'close': empty, 'volume': empty}
+    timestamp, open_, high, low, close, volume = zip(*rows)
+    return {
+        'timestamp': np.array(timestamp, dtype='U19'),
+        'open': np.array(open_, dtype=float),
+        'high': np.array(high, dtype=float),
+        'low': np.array(low, dtype=float),
+        'close': np.array(close, dtype=float),
+        'volume': np.array(volume, dtype=float),
+    }
+
+
+def _nan_pad(values, n):
+    """Left-pad a shorter result with NaN so it lines up with the input series"""
+    return np.concatenate([np.full(n - len(values), np.nan), values])
+
+
+def _rolling_windows(values, window):
+    return np.lib.stride_tricks.sliding_window_view(values, window)
+
+
+def sma(close, window):
+    if len(close) < window:
+        return np.full(len(close), np.nan)
+    csum = np.cumsum(np.insert(close, 0, 0.0))
+    return _nan_pad((csum[window:] - csum[:-window]) / window, len(close))
+
+
+def _ewm(values, alpha, initial):
+    """Recursive y[t] = (1 - alpha) * y[t-1] + alpha * x[t] seeded with `initial`.
+
+    Evaluated in closed form over blocks short enough that the decay powers
+    stay within float range, so the cost is a few vector ops per block.
+    """
+    decay = 1.0 - alpha
+    out = np.empty(len(values))
+    if decay <= 0:
+        out[:] = values
+        return out
+    block = max(1, int(600 / -np.log(decay)))
+    carry = initial
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        out[start:start + len(chunk)] = powers * (carry + np.cumsum(alpha * chunk / powers))
+        carry = out[start + len(chunk) - 1]
+    return out
+
+
+def ema(close, span):
+    if len(close) < span:
+        return np.full(len(close), np.nan)
+    seed = close[:span].mean()
+    return _nan_pad(np.insert(_ewm(close[span:], 2.0 / (span + 1), seed), 0, seed), len(close))
+
+
+def rsi(close, period):
+    if len(close) <= period:
+        return np.full(len(close), np.nan)
+    delta = np.diff(close)
+    gains = np.clip(delta, 0, None)
+    losses = np.clip(-delta, 0, None)
+    alpha = 1.0 / period
+    avg_gain = _ewm(gains[period:], alpha, gains[:period].mean())
+    avg_loss = _ewm(losses[period:], alpha, losses[:period].mean())
+    avg_gain = np.insert(avg_gain, 0, gains[:period].mean())
+    avg_loss = np.insert(avg_loss, 0, losses[:period].mean())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    return _nan_pad(values, len(close))
+
+
+def vwap(high, low, close, volume, timestamp):
+    """Session VWAP that resets at the start of every trading day"""
+    if not len(close):
+        return np.empty(0)
+    typical = (high + low + close) / 3.0
+    cum_pv = np.cumsum(typical * volume)
+    cum_vol = np.cumsum(volume)
+
+    day = timestamp.astype('U10')
+    starts = np.flatnonzero(np.insert(day[1:] != day[:-1], 0, True))
+    session = np.repeat(starts, np.diff(np.append(starts, len(close))))
+    base_pv = np.where(session > 0, cum_pv[session - 1], 0.0)
+    base_vol = np.where(session > 0, cum_vol[session - 1], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (cum_pv - base_pv) / (cum_vol - base_vol)
+
+
+def bollinger(close, window, k):
+    if len(close) < window:
+        nan = np.full(len(close), np.nan)
+        return {'middle': nan, 'upper': nan, 'lower': nan}
+    windows = _rolling_windows(close, window)
+    middle = _nan_pad(windows.mean(axis=1), len(close))
+    std = _nan_pad(windows.std(axis=1), len(close))
+    return {'middle': middle, 'upper': middle + k * std, 'lower': middle - k * std}
+
+
+def volatility(close, window):
+    """Rolling standard deviation of per-bar log returns"""
+    if len(close) <= window:
+        return np.full(len(close), np.nan)
+    returns = np.diff(np.log(close))
+    return _nan_pad(_rolling_windows(returns, window).std(axis=1, ddof=1), len(close))
+
+
+def compute(arrays, specs):
+    """Compute the given parsed (spec, name, params) indicators over one set of arrays"""
+    close = arrays['close']
+    results = {}
+    for spec, name, params in specs:
+        if name == 'sma':
+            results[spec] = sma(close, *params)
+        elif name == 'ema':
+            results[spec] = ema(close, *params)
+        elif name == 'rsi':
+            results[spec] = rsi(close, *params)
+        elif name == 'vwap':
+            results[spec] = vwap(arrays['high'], arrays['low'], close, arrays['volume'], arrays['timestamp'])
+        elif name == 'bollinger':
+            results[spec] = bollinger(close, *params)
+        elif name == 'volatility':
+            results[spec] = volatility(close, *params)
+    return results
+
+
+def to_json(values, newest_first=True):
+    """Convert an indicator array (or dict of arrays) to lists with None for NaN"""
+    if isinstance(values, dict):
+        return {key: to_json(value, newest_first) for key, value in values.items()}
+    if newest_first:
+        values = values[::-1]
+    return np.where(np.isnan(values), None, np.round(values, 6)).tolist()
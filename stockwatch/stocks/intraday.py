@@ -0,0 +1,109 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from .indicators import bars_to_arrays
+from .models import IntradayBar
+
+BAR_FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+INTERVALS = ('1min', '5min', '15min', '30min', '60min')
+
+
+def interval_seconds(interval):
+    """Length of an API interval such as '5min' in seconds"""
+    return int(interval.rstrip('min')) * 60
+
+
+class IntradayStore:
+    """Persistent per-(symbol, interval) intraday bars.
+
+    Bars are downloaded in full once, then refreshed with the compact tail
+    at most once per interval and merged into the store. Only when the
+    compact tail starts after the latest stored bar, leaving a gap, is the
+    full series fetched again. Derived results (e.g. indicators) key
+    off `version`, which changes whenever the stored bars do.
+    """
+
+    def __init__(self, symbol, interval):
+        self.symbol = symbol.strip().upper()
+        self.interval = interval
+        self.cache_key = f"intraday:{self.symbol}:{self.interval}"
+
+    def bars(self):
+        return IntradayBar.objects.filter(symbol=self.symbol, interval=self.interval)
+
+    def load(self):
+        """Return stored bars as dicts, newest first"""
+        return list(self.bars().order_by('-timestamp').values(*BAR_FIELDS))
+
+    def arrays(self):
+        """Return stored bars as NumPy arrays, oldest first.
+
+        The arrays are cached under the store version, so repeated replays
+        and indicator requests skip the row-by-row load until bars change.
+        """
+        key = f"{self.cache_key}:arrays:{self.version}"
+        arrays = cache.get(key)
+        if arrays is None:
+            arrays = bars_to_arrays(list(self.bars().order_by('timestamp').values_list(*BAR_FIELDS)))
+            cache.set(key, arrays, settings.STOCK_BAR_ARRAYS_CACHE_TTL)
+        return arrays
+
+    @property
+    def version(self):
+        """Identify the stored series by its size and latest bar.
+
+        Derived from the stored bars rather than kept in the cache, so every
+        process agrees on it no matter which one merged the bars. Merges only
+        append bars or update the latest one, so both are covered.
+        """
+        latest = self.bars().order_by('-timestamp').values_list(*BAR_FIELDS).first()
+        if latest is None:
+            return '0'
+        state = f"{self.bars().count()}|{'|'.join(map(str, latest))}"
+        return hashlib.sha1(state.encode()).hexdigest()[:16]
+
+    def is_fresh(self):
+        return cache.get(f"{self.cache_key}:fresh") is not None
+
+    def refresh(self, fetch):
+        """Pull new bars with fetch(symbol, interval, outputsize) if the store is stale.
+
+        Returns the number of bars inserted or updated.
+        """
+        if self.is_fresh():
+            return 0
+
+        lock_key = f"{self.cache_key}:lock"
+        if not cache.add(lock_key, 1, settings.STOCK_API_READ_TIMEOUT * 2):
+            # Another request is already refreshing, serve what we have
+            return 0
+
+        try:
+            latest = self.bars().order_by('-timestamp').values_list('timestamp', flat=True).first()
+            fetched = fetch(self.symbol, self.interval, 'compact' if latest else 'full')
+            if fetched and latest and min(bar['timestamp'] for bar in fetched) > latest:
+                # The compact tail does not reach back to the stored bars, fill the gap
+                fetched = fetch(self.symbol, self.interval, 'full') or fetched
+            if not fetched:
+                return 0
+
+            merged = self.merge(fetched, latest)
+            cache.set(f"{self.cache_key}:fresh", 1, interval_seconds(self.interval))
+            return merged
+        finally:
+            cache.delete(lock_key)
+
+    def merge(self, fetched, latest=None):
+        """Insert bars newer than `latest` and update the (possibly partial) latest bar"""
+        new_bars = []
+        merged = 0
+        for bar in fetched:
+            if latest is None or bar['timestamp'] > latest:
+                new_bars.append(IntradayBar(symbol=self.symbol, interval=self.interval, **bar))
+            elif bar['timestamp'] == latest:
+                fields = {field: bar[field] for field in BAR_FIELDS[1:]}
+                merged += self.bars().filter(timestamp=latest).exclude(**fields).update(**fields)
+
+        if new_bars:
+            IntradayBar.objects.bulk_create(new_bars, batch_size=1000)
+        return merged + len(new_bars)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from stocks.cache import SearchCache
+
+
+class Command(BaseCommand):
+    help = 'Show search cache hit/miss counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        search_cache = SearchCache()
+        stats = search_cache.stats()
+        self.stdout.write(f"hits:          {stats['hits']}")
+        self.stdout.write(f"negative hits: {stats['negative_hits']}")
+        self.stdout.write(f"misses:        {stats['misses']}")
+        self.stdout.write(f"hit rate:      {stats['hit_rate']:.1%}")
+        if options['reset']:
+            search_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0002_intradaybar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='asset_type',
+            field=models.CharField(default='Equity', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='currency',
+            field=models.CharField(default='USD', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='region',
+            field=models.CharField(default='United States', max_length=50),
+        ),
+    ]
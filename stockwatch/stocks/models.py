@@ -8,6 +8,9 @@ class Stock(models.Model):
     change_percent = models.DecimalField(max_digits=5, decimal_places=2)
     volume = models.BigIntegerField()
     market_cap = models.BigIntegerField(null=True, blank=True)
+    asset_type = models.CharField(max_length=50, default='Equity')
+    region = models.CharField(max_length=50, default='United States')
+    currency = models.CharField(max_length=10, default='USD')
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -23,4 +26,20 @@ class WatchlistItem(models.Model):
         unique_together = ('user', 'stock')
 
     def __str__(self):
-        return f"{self.user.username} - {self.stock.symbol}"
\ No newline at end of file
+        return f"{self.user.username} - {self.stock.symbol}"
+
+class IntradayBar(models.Model):
+    symbol = models.CharField(max_length=10)
+    interval = models.CharField(max_length=10)
+    timestamp = models.CharField(max_length=19)  # As returned by the API, e.g. '2025-04-01 15:55:00'
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('symbol', 'interval', 'timestamp')
+
+    def __str__(self):
+        return f"{self.symbol} {self.interval} {self.timestamp}"
@@ -0,0 +1,94 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .buffer import quote_fields, stock_changed
+from .models import Stock, WatchlistItem
+from .publisher import encode_stock_updates
+from .ratelimit import Priority
+from .services import StockService
+from .signals import price_updated
+from .subscriptions import binary_symbols, live_symbols, stock_group_name
+from .utils import to_decimal
+
+logger = logging.getLogger(__name__)
+
+
+class MarketDataPoller:
+    """Fetches each tracked symbol once per cycle and fans the result out.
+
+    The tracked set is the distinct symbols across watchlists, active alerts
+    and live WebSocket subscriptions, so upstream load grows with the number
+    of symbols rather than with users x symbols. Changed quotes are written
+    to Stock in bulk and published to the matching `stock_{symbol}` groups.
+    """
+
+    stock_fields = ['last_price', 'change_percent', 'volume', 'updated_at']
+
+    def __init__(self):
+        self.stock_service = StockService(priority=Priority.BACKGROUND)
+        self.channel_layer = get_channel_layer()
+
+    def tracked_stocks(self):
+        """Return tracked Stock rows grouped by upper-cased symbol"""
+        Alert = apps.get_model('alerts', 'Alert')
+        stock_ids = set(WatchlistItem.objects.values_list('stock_id', flat=True))
+        stock_ids.update(
+            Alert.objects.filter(is_active=True, is_triggered=False).values_list('stock_id', flat=True)
+        )
+
+        by_symbol = {}
+        for stock in Stock.objects.filter(Q(id__in=stock_ids) | Q(symbol__in=live_symbols())):
+            by_symbol.setdefault(stock.symbol.upper(), []).append(stock)
+        return by_symbol
+
+    def poll(self):
+        """Run one polling cycle, returning the number of symbols that changed"""
+        tracked = self.tracked_stocks()
+        if not tracked:
+            return 0
+
+        quotes = self.stock_service.get_stock_quotes(list(tracked), timeout=settings.STOCK_POLL_QUOTE_TIMEOUT)
+        now = timezone.now()
+        changed_stocks = []
+        updates = []
+
+        for symbol, stocks in tracked.items():
+            quote = quotes.get(symbol)
+            if not quote:
+                continue
+
+            values = quote_fields(quote)
+            changed = [stock for stock in stocks if stock_changed(stock, values)]
+            if not changed:
+                continue
+
+            previous = changed[0]
+            moved = {field for field, value in values.items() if to_decimal(getattr(previous, field)) != value}
+            for stock in changed:
+                for field, value in values.items():
+                    setattr(stock, field, value)
+                stock.updated_at = now
+            changed_stocks.extend(changed)
+            updates.append((symbol, changed[0], moved))
+
+        if changed_stocks:
+            Stock.objects.bulk_update(changed_stocks, self.stock_fields)
+
+        for symbol, stock, _ in updates:
+            price_updated.send(sender=Stock, symbol=symbol, quote=quotes[symbol])
+        binary = binary_symbols([symbol for symbol, _, _ in updates]) if updates else set()
+        for event in encode_stock_updates([(stock, moved) for _, stock, moved in updates], binary):
+            self.publish(event)
+
+        logger.info("Polled %d symbols, %d changed", len(tracked), len(updates))
+        return len(updates)
+
+    def publish(self, event):
+        """Send a pre-encoded stock update to everyone subscribed to the symbol"""
+        if self.channel_layer is None:
+            return
+        async_to_sync(self.channel_layer.group_send)(stock_group_name(event['symbol']), event)
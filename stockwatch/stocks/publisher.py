@@ -0,0 +1,101 @@
+import json
+from decimal import Decimal
+import numpy as np
+from bson.decimal128 import Decimal128
+from .utils import to_decimal
+
+try:
+    import msgpack
+except ImportError:  # The binary subprotocol is only offered when msgpack is installed
+    msgpack = None
+
+# stock_update fields that live on a socket's watchlist rows, and the row key for each
+DELTA_FIELDS = {'last_price': 'stock__last_price', 'change_percent': 'stock__change_percent'}
+
+# WebSocket subprotocol for MessagePack frames, prices in them are integers in 1/PRICE_SCALE units
+MSGPACK = 'msgpack'
+PRICE_SCALE = 10_000
+PRICE_KEYS = frozenset({*DELTA_FIELDS, *DELTA_FIELDS.values()})
+
+
+def dumps(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+def scale_price(value):
+    return None if value is None else round(float(to_decimal(value)) * PRICE_SCALE)
+
+
+def scale_prices(value):
+    """Prepare a message for msgpack: prices become scaled integers, other Decimals floats"""
+    if isinstance(value, dict):
+        return {
+            key: scale_price(item) if key in PRICE_KEYS else scale_prices(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [scale_prices(item) for item in value]
+    if isinstance(value, (Decimal, Decimal128)):
+        return float(to_decimal(value))
+    return value
+
+
+def pack(message):
+    return msgpack.packb(scale_prices(message))
+
+
+def with_seq(encoded, seq):
+    """Add a seq field to an encoded JSON object or msgpack map without re-encoding it"""
+    if isinstance(encoded, bytes):
+        # Messages are small fixmaps, whose first byte holds the key count
+        return bytes([encoded[0] + 1]) + msgpack.packb('seq') + msgpack.packb(seq) + encoded[1:]
+    return f'{{"seq":{seq},{encoded[1:]}'
+
+
+def encode_stock_updates(updates, binary=()):
+    """Build one channel layer event per changed stock, with its messages encoded once.
+
+    `updates` are (stock, changed) pairs, where `changed` holds the names of
+    the stock fields that moved. Decimals are converted to floats for all
+    stocks in one pass, and each event carries its `stock_update` message
+    and watchlist delta as ready-made JSON text, so consumers send the same
+    frame to every subscriber instead of serializing per socket. Symbols in
+    `binary` have msgpack subscribers and get msgpack bytes as well.
+
+    With a Redis channel layer every event is stored once per subscribing
+    channel, so it carries only the frames plus the symbol, its watchlist
+    row prices in DELTA_FIELDS order and the row fields that moved.
+    """
+    if not updates:
+        return []
+    stocks = [stock for stock, _ in updates]
+    prices = np.array([to_decimal(stock.last_price) for stock in stocks], dtype=float).tolist()
+    change_percents = np.array([to_decimal(stock.change_percent) for stock in stocks], dtype=float).tolist()
+
+    events = []
+    for (stock, changed), price, change_percent in zip(updates, prices, change_percents):
+        payload = {
+            'symbol': stock.symbol,
+            'name': stock.name,
+            'last_price': price,
+            'change_percent': change_percent,
+            'volume': int(stock.volume),
+            'updated_at': stock.updated_at.isoformat(),
+        }
+        delta = {row_field: payload[field] for field, row_field in DELTA_FIELDS.items() if field in changed}
+        message = {'type': 'stock_update', 'stock': payload}
+        delta_message = {'type': 'watchlist_delta', 'stocks': [{'stock__symbol': stock.symbol, **delta}]}
+        symbol = stock.symbol.upper()
+        event = {
+            'type': 'stock_update',
+            'symbol': symbol,
+            'prices': [payload[field] for field in DELTA_FIELDS],
+            'moved': list(delta),
+            'text': dumps(message),
+            'delta_text': dumps(delta_message),
+        }
+        if msgpack is not None and symbol in binary:
+            event['packed'] = pack(message)
+            event['delta_packed'] = pack(delta_message)
+        events.append(event)
+    return events
@@ -0,0 +1,79 @@
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+
+class Priority:
+    """Priority classes for stock API calls, highest first"""
+    INTERACTIVE = 'interactive'
+    ALERT = 'alert'
+    BACKGROUND = 'background'
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call cannot be admitted within its priority's wait budget"""
+
+
+class RateLimiter:
+    """Token-bucket limiter for the stock API shared across processes.
+
+    The per-minute and per-day buckets live in the cache backend and refill
+    at the start of every window, so all workers draw from the same quota.
+    Each priority class may only spend its share of a bucket: background
+    refreshes stop well before alert evaluation, which in turn leaves
+    headroom for interactive requests. A call over its share either waits
+    for the next refill (up to the class's max wait) or is shed.
+    """
+
+    key_prefix = 'ratelimit:stock_api'
+
+    def __init__(self, per_minute=None, per_day=None, shares=None, max_wait=None):
+        self.cache = caches[settings.STOCK_API_RATE_LIMIT_CACHE_ALIAS]
+        self.per_minute = settings.STOCK_API_CALLS_PER_MINUTE if per_minute is None else per_minute
+        self.per_day = settings.STOCK_API_CALLS_PER_DAY if per_day is None else per_day
+        self.shares = settings.STOCK_API_PRIORITY_SHARES if shares is None else shares
+        self.max_wait = settings.STOCK_API_PRIORITY_MAX_WAIT if max_wait is None else max_wait
+
+    def acquire(self, priority=Priority.INTERACTIVE):
+        """Take one token for a call, waiting or raising RateLimitExceeded"""
+        deadline = time.monotonic() + self.max_wait.get(priority, 0)
+        while True:
+            retry_after = self.try_acquire(priority)
+            if retry_after is None:
+                return
+            if time.monotonic() + retry_after > deadline:
+                raise RateLimitExceeded(
+                    f"Stock API quota exhausted for {priority} calls, retry in {retry_after:.0f}s"
+                )
+            time.sleep(retry_after)
+
+    def try_acquire(self, priority=Priority.INTERACTIVE):
+        """Take one token if available, otherwise return seconds until a refill"""
+        now = time.time()
+        blocked_until = self.cache.get(f"{self.key_prefix}:blocked")
+        if blocked_until and blocked_until > now:
+            return blocked_until - now
+
+        share = self.shares.get(priority, 1.0)
+        buckets = (
+            ('m', 60, self.per_minute),
+            ('d', 86400, self.per_day),
+        )
+        taken = []
+        for name, window, limit in buckets:
+            window_start = int(now // window)
+            key = f"{self.key_prefix}:{name}:{window_start}"
+            self.cache.add(key, 0, window + 60)
+            if self.cache.incr(key) > math.floor(limit * share):
+                # Hand back the tokens we took and report the next refill
+                self.cache.decr(key)
+                for taken_key in taken:
+                    self.cache.decr(taken_key)
+                return (window_start + 1) * window - now
+            taken.append(key)
+        return None
+
+    def block(self, seconds=60):
+        """Stop admitting calls, e.g. after the API reports its quota is used up"""
+        self.cache.set(f"{self.key_prefix}:blocked", time.time() + seconds, seconds)
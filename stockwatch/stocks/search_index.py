@@ -0,0 +1,167 @@
+import csv
+import logging
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from django.conf import settings
+from django.core.cache import caches
+from .models import Stock
+
+logger = logging.getLogger(__name__)
+
+_token_re = re.compile(r'[A-Z0-9]+')
+_HIGHEST = '\uffff'
+
+UPSTREAM_ENTRIES_KEY = 'search:upstream_entries'
+
+
+def _tokens(text):
+    return _token_re.findall(text.upper())
+
+
+class SymbolIndex:
+    """In-memory prefix index over symbols and company name words.
+
+    Entries are stored once as tuples of interned strings. Lookups go
+    through two sorted key arrays - upper-cased symbols and name words -
+    with parallel `array('I')` columns of entry ids, so a prefix query is
+    a pair of bisects plus a slice.
+    """
+
+    def __init__(self, entries):
+        self.entries = []
+        seen = set()
+        for symbol, name, type_, region, currency in entries:
+            symbol = symbol.strip().upper()
+            if not symbol or symbol in seen:
+                continue
+            seen.add(symbol)
+            self.entries.append(tuple(
+                sys.intern(value) for value in (symbol, name.strip(), type_, region, currency)
+            ))
+
+        symbol_keys = sorted((entry[0], entry_id) for entry_id, entry in enumerate(self.entries))
+        self.symbol_keys = [key for key, _ in symbol_keys]
+        self.symbol_ids = array('I', (entry_id for _, entry_id in symbol_keys))
+
+        word_keys = sorted({
+            (word, entry_id)
+            for entry_id, entry in enumerate(self.entries)
+            for word in _tokens(entry[1])
+        })
+        self.word_keys = [sys.intern(word) for word, _ in word_keys]
+        self.word_ids = array('I', (entry_id for _, entry_id in word_keys))
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _prefix(keys, ids, prefix):
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + _HIGHEST, start)
+        return ids[start:end]
+
+    def search(self, query, limit=10):
+        """Return up to `limit` entries matching the query, best matches first"""
+        query = query.strip().upper()
+        if not query:
+            return []
+
+        # Symbols starting with the query, exact match and shorter symbols first
+        by_symbol = sorted(
+            self._prefix(self.symbol_keys, self.symbol_ids, query),
+            key=lambda entry_id: len(self.entries[entry_id][0])
+        )
+
+        # Names containing a word starting with every query word
+        by_name = None
+        for word in _tokens(query):
+            matches = set(self._prefix(self.word_keys, self.word_ids, word))
+            by_name = matches if by_name is None else by_name & matches
+            if not by_name:
+                break
+        by_name = sorted(by_name or (), key=lambda entry_id: len(self.entries[entry_id][1]))
+
+        results = []
+        for entry_id in dict.fromkeys([*by_symbol, *by_name]):
+            symbol, name, type_, region, currency = self.entries[entry_id]
+            results.append({
+                'symbol': symbol,
+                'name': name,
+                'type': type_,
+                'region': region,
+                'currency': currency
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+
+def load_entries():
+    """Yield index entries from the listings file (if configured), the Stock table and upstream results"""
+    listings_file = settings.STOCK_LISTINGS_FILE
+    if listings_file:
+        # Alpha Vantage LISTING_STATUS format: symbol,name,exchange,assetType,...
+        try:
+            with open(listings_file, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row.get('symbol') and row.get('name'):
+                        # The listing covers US exchanges only
+                        yield row['symbol'], row['name'], row.get('assetType') or 'Equity', 'United States', 'USD'
+        except OSError as exc:
+            logger.error("Could not read stock listings file %s: %s", listings_file, exc)
+
+    yield from Stock.objects.values_list('symbol', 'name', 'asset_type', 'region', 'currency')
+    yield from caches[settings.STOCK_SEARCH_CACHE_ALIAS].get(UPSTREAM_ENTRIES_KEY, {}).values()
+
+
+def remember_search_results(results):
+    """Keep upstream search results for the index, so later prefix queries are served locally.
+
+    Entries are shared through the search cache and capped at
+    STOCK_SEARCH_UPSTREAM_ENTRIES, dropping the oldest. This process's
+    index is rebuilt when a symbol it did not know turns up; other
+    processes pick them up on their next refresh.
+    """
+    cache = caches[settings.STOCK_SEARCH_CACHE_ALIAS]
+    entries = cache.get(UPSTREAM_ENTRIES_KEY, {})
+    added = {
+        result['symbol'].strip().upper(): (
+            result['symbol'], result['name'], result['type'], result['region'], result['currency']
+        )
+        for result in results if result['symbol'].strip().upper() not in entries
+    }
+    if not added:
+        return
+    entries.update(added)
+    for symbol in list(entries)[:max(0, len(entries) - settings.STOCK_SEARCH_UPSTREAM_ENTRIES)]:
+        del entries[symbol]
+    cache.set(UPSTREAM_ENTRIES_KEY, entries, None)
+    invalidate_symbol_index()
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_symbol_index():
+    """Return this process's symbol index, rebuilding it when it is stale"""
+    global _index, _index_built_at
+    if _index is None or time.monotonic() - _index_built_at > settings.STOCK_SEARCH_INDEX_REFRESH:
+        with _index_lock:
+            if _index is None or time.monotonic() - _index_built_at > settings.STOCK_SEARCH_INDEX_REFRESH:
+                started = time.monotonic()
+                _index = SymbolIndex(load_entries())
+                _index_built_at = time.monotonic()
+                logger.info("Built symbol index with %d entries in %.3fs", len(_index), _index_built_at - started)
+    return _index
+
+
+def invalidate_symbol_index():
+    """Force the next search to rebuild the index, e.g. after new stocks are added"""
+    global _index_built_at
+    _index_built_at = float('-inf')
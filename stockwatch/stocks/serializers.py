@@ -4,7 +4,8 @@ from .models import Stock, WatchlistItem
 class StockSerializer(serializers.ModelSerializer):
     class Meta:
         model = Stock
-        fields = ['id', 'symbol', 'name', 'last_price', 'change_percent', 'volume', 'market_cap', 'updated_at']
+        fields = ['id', 'symbol', 'name', 'last_price', 'change_percent', 'volume', 'market_cap',
+                  'asset_type', 'region', 'currency', 'updated_at']
 
 class WatchlistItemSerializer(serializers.ModelSerializer):
     stock = StockSerializer(read_only=True)
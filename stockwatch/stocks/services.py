@@ -1,31 +1,121 @@
 import os
 import json
-import requests
+import logging
+import operator
+from concurrent.futures import ThreadPoolExecutor, wait
 from decimal import Decimal
+from functools import reduce
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
 from .models import Stock
+from .buffer import stock_write_buffer
+from .cache import QuoteCache, SearchCache
+from .downsampling import arrays_to_bars, downsample
+from .indicators import compute, to_json
+from .intraday import IntradayStore
+from .ratelimit import Priority, RateLimiter, RateLimitExceeded
+from .search_index import get_symbol_index, remember_search_results
+from .signals import price_updated
+from .transport import TransportError, get_transport
+
+logger = logging.getLogger(__name__)
+
+_quote_executor = None
+
+
+class StockAPIUnavailable(Exception):
+    """The stock API could not answer: shed, unreachable or out of quota"""
+
+
+def get_quote_executor():
+    """Return the process-wide thread pool used for quote fan-out"""
+    global _quote_executor
+    if _quote_executor is None:
+        _quote_executor = ThreadPoolExecutor(
+            max_workers=settings.STOCK_QUOTE_FANOUT_WORKERS,
+            thread_name_prefix='stock-quote',
+        )
+    return _quote_executor
+
+
+def symbols_filter(symbols):
+    """Match stocks by symbol regardless of case, since older rows kept the case they were typed in"""
+    return reduce(operator.or_, (Q(symbol__iexact=symbol) for symbol in symbols))
   
 class StockService:
     """Service for interacting with the Alpha Vantage Stock API"""
     
-    def __init__(self):
+    def __init__(self, priority=Priority.INTERACTIVE):
         self.api_key = settings.STOCK_API_KEY
         self.base_url = settings.STOCK_API_BASE_URL
+        self.quote_cache = QuoteCache()
+        self.search_cache = SearchCache()
+        self.transport = get_transport()
+        self.priority = priority
+        self.rate_limiter = RateLimiter()
+    
+    def _request(self, params):
+        """Call the stock API, returning an empty payload if it is unreachable"""
+        try:
+            self.rate_limiter.acquire(self.priority)
+            data = self.transport.get_json(self.base_url, params)
+        except RateLimitExceeded as exc:
+            logger.warning("Stock API %s call shed: %s", params.get('function'), exc)
+            return {}
+        except TransportError as exc:
+            logger.error("Stock API %s call failed: %s", params.get('function'), exc)
+            return {}
+            
+        # The API answers 200 with a note instead of data once the quota is gone
+        if 'Note' in data or 'Information' in data:
+            logger.warning("Stock API quota exhausted: %s", data.get('Note') or data.get('Information'))
+            self.rate_limiter.block()
+            return {}
+            
+        return data
         
     def search_stocks(self, query):
-        """Search for stocks by symbol or name"""
+        """Search for stocks by symbol or name, cached per normalized query"""
+        try:
+            return self.search_cache.get_or_fetch(query, self._search_stocks)
+        except StockAPIUnavailable:
+            # Nothing was cached, the next search asks upstream again
+            return get_symbol_index().search(query)
+    
+    def _search_stocks(self, query):
+        """Search the local index, going upstream when it cannot answer well enough.
+
+        The index holds the listings file (if configured), the stored
+        stocks and every symbol upstream search has returned before, so
+        upstream is only asked when there is no exact symbol match and
+        just a few partial ones. Local matches come first either way.
+        """
+        results = get_symbol_index().search(query)
+        exact = any(result['symbol'] == query.strip().upper() for result in results)
+        if exact or len(results) >= settings.STOCK_SEARCH_MIN_LOCAL_RESULTS:
+            return results
+            
+        known = {result['symbol'] for result in results}
+        results += [result for result in self.fetch_search_results(query) if result['symbol'] not in known]
+        return results[:10]
+    
+    def fetch_search_results(self, query):
+        """Search for stocks through the API, bypassing the local index.
+
+        Raises StockAPIUnavailable when the API gave no answer, so callers
+        can tell that apart from a search that matched nothing.
+        """
         params = {
             'function': 'SYMBOL_SEARCH',
             'keywords': query,
             'apikey': self.api_key
         }
         
-        response = requests.get(self.base_url, params=params)
-        data = response.json()
-        print(data)
+        data = self._request(params)
         
         if 'bestMatches' not in data:
-            return []
+            raise StockAPIUnavailable(f"No search results for {query!r}")
             
         results = []
         for match in data['bestMatches']:
@@ -37,18 +127,22 @@ class StockService:
                 'currency': match['8. currency']
             })
             
+        remember_search_results(results)
         return results
     
     def get_stock_quote(self, symbol):
-        """Get real-time quote for a stock"""
+        """Get real-time quote for a stock, served from the shared quote cache"""
+        return self.quote_cache.get_or_fetch(symbol, self.fetch_stock_quote)
+    
+    def fetch_stock_quote(self, symbol):
+        """Fetch a real-time quote from the API, bypassing the cache"""
         params = {
             'function': 'GLOBAL_QUOTE',
             'symbol': symbol,
             'apikey': self.api_key
         }
         
-        response = requests.get(self.base_url, params=params)
-        data = response.json()
+        data = self._request(params)
         
         if 'Global Quote' not in data or not data['Global Quote']:
             return None
@@ -63,31 +157,108 @@ class StockService:
             'latest_trading_day': quote['07. latest trading day']
         }
 
+    def get_stock_quotes(self, symbols, timeout=None):
+        """Get quotes for several symbols concurrently.
+
+        Returns a dict of symbol to quote. Quotes that are not back within
+        `timeout` seconds (STOCK_QUOTE_FANOUT_TIMEOUT by default) come back
+        as None instead of holding up the rest.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if timeout is None:
+            timeout = settings.STOCK_QUOTE_FANOUT_TIMEOUT
+
+        if len(symbols) < 2 or settings.STOCK_QUOTE_FANOUT_WORKERS < 2:
+            return {symbol: self.get_stock_quote(symbol) for symbol in symbols}
+
+        executor = get_quote_executor()
+        futures = {
+            executor.submit(self.get_stock_quote, symbol): symbol
+            for symbol in symbols
+        }
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+
+        quotes = dict.fromkeys(symbols)
+        for future in done:
+            if future.exception() is None:
+                quotes[futures[future]] = future.result()
+        return quotes
+
     def combine_data(self, query):
         """Search stocks and combine with real-time quotes"""
         matches = self.search_stocks(query)
+        quotes = self.get_stock_quotes([match['symbol'] for match in matches])
         combined_results = []
 
         for match in matches:
-            quote = self.get_stock_quote(match['symbol'])
             combined_results.append({
-                **match,        # Include all details from `search_stocks`
-                'quote': quote  # Include real-time stock quote data
+                **match,                         # Include all details from `search_stocks`
+                'quote': quotes[match['symbol']]  # Real-time quote, None if it missed the deadline
             })
 
         return combined_results
         
-    def get_intraday_data(self, symbol, interval='5min'):
-        """Get intraday time series data"""
+    def get_intraday_data(self, symbol, interval='5min', points=None, method='ohlc'):
+        """Get intraday time series data from the bar store, refreshing it when stale.
+
+        With `points`, the series is downsampled to at most that many bars
+        using OHLC bucketing or LTTB (see stocks.downsampling).
+        """
+        store = IntradayStore(symbol, interval)
+        store.refresh(self.fetch_intraday_data)
+        if points is None:
+            return store.load()
+        return arrays_to_bars(downsample(store.arrays(), points, method))
+    
+    def get_intraday_arrays(self, symbol, interval='5min'):
+        """Get stored intraday bars as oldest-first NumPy arrays, refreshing them when stale"""
+        store = IntradayStore(symbol, interval)
+        store.refresh(self.fetch_intraday_data)
+        return store.arrays()
+    
+    def get_indicators(self, symbol, interval, specs):
+        """Get technical indicators over the stored intraday series.
+
+        `specs` are parsed (spec, name, params) tuples. Results are cached per
+        (symbol, interval, spec) and keyed on the store version, so they are
+        recomputed only after new bars arrive. Values are newest first to
+        line up with get_intraday_data.
+        """
+        store = IntradayStore(symbol, interval)
+        store.refresh(self.fetch_intraday_data)
+        prefix = f"indicators:{store.symbol}:{interval}:{store.version}"
+        
+        keys = {f"{prefix}:{spec}": spec for spec, _, _ in specs}
+        keys[f"{prefix}:timestamp"] = 'timestamp'
+        results = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+        missing = [parsed for parsed in specs if parsed[0] not in results]
+        
+        if missing or 'timestamp' not in results:
+            arrays = store.arrays()
+            computed = {spec: to_json(values) for spec, values in compute(arrays, missing).items()}
+            computed['timestamp'] = arrays['timestamp'][::-1].tolist()
+            cache.set_many(
+                {f"{prefix}:{spec}": value for spec, value in computed.items()},
+                settings.STOCK_INDICATOR_CACHE_TTL
+            )
+            results.update(computed)
+            
+        timestamps = results.pop('timestamp')
+        return {'timestamps': timestamps, 'indicators': results}
+    
+    def fetch_intraday_data(self, symbol, interval='5min', outputsize='compact'):
+        """Fetch intraday bars from the API, bypassing the bar store"""
         params = {
             'function': 'TIME_SERIES_INTRADAY',
             'symbol': symbol,
             'interval': interval,
+            'outputsize': outputsize,
             'apikey': self.api_key
         }
         
-        response = requests.get(self.base_url, params=params)
-        data = response.json()
+        data = self._request(params)
         
         time_series_key = f"Time Series ({interval})"
         if time_series_key not in data:
@@ -99,26 +270,24 @@ class StockService:
         for timestamp, values in time_series.items():
             result.append({
                 'timestamp': timestamp,
-                'open': Decimal(values['1. open']),
-                'high': Decimal(values['2. high']),
-                'low': Decimal(values['3. low']),
-                'close': Decimal(values['4. close']),
+                'open': float(values['1. open']),
+                'high': float(values['2. high']),
+                'low': float(values['3. low']),
+                'close': float(values['4. close']),
                 'volume': int(values['5. volume'])
             })
             
         return result
     
     def update_stock_data(self, stock):
-        """Update stock data in the database"""
+        """Update stock data, queueing the write on the stock write buffer"""
         quote = self.get_stock_quote(stock.symbol)
         
         if not quote:
             return False
             
-        stock.last_price = quote['price']
-        stock.change_percent = quote['change_percent']
-        stock.volume = quote['volume']
-        stock.save()
+        if stock_write_buffer.add(stock, quote):
+            price_updated.send(sender=Stock, symbol=stock.symbol, quote=quote)
         
         return True
         
@@ -130,34 +299,78 @@ class StockService:
             self.update_stock_data(stock)
             return stock
         except Stock.DoesNotExist:
-            # Get stock details
-            search_results = self.search_stocks(symbol)
-            if not search_results:
-                return None
-                
-            # Find exact match
-            stock_data = None
-            for result in search_results:
-                if result['symbol'].upper() == symbol.upper():
-                    stock_data = result
-                    break
-                    
-            if not stock_data:
-                return None
-                
-            # Get quote
-            quote = self.get_stock_quote(symbol)
-            if not quote:
+            stock = self.resolve_symbol(symbol)
+            if stock:
+                stock.save()
+            return stock
+    
+    def get_or_create_stocks(self, symbols, timeout=None):
+        """Get or create several stocks at once, returning {symbol: Stock or None}.
+
+        Known stocks come from one query, without the quote refresh that
+        get_or_create_stock does, since the market data poller keeps them
+        current. Unknown symbols are resolved concurrently and inserted with
+        one bulk_create. Symbols not resolved within `timeout` seconds
+        (STOCK_QUOTE_FANOUT_TIMEOUT by default) map to None.
+        """
+        symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols))
+        if timeout is None:
+            timeout = settings.STOCK_QUOTE_FANOUT_TIMEOUT
+            
+        stocks = dict.fromkeys(symbols)
+        if symbols:
+            for stock in Stock.objects.filter(symbols_filter(symbols)):
+                stocks[stock.symbol.upper()] = stocks[stock.symbol.upper()] or stock
+        unknown = [symbol for symbol, stock in stocks.items() if stock is None]
+        if not unknown:
+            return stocks
+            
+        # Build the index here so resolver threads never have to touch the database
+        get_symbol_index()
+        executor = get_quote_executor()
+        futures = [executor.submit(self.resolve_symbol, symbol) for symbol in unknown]
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+            
+        resolved = [future.result() for future in done if future.exception() is None and future.result()]
+        if resolved:
+            Stock.objects.bulk_create(resolved)
+            # Reload for primary keys, which not every backend sets on bulk_create
+            stocks.update({
+                stock.symbol.upper(): stock
+                for stock in Stock.objects.filter(symbols_filter([stock.symbol for stock in resolved]))
+            })
+        return stocks
+    
+    def resolve_symbol(self, symbol):
+        """Look up a new stock's name and quote, returning an unsaved Stock or None"""
+        # Get stock details from the local index, asking upstream once if it has no exact match
+        def exact(results):
+            return next((result for result in results if result['symbol'].upper() == symbol.upper()), None)
+            
+        stock_data = exact(get_symbol_index().search(symbol))
+        if not stock_data:
+            try:
+                stock_data = exact(self.fetch_search_results(symbol))
+            except StockAPIUnavailable:
                 return None
-                
-            # Create new stock
-            stock = Stock.objects.create(
-                symbol=symbol,
-                name=stock_data['name'],
-                last_price=quote['price'],
-                change_percent=quote['change_percent'],
-                volume=quote['volume'],
-                market_cap=0  # We'll need to get this from a different API endpoint
-            )
+        if not stock_data:
+            return None
+            
+        # Get quote
+        quote = self.get_stock_quote(symbol)
+        if not quote:
+            return None
             
-            return stock
\ No newline at end of file
+        return Stock(
+            symbol=symbol,
+            name=stock_data['name'],
+            last_price=quote['price'],
+            change_percent=quote['change_percent'],
+            volume=quote['volume'],
+            market_cap=0,  # We'll need to get this from a different API endpoint
+            asset_type=stock_data['type'],
+            region=stock_data['region'],
+            currency=stock_data['currency']
+        )
@@ -0,0 +1,32 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .models import Stock, WatchlistItem
+from .search_index import invalidate_symbol_index
+from .subscriptions import user_group_name
+
+# Sent with `symbol` and `quote` whenever a stock's stored price data changes,
+# including bulk paths that bypass post_save
+price_updated = Signal()
+
+
+@receiver(post_save, sender=Stock)
+def stock_saved(sender, instance, created, **kwargs):
+    """Make new stocks searchable from the local index"""
+    if created:
+        invalidate_symbol_index()
+
+
+@receiver(post_save, sender=WatchlistItem)
+@receiver(post_delete, sender=WatchlistItem)
+def watchlist_changed(sender, instance, **kwargs):
+    """Tell the user's open sockets to reload their watchlist"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    group = user_group_name(instance.user_id)
+    transaction.on_commit(
+        lambda: async_to_sync(channel_layer.group_send)(group, {'type': 'watchlist_changed'})
+    )
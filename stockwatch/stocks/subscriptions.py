@@ -0,0 +1,106 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Set of every symbol that has had a live subscriber, so the poller can find
+# them without scanning Stock. Counters in _live_key() stay authoritative and
+# the poller prunes symbols whose counter is gone.
+LIVE_INDEX_KEY = 'live_symbols:index'
+LIVE_INDEX_LOCK_KEY = 'live_symbols:index:lock'
+
+
+def stock_group_name(symbol):
+    """Channel layer group that receives updates for a symbol"""
+    return f"stock_{symbol.strip().upper()}"
+
+
+def user_group_name(user_id):
+    """Channel layer group that receives a user's watchlist changes"""
+    return f"stocks_{user_id}"
+
+
+def _live_key(symbol):
+    return f"live_symbols:{symbol.strip().upper()}"
+
+
+def _binary_key(symbol):
+    return f"binary_symbols:{symbol.strip().upper()}"
+
+
+def _update_live_index(update):
+    """Apply update(symbols) to the live symbol index, under a short lock when it can be had"""
+    for _ in range(20):
+        if cache.add(LIVE_INDEX_LOCK_KEY, 1, 5):
+            break
+        time.sleep(0.01)
+    else:
+        # Writing without the lock beats losing the symbol
+        _write_live_index(update)
+        return
+    try:
+        _write_live_index(update)
+    finally:
+        cache.delete(LIVE_INDEX_LOCK_KEY)
+
+
+def _write_live_index(update):
+    symbols = set(cache.get(LIVE_INDEX_KEY, ()))
+    update(symbols)
+    cache.set(LIVE_INDEX_KEY, symbols, None)
+
+
+def add_live_symbol(symbol):
+    """Count one more live WebSocket subscription to a symbol"""
+    key = _live_key(symbol)
+    cache.add(key, 0, settings.STOCK_LIVE_SUBSCRIPTION_TTL)
+    cache.incr(key)
+    cache.touch(key, settings.STOCK_LIVE_SUBSCRIPTION_TTL)
+
+    symbol = symbol.strip().upper()
+    if symbol not in cache.get(LIVE_INDEX_KEY, ()):
+        _update_live_index(lambda symbols: symbols.add(symbol))
+
+
+def remove_live_symbol(symbol):
+    """Drop one live WebSocket subscription to a symbol"""
+    key = _live_key(symbol)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+
+def live_symbols():
+    """Return the symbols with live subscribers, pruning the others from the index"""
+    indexed = set(cache.get(LIVE_INDEX_KEY, ()))
+    keys = {_live_key(symbol): symbol for symbol in indexed}
+    counts = cache.get_many(list(keys))
+    live = {keys[key] for key, count in counts.items() if count and count > 0}
+    if live != indexed:
+        _update_live_index(lambda symbols: symbols.difference_update(indexed - live))
+    return live
+
+
+def add_binary_subscriber(symbol):
+    """Count one more msgpack socket following a symbol, so its updates are packed too"""
+    key = _binary_key(symbol)
+    cache.add(key, 0, settings.STOCK_LIVE_SUBSCRIPTION_TTL)
+    cache.incr(key)
+    cache.touch(key, settings.STOCK_LIVE_SUBSCRIPTION_TTL)
+
+
+def remove_binary_subscriber(symbol):
+    key = _binary_key(symbol)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+
+def binary_symbols(symbols):
+    """Return which of `symbols` have msgpack subscribers"""
+    keys = {_binary_key(symbol): symbol.strip().upper() for symbol in symbols}
+    counts = cache.get_many(list(keys))
+    return {keys[key] for key, count in counts.items() if count and count > 0}
@@ -0,0 +1,8 @@
+from celery import shared_task
+from .poller import MarketDataPoller
+
+@shared_task
+def poll_market_data():
+    """Task to refresh every tracked symbol once - to be run periodically"""
+    poller = MarketDataPoller()
+    return poller.poll()
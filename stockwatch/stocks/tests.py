@@ -1,8 +1,30 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
-from stocks.models import Stock, WatchlistItem
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from stocks.buffer import StockWriteBuffer, stock_write_buffer
+from stocks.cache import QuoteCache, SearchCache
+from stocks.checks import check_shared_cache, check_shared_channel_layer
+from stocks.intraday import IntradayStore
+from stocks.poller import MarketDataPoller
+from stocks.models import IntradayBar, Stock, WatchlistItem
+from stocks.ratelimit import Priority, RateLimiter, RateLimitExceeded
+from stocks.search_index import SymbolIndex, invalidate_symbol_index
 from stocks.services import StockService
+from stocks.subscriptions import LIVE_INDEX_KEY, add_live_symbol, live_symbols, remove_live_symbol, stock_group_name
+from stocks.transport import RequestsTransport, TransportError
 
 class StockViewSetTestCase(APITestCase):
     """Test cases for StockViewSet"""
@@ -91,4 +113,650 @@ class WatchlistViewSetTestCase(APITestCase):
         WatchlistItem.objects.create(user=self.user, stock=self.stock)
         response = self.client.get('/api/watchlist/')
         self.assertResponse(response, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
\ No newline at end of file
+        self.assertEqual(len(response.data), 1)
+
+
+class QuoteCacheTestCase(TestCase):
+    """Test cases for QuoteCache"""
+
+    def setUp(self):
+        cache.clear()
+        self.quote_cache = QuoteCache(ttl=60)
+        self.calls = []
+
+    def fetch(self, symbol):
+        self.calls.append(symbol)
+        time.sleep(0.1)
+        return {'symbol': symbol, 'price': Decimal('150.00')}
+
+    def test_hit_after_miss(self):
+        """Test a second read is served from the cache"""
+        self.quote_cache.get_or_fetch('AAPL', self.fetch)
+        quote = self.quote_cache.get_or_fetch('aapl ', self.fetch)
+        self.assertEqual(quote['price'], Decimal('150.00'))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_concurrent_misses_fetch_once(self):
+        """Test concurrent misses for one symbol collapse into a single fetch"""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.quote_cache.get_or_fetch('AAPL', self.fetch)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(quote['symbol'] == 'AAPL' for quote in results))
+
+    def test_invalidate(self):
+        """Test invalidating a symbol forces a new fetch"""
+        self.quote_cache.get_or_fetch('AAPL', self.fetch)
+        self.quote_cache.invalidate('AAPL')
+        self.quote_cache.get_or_fetch('AAPL', self.fetch)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_missing_quote_is_cached_briefly(self):
+        """Test a symbol without a quote is not refetched within the negative TTL"""
+        def fetch(symbol):
+            self.calls.append(symbol)
+            return None
+
+        self.assertIsNone(self.quote_cache.get_or_fetch('NOPE', fetch))
+        self.assertIsNone(self.quote_cache.get_or_fetch('NOPE', fetch))
+        self.assertIsNone(self.quote_cache.get('NOPE'))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_waiter_does_not_release_foreign_lock(self):
+        """Test a caller that times out waiting leaves the other worker's lock alone"""
+        quote_cache = QuoteCache(ttl=60, lock_timeout=0.1)
+        lock_key = f"{quote_cache.make_key('AAPL')}:lock"
+        cache.set(lock_key, 'other-worker', 60)
+
+        quote = quote_cache.get_or_fetch('AAPL', self.fetch)
+
+        self.assertEqual(quote['symbol'], 'AAPL')
+        self.assertEqual(cache.get(lock_key), 'other-worker')
+
+    def test_owned_lock_is_released(self):
+        """Test the fetching caller removes its own lock afterwards"""
+        self.quote_cache.get_or_fetch('AAPL', self.fetch)
+        self.assertIsNone(cache.get(f"{self.quote_cache.make_key('AAPL')}:lock"))
+
+
+class CombineDataTestCase(TestCase):
+    """Test cases for StockService.combine_data fan-out"""
+
+    def fake_quote(self, symbol):
+        time.sleep(1 if symbol == 'SLOW' else 0.05)
+        return {'symbol': symbol, 'price': Decimal('10.00')}
+
+    def test_slow_quotes_return_none(self):
+        """Test quotes missing the deadline come back as None without blocking"""
+        matches = [{'symbol': symbol, 'name': symbol} for symbol in ('AAPL', 'SLOW', 'TSLA')]
+        with mock.patch.object(StockService, 'search_stocks', lambda _, query: matches), \
+                mock.patch.object(StockService, 'get_stock_quote', lambda _, symbol: self.fake_quote(symbol)), \
+                self.settings(STOCK_QUOTE_FANOUT_TIMEOUT=0.5):
+            started = time.monotonic()
+            results = StockService().combine_data('a')
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.9)
+        quotes = {result['symbol']: result['quote'] for result in results}
+        self.assertIsNone(quotes['SLOW'])
+        self.assertEqual(quotes['AAPL']['price'], Decimal('10.00'))
+        self.assertEqual(quotes['TSLA']['price'], Decimal('10.00'))
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """Stub stock API that replays the server's queued (status, body) responses"""
+
+    def do_GET(self):
+        status_code, body = self.server.responses.pop(0)
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class RequestsTransportTestCase(TestCase):
+    """Test cases for RequestsTransport against a local stub server"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubAPIHandler)
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/query'
+        self.transport = RequestsTransport(max_retries=2, backoff_base=0, read_timeout=1)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_server_errors(self):
+        """Test 5xx responses are retried until a good response arrives"""
+        self.server.responses = [(503, {}), (502, {}), (200, {'Global Quote': {}})]
+        self.assertEqual(self.transport.get_json(self.url, {}), {'Global Quote': {}})
+        self.assertEqual(self.server.responses, [])
+
+    def test_gives_up_after_max_retries(self):
+        """Test a persistent 5xx raises TransportError"""
+        self.server.responses = [(500, {})] * 3
+        with self.assertRaises(TransportError):
+            self.transport.get_json(self.url, {})
+
+    def test_client_errors_are_not_retried(self):
+        """Test 4xx responses fail immediately"""
+        self.server.responses = [(404, {}), (200, {})]
+        with self.assertRaises(TransportError):
+            self.transport.get_json(self.url, {})
+        self.assertEqual(len(self.server.responses), 1)
+
+
+class RateLimiterTestCase(TestCase):
+    """Test cases for the shared stock API rate limiter"""
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = RateLimiter(
+            per_minute=10, per_day=100,
+            shares={Priority.INTERACTIVE: 1.0, Priority.ALERT: 0.8, Priority.BACKGROUND: 0.5},
+            max_wait={},
+        )
+
+    def drain(self, priority):
+        admitted = 0
+        while self.limiter.try_acquire(priority) is None:
+            admitted += 1
+        return admitted
+
+    def test_priority_shares(self):
+        """Test lower priorities stop early and leave budget for interactive calls"""
+        self.assertEqual(self.drain(Priority.BACKGROUND), 5)
+        self.assertEqual(self.drain(Priority.ALERT), 3)
+        self.assertEqual(self.drain(Priority.INTERACTIVE), 2)
+
+    def test_shed_when_exhausted(self):
+        """Test calls over budget are shed when they may not wait"""
+        self.drain(Priority.INTERACTIVE)
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.acquire(Priority.INTERACTIVE)
+
+    def test_block(self):
+        """Test blocking the limiter stops all calls"""
+        self.limiter.block(30)
+        self.assertIsNotNone(self.limiter.try_acquire(Priority.INTERACTIVE))
+
+    def test_process_local_cache_is_flagged(self):
+        """Test a warning is raised when the limiter's cache is private to each process"""
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with self.settings(CACHES=locmem):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['stocks.W001'])
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_process_local_channel_layer_is_flagged(self):
+        """Test a warning is raised when the poller's events cannot reach other processes"""
+        in_memory = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+        redis = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': ['redis://']}}}
+        with self.settings(CHANNEL_LAYERS=in_memory):
+            self.assertEqual([warning.id for warning in check_shared_channel_layer(None)], ['stocks.W002'])
+        with self.settings(CHANNEL_LAYERS=redis):
+            self.assertEqual(check_shared_channel_layer(None), [])
+
+
+class MarketDataPollerTestCase(TestCase):
+    """Test cases for the shared market data poller"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.aapl = Stock.objects.create(
+            symbol='AAPL', name='Apple Inc', last_price=Decimal('150.00'),
+            change_percent=Decimal('0.50'), volume=1000
+        )
+        self.tsla = Stock.objects.create(
+            symbol='TSLA', name='Tesla Inc', last_price=Decimal('200.00'),
+            change_percent=Decimal('1.00'), volume=2000
+        )
+        self.msft = Stock.objects.create(
+            symbol='MSFT', name='Microsoft', last_price=Decimal('300.00'),
+            change_percent=Decimal('0.10'), volume=3000
+        )
+        WatchlistItem.objects.create(user=self.user, stock=self.aapl)
+        self.fetched = []
+        self.timeouts = []
+
+    def patch_quotes(self):
+        return mock.patch.object(
+            StockService, 'get_stock_quotes', lambda _, symbols, timeout=None: self.fake_quotes(symbols, timeout)
+        )
+
+    def fake_quotes(self, symbols, timeout=None):
+        self.fetched.append(sorted(symbols))
+        self.timeouts.append(timeout)
+        return {
+            # Quotes carry 4 decimals, Stock stores 2
+            symbol: {'symbol': symbol, 'price': Decimal('155.0000'), 'change_percent': Decimal('3.3254'), 'volume': 5000}
+            for symbol in symbols
+        }
+
+    def test_tracks_watchlist_and_live_symbols(self):
+        """Test only watched or subscribed symbols are polled, once each"""
+        add_live_symbol('TSLA')
+        self.addCleanup(remove_live_symbol, 'TSLA')
+        with self.patch_quotes():
+            MarketDataPoller().poll()
+        self.assertEqual(self.fetched, [['AAPL', 'TSLA']])
+        self.assertEqual(self.timeouts, [settings.STOCK_POLL_QUOTE_TIMEOUT])
+        self.msft.refresh_from_db()
+        self.assertEqual(self.msft.last_price, Decimal('300.00'))
+
+    def test_unsubscribed_symbols_leave_the_index(self):
+        """Test symbols whose last live subscriber left stop being polled"""
+        add_live_symbol('TSLA')
+        self.assertEqual(live_symbols(), {'TSLA'})
+        remove_live_symbol('TSLA')
+        self.assertEqual(live_symbols(), set())
+        self.assertEqual(cache.get(LIVE_INDEX_KEY), set())
+        with self.patch_quotes():
+            MarketDataPoller().poll()
+        self.assertEqual(self.fetched, [['AAPL']])
+
+    def test_writes_and_publishes_changes(self):
+        """Test changed quotes are saved and sent to the symbol's group"""
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(stock_group_name('AAPL'), channel_name)
+
+        with self.patch_quotes():
+            self.assertEqual(MarketDataPoller().poll(), 1)
+            self.assertEqual(MarketDataPoller().poll(), 0)
+
+        self.aapl.refresh_from_db()
+        self.assertEqual((self.aapl.last_price, self.aapl.change_percent), (Decimal('155.00'), Decimal('3.33')))
+        message = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual((message['type'], message['symbol']), ('stock_update', 'AAPL'))
+        self.assertEqual(json.loads(message['text'])['stock']['last_price'], 155.0)
+        self.assertEqual(message['prices'], [155.0, 3.33])
+        self.assertEqual(message['moved'], ['stock__last_price', 'stock__change_percent'])
+        self.assertEqual(json.loads(message['delta_text'])['stocks'][0]['stock__change_percent'], 3.33)
+
+
+class IntradayStoreTestCase(TestCase):
+    """Test cases for the persistent intraday bar store"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+        self.responses = [
+            [self.bar('2025-04-01 09:35:00', 11), self.bar('2025-04-01 09:30:00', 10)],
+            [self.bar('2025-04-01 09:40:00', 12), self.bar('2025-04-01 09:35:00', 11.5)],
+        ]
+
+    def bar(self, timestamp, close):
+        return {'timestamp': timestamp, 'open': 10.0, 'high': 12.0, 'low': 9.0, 'close': close, 'volume': 100}
+
+    def fetch(self, symbol, interval, outputsize):
+        self.calls.append(outputsize)
+        return self.responses.pop(0)
+
+    def test_full_then_compact_merge(self):
+        """Test the first refresh downloads everything and later ones merge the tail"""
+        store = IntradayStore('aapl', '5min')
+        self.assertEqual(store.refresh(self.fetch), 2)
+        version = store.version
+
+        cache.delete(f'{store.cache_key}:fresh')
+        self.assertEqual(store.refresh(self.fetch), 2)
+        self.assertEqual(self.calls, ['full', 'compact'])
+        self.assertNotEqual(store.version, version)
+
+        bars = store.load()
+        self.assertEqual([bar['timestamp'][-8:] for bar in bars], ['09:40:00', '09:35:00', '09:30:00'])
+        self.assertEqual(bars[1]['close'], 11.5)
+        self.assertEqual(IntradayBar.objects.filter(symbol='AAPL').count(), 3)
+
+    def test_version_follows_stored_bars(self):
+        """Test the version is the same for any process and changes when the latest bar does"""
+        store = IntradayStore('AAPL', '5min')
+        store.refresh(self.fetch)
+        version = store.version
+        self.assertEqual(IntradayStore('aapl', '5min').version, version)
+        cache.clear()
+        self.assertEqual(store.version, version)
+
+        store.merge([self.bar('2025-04-01 09:35:00', 11.25)], '2025-04-01 09:35:00')
+        self.assertNotEqual(store.version, version)
+
+    def test_fresh_store_skips_upstream(self):
+        """Test repeat loads within an interval are served from the store"""
+        store = IntradayStore('AAPL', '5min')
+        store.refresh(self.fetch)
+        self.assertEqual(store.refresh(self.fetch), 0)
+        self.assertEqual(self.calls, ['full'])
+
+    def test_gap_fetches_full_series(self):
+        """Test the full series is fetched again only when the compact tail leaves a gap"""
+        store = IntradayStore('AAPL', '5min')
+        store.refresh(self.fetch)
+
+        # Overnight the compact tail still reaches the stored bars
+        cache.delete(f'{store.cache_key}:fresh')
+        self.responses = [[self.bar('2025-04-02 09:30:00', 12), self.bar('2025-04-01 09:35:00', 11)]]
+        self.assertEqual(store.refresh(self.fetch), 1)
+        self.assertEqual(self.calls, ['full', 'compact'])
+
+        cache.delete(f'{store.cache_key}:fresh')
+        self.responses = [
+            [self.bar('2025-04-07 09:30:00', 13), self.bar('2025-04-04 15:55:00', 12.5)],
+            [self.bar('2025-04-07 09:30:00', 13), self.bar('2025-04-04 15:55:00', 12.5),
+             self.bar('2025-04-03 15:55:00', 12.25)],
+        ]
+        self.assertEqual(store.refresh(self.fetch), 3)
+        self.assertEqual(self.calls, ['full', 'compact', 'compact', 'full'])
+        self.assertEqual(store.bars().count(), 6)
+
+
+class IndicatorsTestCase(APITestCase):
+    """Test cases for the intraday indicators endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.stock = Stock.objects.create(
+            symbol='AAPL', name='Apple Inc', last_price=Decimal('150.00'),
+            change_percent=Decimal('0.50'), volume=1000
+        )
+        IntradayBar.objects.bulk_create([
+            IntradayBar(symbol='AAPL', interval='5min', timestamp=f'2025-04-01 09:{30 + 5 * i}:00',
+                        open=close, high=close, low=close, close=close, volume=100)
+            for i, close in enumerate([1.0, 2.0, 3.0, 4.0, 5.0])
+        ])
+        patcher = mock.patch.object(IntradayStore, 'refresh', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sma(self):
+        """Test SMA values come back newest first with None before the window fills"""
+        response = self.client.get(f'/api/stocks/{self.stock.id}/indicators/', {'indicators': 'sma:2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['indicators']['sma:2'], [4.5, 3.5, 2.5, 1.5, None])
+        self.assertEqual(response.data['timestamps'][0], '2025-04-01 09:50:00')
+
+    def test_new_bars_invalidate_cache(self):
+        """Test cached results are recomputed once the store version changes"""
+        url = f'/api/stocks/{self.stock.id}/indicators/'
+        self.client.get(url, {'indicators': 'sma:2'})
+        IntradayStore('AAPL', '5min').merge([
+            {'timestamp': '2025-04-01 09:55:00', 'open': 7.0, 'high': 7.0, 'low': 7.0, 'close': 7.0, 'volume': 100}
+        ], '2025-04-01 09:50:00')
+        response = self.client.get(url, {'indicators': 'sma:2,rsi'})
+        self.assertEqual(response.data['indicators']['sma:2'][0], 6.0)
+        self.assertIn('rsi:14', response.data['indicators'])
+
+    def test_unknown_indicator(self):
+        """Test unknown indicators are rejected"""
+        response = self.client.get(f'/api/stocks/{self.stock.id}/indicators/', {'indicators': 'macd'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IntradayDownsamplingTestCase(APITestCase):
+    """Test cases for downsampled intraday payloads"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.stock = Stock.objects.create(
+            symbol='AAPL', name='Apple Inc', last_price=Decimal('150.00'),
+            change_percent=Decimal('0.50'), volume=1000
+        )
+        IntradayBar.objects.bulk_create([
+            IntradayBar(symbol='AAPL', interval='1min', timestamp=f'2025-04-01 {10 + i // 60}:{i % 60:02d}:00',
+                        open=100 + i, high=101 + i, low=99 + i, close=100.5 + i, volume=10)
+            for i in range(120)
+        ])
+        patcher = mock.patch.object(IntradayStore, 'refresh', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = f'/api/stocks/{self.stock.id}/intraday/'
+
+    def test_ohlc_buckets(self):
+        """Test OHLC bucketing bounds the payload and keeps extremes and volume"""
+        response = self.client.get(self.url, {'interval': '1min', 'points': 12})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 12)
+        self.assertEqual(response.data[0]['high'], 220.0)
+        self.assertEqual(response.data[-1]['low'], 99.0)
+        self.assertEqual(sum(bar['volume'] for bar in response.data), 1200)
+
+    def test_lttb_keeps_endpoints(self):
+        """Test LTTB keeps the first and last bars"""
+        response = self.client.get(self.url, {'interval': '1min', 'points': 10, 'method': 'lttb'})
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(response.data[0]['timestamp'], '2025-04-01 11:59:00')
+        self.assertEqual(response.data[-1]['timestamp'], '2025-04-01 10:00:00')
+
+    def test_invalid_points(self):
+        """Test out-of-range point counts are rejected"""
+        response = self.client.get(self.url, {'interval': '1min', 'points': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SymbolIndexTestCase(TestCase):
+    """Test cases for the local symbol search index"""
+
+    def setUp(self):
+        cache.clear()
+        self.index = SymbolIndex([
+            ('AAPL', 'Apple Inc', 'Equity', 'United States', 'USD'),
+            ('AAP', 'Advance Auto Parts Inc', 'Equity', 'United States', 'USD'),
+            ('APLE', 'Apple Hospitality REIT Inc', 'Equity', 'United States', 'USD'),
+            ('MSFT', 'Microsoft Corporation', 'Equity', 'United States', 'USD'),
+        ])
+
+    def test_symbol_prefix(self):
+        """Test symbol prefixes match, shortest symbol first"""
+        symbols = [result['symbol'] for result in self.index.search('aap')]
+        self.assertEqual(symbols[:2], ['AAP', 'AAPL'])
+
+    def test_name_words(self):
+        """Test every query word must prefix a word in the name"""
+        self.assertEqual([r['symbol'] for r in self.index.search('apple hosp')], ['APLE'])
+        self.assertEqual({r['symbol'] for r in self.index.search('Apple')}, {'AAPL', 'APLE'})
+
+    def test_miss(self):
+        """Test unknown queries return nothing"""
+        self.assertEqual(self.index.search('zzzz'), [])
+
+    def upstream(self, *symbols):
+        return [
+            {'symbol': symbol, 'name': symbol, 'type': 'Equity', 'region': 'United States', 'currency': 'USD'}
+            for symbol in symbols
+        ]
+
+    def test_search_stocks_uses_index(self):
+        """Test StockService skips upstream when the listings file answers the query well enough"""
+        listings = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        listings.write('symbol,name,exchange,assetType\nTSLA,Tesla Inc,NASDAQ,Stock\n')
+        listings.close()
+        self.addCleanup(os.remove, listings.name)
+        invalidate_symbol_index()
+        with self.settings(STOCK_LISTINGS_FILE=listings.name), \
+                mock.patch.object(StockService, 'fetch_search_results', return_value=[]) as fetch:
+            self.assertEqual(StockService().search_stocks('tsla')[0]['symbol'], 'TSLA')
+            fetch.assert_not_called()
+            StockService().search_stocks('nothing like it')
+            fetch.assert_called_once_with('NOTHING LIKE IT')
+        invalidate_symbol_index()
+
+    def test_search_without_listings_asks_upstream(self):
+        """Test partial matches among stored stocks do not hide other upstream symbols"""
+        Stock.objects.create(
+            symbol='AAPL', name='Apple Inc', last_price=Decimal('150.00'),
+            change_percent=Decimal('1.00'), volume=2000
+        )
+        Stock.objects.create(
+            symbol='SAP', name='SAP SE', last_price=Decimal('250.00'), change_percent=Decimal('1.00'),
+            volume=2000, region='Frankfurt', currency='EUR'
+        )
+        invalidate_symbol_index()
+        with mock.patch.object(StockService, 'fetch_search_results', return_value=self.upstream('AAL', 'AAPL')):
+            self.assertEqual([result['symbol'] for result in StockService().search_stocks('aa')], ['AAPL', 'AAL'])
+            sap = StockService().search_stocks('sap se')[0]
+        self.assertEqual((sap['region'], sap['currency']), ('Frankfurt', 'EUR'))
+        invalidate_symbol_index()
+
+    def test_upstream_results_seed_index(self):
+        """Test symbols returned by upstream search serve later prefix queries locally"""
+        invalidate_symbol_index()
+        matches = [
+            {'1. symbol': symbol, '2. name': name, '3. type': 'Equity', '4. region': 'United States',
+             '8. currency': 'USD'}
+            for symbol, name in (('NVDA', 'NVIDIA Corp'), ('NVDL', 'GraniteShares 2x Long NVDA'),
+                                 ('NVDS', 'AXS 1.25X NVDA Bear'))
+        ]
+        with mock.patch.object(StockService, '_request', return_value={'bestMatches': matches}) as request:
+            StockService().search_stocks('nvd')
+            results = StockService().search_stocks('nv')
+        request.assert_called_once()
+        self.assertEqual([result['symbol'] for result in results], ['NVDA', 'NVDL', 'NVDS'])
+        invalidate_symbol_index()
+
+    def test_resolve_symbol_asks_upstream_once(self):
+        """Test resolving a symbol unknown to the index makes a single upstream search"""
+        invalidate_symbol_index()
+        quote = {'price': Decimal('10.00'), 'change_percent': Decimal('1.00'), 'volume': 100}
+        with mock.patch.object(StockService, 'fetch_search_results', return_value=self.upstream('NEWCO')) as fetch, \
+                mock.patch.object(StockService, 'get_stock_quote', return_value=quote):
+            stock = StockService().resolve_symbol('NEWCO')
+        self.assertEqual(stock.symbol, 'NEWCO')
+        fetch.assert_called_once_with('NEWCO')
+        invalidate_symbol_index()
+
+
+class SearchCacheTestCase(TestCase):
+    """Test cases for the search result cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.search_cache = SearchCache(ttl=60, negative_ttl=1)
+        self.queries = []
+
+    def fetch(self, query):
+        self.queries.append(query)
+        return [{'symbol': 'AAPL'}] if query.startswith('AAPL') else []
+
+    def test_normalized_queries_share_entry(self):
+        """Test trivially different queries hit the same entry"""
+        for query in ('aapl', 'AAPL ', 'Aapl'):
+            self.search_cache.get_or_fetch(query, self.fetch)
+        self.assertEqual(self.queries, ['AAPL'])
+        self.assertEqual(self.search_cache.stats()['hits'], 2)
+        self.assertEqual(self.search_cache.stats()['misses'], 1)
+
+    def test_negative_results_expire_sooner(self):
+        """Test empty results are cached under the negative TTL"""
+        self.search_cache.get_or_fetch('zzzz', self.fetch)
+        self.search_cache.get_or_fetch('zzzz', self.fetch)
+        self.assertEqual(self.search_cache.stats()['negative_hits'], 1)
+        time.sleep(1.1)
+        self.search_cache.get_or_fetch('zzzz', self.fetch)
+        self.assertEqual(self.queries, ['ZZZZ', 'ZZZZ'])
+
+    def test_upstream_failures_are_not_cached(self):
+        """Test a shed or failed upstream search is retried instead of cached as empty"""
+        service = StockService()
+        with mock.patch.object(StockService, '_request', return_value={}) as request:
+            self.assertEqual(service.search_stocks('zzzz'), [])
+            self.assertEqual(service.search_stocks('zzzz'), [])
+        self.assertEqual(request.call_count, 2)
+
+        with mock.patch.object(StockService, '_request', return_value={'bestMatches': []}) as request:
+            service.search_stocks('zzzz')
+            service.search_stocks('zzzz')
+        self.assertEqual(request.call_count, 1)
+
+
+class StockWriteBufferTestCase(TestCase):
+    """Test cases for buffered Stock price writes"""
+
+    def setUp(self):
+        self.stocks = [
+            Stock.objects.create(symbol=symbol, name=symbol, last_price=Decimal('100.00'),
+                                 change_percent=Decimal('0.00'), volume=1000)
+            for symbol in ('AAPL', 'MSFT', 'GOOG')
+        ]
+        self.quote = {'price': Decimal('101.00'), 'change_percent': Decimal('1.00'), 'volume': 1500}
+
+    def test_unchanged_quotes_are_dropped(self):
+        """Test a quote matching the stored values queues nothing"""
+        buffer = StockWriteBuffer(max_size=10, max_age=60)
+        unchanged = {'price': Decimal('100.00'), 'change_percent': Decimal('0.00'), 'volume': 1000}
+        with self.assertNumQueries(0):
+            self.assertFalse(buffer.add(self.stocks[0], unchanged))
+        self.assertEqual(len(buffer), 0)
+
+    def test_quotes_are_compared_at_stored_precision(self):
+        """Test 4 decimal quotes that round to the stored values queue nothing"""
+        buffer = StockWriteBuffer(max_size=10, max_age=60)
+        quote = {'price': Decimal('101.0049'), 'change_percent': Decimal('0.6502'), 'volume': 1500}
+        self.assertTrue(buffer.add(self.stocks[0], quote))
+        self.assertEqual((self.stocks[0].last_price, self.stocks[0].change_percent),
+                         (Decimal('101.00'), Decimal('0.65')))
+        buffer.flush()
+
+        stock = Stock.objects.get(pk=self.stocks[0].pk)
+        self.assertFalse(buffer.add(stock, quote))
+        self.assertFalse(buffer.add(stock, dict(quote, change_percent=Decimal('0.6498'))))
+        self.assertTrue(buffer.add(stock, dict(quote, change_percent=Decimal('0.6551'))))
+
+    def test_flush_on_size(self):
+        """Test pending rows are written in one bulk_update once the buffer is full"""
+        buffer = StockWriteBuffer(max_size=3, max_age=60)
+        with self.assertNumQueries(0):
+            self.assertTrue(buffer.add(self.stocks[0], self.quote))
+            buffer.add(self.stocks[0], dict(self.quote, price=Decimal('102.00')))
+            buffer.add(self.stocks[1], self.quote)
+        self.assertEqual(len(buffer), 2)
+        with self.assertNumQueries(1):
+            buffer.add(self.stocks[2], self.quote)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Stock.objects.get(symbol='AAPL').last_price, Decimal('102.00'))
+        self.assertEqual(Stock.objects.filter(volume=1500).count(), 3)
+
+    def test_flush_on_age(self):
+        """Test a change older than max_age is written by the timer"""
+        buffer = StockWriteBuffer(max_size=10, max_age=0.05)
+        # The timer flushes from its own thread, outside this test's transaction
+        with mock.patch.object(Stock.objects, 'bulk_update') as bulk_update, \
+                mock.patch('stocks.buffer.connection'):
+            buffer.add(self.stocks[0], self.quote)
+            time.sleep(0.3)
+        bulk_update.assert_called_once()
+        self.assertEqual(bulk_update.call_args.args[1], StockWriteBuffer.fields)
+        self.assertEqual(len(buffer), 0)
+
+    def test_update_stock_data_skips_unchanged(self):
+        """Test refreshing an unchanged stock writes nothing and sends no signal"""
+        self.addCleanup(stock_write_buffer.flush)
+        quote = {'symbol': 'AAPL', 'price': Decimal('100.00'), 'change': Decimal('0.00'),
+                 'change_percent': Decimal('0.00'), 'volume': 1000}
+        with mock.patch.object(StockService, 'fetch_stock_quote', return_value=quote), \
+                mock.patch('stocks.services.price_updated.send') as send:
+            cache.clear()
+            with self.assertNumQueries(0):
+                self.assertTrue(StockService().update_stock_data(self.stocks[0]))
+        send.assert_not_called()
+
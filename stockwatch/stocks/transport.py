@@ -0,0 +1,114 @@
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class TransportError(Exception):
+    """Raised when the stock API could not be reached after all retries"""
+
+
+class Transport:
+    """Interface used by StockService to talk to the stock API.
+
+    Implementations take a URL and query parameters and return the decoded
+    JSON body, raising TransportError when the request ultimately fails.
+    """
+
+    def get_json(self, url, params):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """Pooled keep-alive transport built on a shared requests.Session.
+
+    Connection and read timeouts are always applied, and connection errors,
+    timeouts and 5xx responses are retried with jittered exponential backoff.
+    """
+
+    retry_statuses = frozenset({500, 502, 503, 504})
+
+    def __init__(self, connect_timeout=None, read_timeout=None, max_retries=None,
+                 backoff_base=None, backoff_max=None, pool_size=None):
+        self.timeout = (
+            settings.STOCK_API_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout,
+            settings.STOCK_API_READ_TIMEOUT if read_timeout is None else read_timeout,
+        )
+        self.max_retries = settings.STOCK_API_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = settings.STOCK_API_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = settings.STOCK_API_BACKOFF_MAX if backoff_max is None else backoff_max
+        pool_size = settings.STOCK_API_POOL_SIZE if pool_size is None else pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, url, params):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code not in self.retry_statuses:
+                    response.raise_for_status()
+                    return response.json()
+                error = TransportError(f"Stock API returned HTTP {response.status_code}")
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = TransportError(f"Stock API request failed: {exc}")
+            except (requests.RequestException, ValueError) as exc:
+                raise TransportError(f"Stock API request failed: {exc}") from exc
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            delay = self.backoff_delay(attempt)
+            logger.warning("%s, retrying in %.2fs (attempt %d/%d)", error, delay, attempt, self.max_retries)
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff for the given retry attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def close(self):
+        self.session.close()
+
+
+_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Return the process-wide transport configured by STOCK_API_TRANSPORT.
+
+    The transport is rebuilt after a fork so pooled connections are never
+    shared between worker processes.
+    """
+    global _transport, _transport_pid
+    pid = os.getpid()
+    if _transport is None or _transport_pid != pid:
+        with _transport_lock:
+            if _transport is None or _transport_pid != pid:
+                _transport = import_string(settings.STOCK_API_TRANSPORT)()
+                _transport_pid = pid
+    return _transport
+
+
+def set_transport(transport):
+    """Replace the process-wide transport, e.g. with a stub in tests"""
+    global _transport, _transport_pid
+    with _transport_lock:
+        if _transport is not None and _transport is not transport:
+            _transport.close()
+        _transport = transport
+        _transport_pid = os.getpid() if transport is not None else None
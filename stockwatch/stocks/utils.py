@@ -0,0 +1,9 @@
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+
+
+def to_decimal(value):
+    """Convert Decimal128 values read back from MongoDB to Decimal"""
+    if isinstance(value, Decimal128):
+        return Decimal(value.to_decimal())
+    return value
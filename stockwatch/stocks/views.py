@@ -5,6 +5,9 @@ from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from .models import Stock, WatchlistItem
 from .serializers import StockSerializer, WatchlistItemSerializer
+from .downsampling import MAX_POINTS, METHODS, MIN_POINTS
+from .indicators import IndicatorError, parse_spec
+from .intraday import INTERVALS
 from .services import StockService
 
 class StockViewSet(viewsets.ReadOnlyModelViewSet):
@@ -59,9 +62,30 @@ class StockViewSet(viewsets.ReadOnlyModelViewSet):
         """Get intraday data for a stock"""
         stock = self.get_object()
         interval = request.query_params.get('interval', '5min')
+        if interval not in INTERVALS:
+            return Response(
+                {'error': f"Interval must be one of {', '.join(INTERVALS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Optional server-side downsampling, e.g. ?points=300&method=lttb
+        params = {}
+        if request.query_params.get('points'):
+            method = request.query_params.get('method', 'ohlc')
+            try:
+                points = int(request.query_params['points'])
+            except ValueError:
+                points = 0
+            if not MIN_POINTS <= points <= MAX_POINTS or method not in METHODS:
+                return Response(
+                    {'error': f"points must be between {MIN_POINTS} and {MAX_POINTS} "
+                              f"and method one of {', '.join(METHODS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            params = {'points': points, 'method': method}
         
         service = StockService()
-        data = service.get_intraday_data(stock.symbol, interval)
+        data = service.get_intraday_data(stock.symbol, interval, **params)
         
         if not data:
             return Response(
@@ -70,6 +94,41 @@ class StockViewSet(viewsets.ReadOnlyModelViewSet):
             )
             
         return Response(data)
+    
+    @action(detail=True, methods=['get'])
+    def indicators(self, request, pk=None):
+        """Get technical indicators over a stock's intraday data"""
+        stock = self.get_object()
+        interval = request.query_params.get('interval', '5min')
+        if interval not in INTERVALS:
+            return Response(
+                {'error': f"Interval must be one of {', '.join(INTERVALS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        # e.g. ?indicators=sma:20,ema:12,rsi,bollinger:20:2,vwap,volatility:30
+        requested = request.query_params.get('indicators', '')
+        try:
+            specs = [parse_spec(spec) for spec in requested.split(',') if spec.strip()]
+        except IndicatorError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            
+        if not specs:
+            return Response(
+                {'error': 'At least one indicator is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        service = StockService()
+        data = service.get_indicators(stock.symbol, interval, list(dict.fromkeys(specs)))
+        
+        if not data['timestamps']:
+            return Response(
+                {'error': 'Could not retrieve intraday data for this stock'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+            
+        return Response(data)
 
 class WatchlistViewSet(viewsets.ModelViewSet):
     """API endpoint for user watchlist"""
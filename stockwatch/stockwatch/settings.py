@@ -87,12 +87,6 @@ TEMPLATES = [
 WSGI_APPLICATION = 'stockwatch.wsgi.application'
 ASGI_APPLICATION = 'stockwatch.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
-
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -107,6 +101,56 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# The API rate limiter, the alert sweep and dispatch locks and the hourly email caps
+# must be shared by the web, worker and beat processes, so the cache defaults to the
+# same Redis as the Celery broker. Set REDIS_URL to an empty value only for a single
+# process setup, where the local memory cache is used instead.
+REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {
+                'MAX_ENTRIES': env('CACHE_MAX_ENTRIES', default=10000, cast=int),
+            },
+        }
+    }
+
+# Channel layer
+# https://channels.readthedocs.io/en/stable/topics/channel_layers.html
+
+# Price updates are published by the Celery worker and live subscriptions are counted
+# across processes, so the channel layer uses the same Redis. Without REDIS_URL the
+# in-memory layer only reaches sockets in the same process, and each socket falls back
+# to polling the database every WS_FALLBACK_POLL_INTERVAL seconds.
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -173,7 +217,7 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 # Email settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -183,3 +227,120 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', env('EMAIL_HOST_PASS
 # Stock API settings
 STOCK_API_KEY = os.environ.get('STOCK_API_KEY', env('STOCK_API_KEY'))
 STOCK_API_BASE_URL = 'https://www.alphavantage.co/query'
+
+# Quote cache settings
+STOCK_QUOTE_CACHE_ALIAS = 'default'
+STOCK_QUOTE_CACHE_TTL = env('STOCK_QUOTE_CACHE_TTL', default=60, cast=int)  # seconds
+STOCK_QUOTE_LOCK_TIMEOUT = env('STOCK_QUOTE_LOCK_TIMEOUT', default=10, cast=int)  # seconds
+STOCK_QUOTE_NEGATIVE_TTL = env('STOCK_QUOTE_NEGATIVE_TTL', default=15, cast=int)  # seconds, for symbols without a quote
+STOCK_QUOTE_FANOUT_WORKERS = env('STOCK_QUOTE_FANOUT_WORKERS', default=8, cast=int)
+STOCK_QUOTE_FANOUT_TIMEOUT = env('STOCK_QUOTE_FANOUT_TIMEOUT', default=3.0, cast=float)  # seconds
+# The poller is not waited on by a user, give slow symbols most of a poll interval
+STOCK_POLL_QUOTE_TIMEOUT = env('STOCK_POLL_QUOTE_TIMEOUT', default=45.0, cast=float)  # seconds
+
+# Stock API transport settings
+STOCK_API_TRANSPORT = 'stocks.transport.RequestsTransport'
+STOCK_API_CONNECT_TIMEOUT = env('STOCK_API_CONNECT_TIMEOUT', default=3.05, cast=float)  # seconds
+STOCK_API_READ_TIMEOUT = env('STOCK_API_READ_TIMEOUT', default=10.0, cast=float)  # seconds
+STOCK_API_MAX_RETRIES = env('STOCK_API_MAX_RETRIES', default=3, cast=int)
+STOCK_API_BACKOFF_BASE = env('STOCK_API_BACKOFF_BASE', default=0.5, cast=float)  # seconds
+STOCK_API_BACKOFF_MAX = env('STOCK_API_BACKOFF_MAX', default=8.0, cast=float)  # seconds
+STOCK_API_POOL_SIZE = env('STOCK_API_POOL_SIZE', default=10, cast=int)
+
+# Stock API rate limits, shared across workers through the cache
+STOCK_API_RATE_LIMIT_CACHE_ALIAS = 'default'
+STOCK_API_CALLS_PER_MINUTE = env('STOCK_API_CALLS_PER_MINUTE', default=5, cast=int)
+STOCK_API_CALLS_PER_DAY = env('STOCK_API_CALLS_PER_DAY', default=500, cast=int)
+# Share of each quota a priority class may spend, and how long it may queue for it
+STOCK_API_PRIORITY_SHARES = {
+    'interactive': 1.0,
+    'alert': 0.8,
+    'background': 0.5,
+}
+STOCK_API_PRIORITY_MAX_WAIT = {  # seconds
+    'interactive': 0,
+    'alert': 60,
+    'background': 0,
+}
+
+# Celery settings
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default=REDIS_URL or 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=CELERY_BROKER_URL)  # needed for chords
+CELERY_RESULT_EXPIRES = 60 * 60  # seconds
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = env('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_BEAT_SCHEDULE = {
+    'poll-market-data': {
+        'task': 'stocks.tasks.poll_market_data',
+        'schedule': env('STOCK_POLL_INTERVAL', default=60.0, cast=float),  # seconds
+    },
+    'dispatch-alert-notifications': {
+        'task': 'alerts.tasks.dispatch_alert_notifications',
+        'schedule': env('ALERT_NOTIFICATION_INTERVAL', default=30.0, cast=float),  # seconds
+    },
+    'check-and-process-alerts': {
+        'task': 'alerts.tasks.check_and_process_alerts',
+        # Alerts are evaluated as prices change, the sweep only catches missed updates
+        'schedule': env('ALERT_SWEEP_INTERVAL', default=15 * 60.0, cast=float),  # seconds
+    },
+}
+
+# Stock price writes are buffered and flushed in bulk at this many rows or this age
+STOCK_WRITE_BUFFER_SIZE = env('STOCK_WRITE_BUFFER_SIZE', default=100, cast=int)
+STOCK_WRITE_BUFFER_MAX_AGE = env('STOCK_WRITE_BUFFER_MAX_AGE', default=5.0, cast=float)  # seconds
+
+# How long a live WebSocket subscription count survives without activity
+STOCK_LIVE_SUBSCRIPTION_TTL = 60 * 60  # seconds
+
+# Unsent frames held per WebSocket, and how long a socket may stay full before it is closed
+WS_OUTBOUND_MAX_SIZE = env('WS_OUTBOUND_MAX_SIZE', default=100, cast=int)
+WS_SLOW_CLIENT_TIMEOUT = env('WS_SLOW_CLIENT_TIMEOUT', default=10.0, cast=float)  # seconds
+# Clients acknowledge every WS_ACK_EVERY-th frame, sending stops at this many unacknowledged ones
+WS_ACK_EVERY = env('WS_ACK_EVERY', default=10, cast=int)
+WS_UNACKED_MAX_FRAMES = env('WS_UNACKED_MAX_FRAMES', default=50, cast=int)
+# How often a socket reads prices itself when the channel layer is not shared between processes
+WS_FALLBACK_POLL_INTERVAL = env('WS_FALLBACK_POLL_INTERVAL', default=5.0, cast=float)  # seconds
+
+# Technical indicator results are keyed on the bar store version, the TTL only bounds memory
+STOCK_INDICATOR_CACHE_TTL = env('STOCK_INDICATOR_CACHE_TTL', default=24 * 60 * 60, cast=int)  # seconds
+# Stored bars as NumPy arrays, also keyed on the store version
+STOCK_BAR_ARRAYS_CACHE_TTL = env('STOCK_BAR_ARRAYS_CACHE_TTL', default=60 * 60, cast=int)  # seconds
+
+# Local symbol search index
+STOCK_LISTINGS_FILE = env('STOCK_LISTINGS_FILE', default='')  # Alpha Vantage LISTING_STATUS CSV
+STOCK_SEARCH_INDEX_REFRESH = env('STOCK_SEARCH_INDEX_REFRESH', default=60 * 60, cast=int)  # seconds
+# Below this many local matches and without an exact symbol match, upstream search is asked too
+STOCK_SEARCH_MIN_LOCAL_RESULTS = env('STOCK_SEARCH_MIN_LOCAL_RESULTS', default=3, cast=int)
+# Upstream search results kept for the index, oldest dropped first
+STOCK_SEARCH_UPSTREAM_ENTRIES = env('STOCK_SEARCH_UPSTREAM_ENTRIES', default=10000, cast=int)
+
+# Search result cache
+STOCK_SEARCH_CACHE_ALIAS = 'default'
+STOCK_SEARCH_CACHE_TTL = env('STOCK_SEARCH_CACHE_TTL', default=60 * 60, cast=int)  # seconds
+STOCK_SEARCH_NEGATIVE_TTL = env('STOCK_SEARCH_NEGATIVE_TTL', default=5 * 60, cast=int)  # seconds
+
+# In-memory alert index, rebuilt from the database at least this often per process
+ALERT_INDEX_REBUILD_INTERVAL = env('ALERT_INDEX_REBUILD_INTERVAL', default=15 * 60, cast=int)  # seconds
+# Alert changes published by other processes are applied one by one, more than this reloads the index
+ALERT_INDEX_MAX_CHANGES = env('ALERT_INDEX_MAX_CHANGES', default=1000, cast=int)
+ALERT_BATCH_SIZE = env('ALERT_BATCH_SIZE', default=500, cast=int)
+# Sweeps with fewer armed alerts than this skip the NumPy batch, which only pays off from about here
+ALERT_VECTORIZE_MIN_ALERTS = env('ALERT_VECTORIZE_MIN_ALERTS', default=5000, cast=int)
+ALERT_QUOTE_FETCH_TIMEOUT = env('ALERT_QUOTE_FETCH_TIMEOUT', default=120.0, cast=float)  # seconds
+# The sweep runs as this many parallel tasks, each owning the symbols that hash to it
+ALERT_SWEEP_SHARDS = env('ALERT_SWEEP_SHARDS', default=4, cast=int)
+# Longest a sweep can hold its lock, longer than the sweep interval so runs never overlap
+ALERT_SWEEP_LOCK_TIMEOUT = env('ALERT_SWEEP_LOCK_TIMEOUT', default=60 * 60, cast=int)  # seconds
+
+# Alert notification outbox
+ALERT_NOTIFICATION_BATCH_SIZE = env('ALERT_NOTIFICATION_BATCH_SIZE', default=100, cast=int)
+ALERT_NOTIFICATION_MAX_ATTEMPTS = env('ALERT_NOTIFICATION_MAX_ATTEMPTS', default=5, cast=int)
+ALERT_NOTIFICATION_BACKOFF_BASE = env('ALERT_NOTIFICATION_BACKOFF_BASE', default=30.0, cast=float)  # seconds
+ALERT_NOTIFICATION_LOCK_TIMEOUT = 5 * 60  # seconds
+# Bulk alert imports
+ALERT_IMPORT_MAX_ROWS = env('ALERT_IMPORT_MAX_ROWS', default=1000, cast=int)
+ALERT_IMPORT_RESOLVE_TIMEOUT = env('ALERT_IMPORT_RESOLVE_TIMEOUT', default=30.0, cast=float)  # seconds
+
+# Defaults for users without their own NotificationPreference
+ALERT_DIGEST_WINDOW = env('ALERT_DIGEST_WINDOW', default=60, cast=int)  # seconds
+ALERT_MAX_EMAILS_PER_HOUR = env('ALERT_MAX_EMAILS_PER_HOUR', default=20, cast=int)
@@ -1,30 +1,80 @@
-import json
 import asyncio
+import json
+import logging
 from decimal import Decimal
+from bson.decimal128 import Decimal128
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
 from stocks.models import Stock, WatchlistItem
+from stocks.publisher import DELTA_FIELDS, MSGPACK, PRICE_SCALE, msgpack, pack, with_seq
+from stocks.utils import to_decimal
+from stocks.subscriptions import (
+    add_binary_subscriber, add_live_symbol, remove_binary_subscriber, remove_live_symbol, stock_group_name,
+    user_group_name
+)
 from rest_framework_simplejwt.tokens import AccessToken
+from .fallback import fallback_poller, needs_fallback
+from .outbound import STATS_FLUSH_INTERVAL, OutboundBuffer, record_stats
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Close code for sockets that cannot keep up (1013: try again later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+
 # Custom serializer to convert Decimal128 and Decimal types to float
 def custom_serializer(obj):
-    try:
-        # If using pymongo's Decimal128, it should have a to_decimal() method.
-        from bson.decimal128 import Decimal128
-        if isinstance(obj, Decimal128):
-            return float(obj.to_decimal())
-    except ImportError:
-        # If not using pymongo, ignore this
-        pass
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
     if isinstance(obj, Decimal):
         return float(obj)
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
+def ack_every():
+    """How often clients acknowledge, well inside the unacknowledged frame limit"""
+    return max(1, min(settings.WS_ACK_EVERY, settings.WS_UNACKED_MAX_FRAMES // 2))
+
 class StockConsumer(AsyncWebsocketConsumer):
+    """Pushes watchlist and price updates to one browser.
+
+    Nothing is polled per connection: the watchlist is loaded once on
+    connect (and again when it changes), and prices arrive as `stock_update`
+    events published by the market data poller to each symbol's group,
+    already encoded once for every socket (see stocks.publisher).
+
+    Clients asking for the `msgpack` subprotocol get binary MessagePack
+    frames with prices as integers in 1/PRICE_SCALE units; everyone else
+    gets JSON text. The client gets a `watchlist_snapshot` with every row, then
+    `watchlist_delta` messages holding only the symbols and fields that
+    changed. Every message carries a per-connection `seq` that goes up by
+    one, so a client that sees a gap sends `{"type": "resync"}` and gets a
+    fresh snapshot.
+
+    Handlers never write to the socket themselves: frames go through a
+    bounded OutboundBuffer that one sender task drains, so a slow client
+    does not hold up the channel layer. Pending price updates are
+    conflated to the latest per symbol, and seq is stamped as frames go
+    out. If frames had to be dropped, a snapshot follows once the buffer
+    drains, and a socket that stays full for WS_SLOW_CLIENT_TIMEOUT is
+    closed.
+
+    The server cannot tell how far behind a client is from send(): daphne
+    hands every frame to Twisted's unbounded transport buffer and returns
+    at once. Instead the client acknowledges every `ack_every`-th seq (sent
+    in each snapshot) with `{"type": "ack", "seq": n}`, and the sender
+    stops once WS_UNACKED_MAX_FRAMES frames are unacknowledged. Frames then
+    wait in the OutboundBuffer, where the policy above applies.
+
+    The poller's events only cross processes through a shared channel
+    layer. With the in-memory layer the sockets register what they follow
+    with this process's FallbackPoller, which sends the same events.
+    """
+
     async def connect(self):
         # Parse the token from the query string
         query_string = self.scope.get('query_string', b'').decode('utf-8')
@@ -49,7 +99,17 @@ class StockConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        self.room_group_name = f"stocks_{self.user.id}"
+        self.room_group_name = user_group_name(self.user.id)
+        self.subscriptions = set()
+        self.watchlist = {}
+        self.seq = 0
+        self.binary = msgpack is not None and MSGPACK in self.scope.get('subprotocols', [])
+        self.outbound = OutboundBuffer()
+        self.resync_due = False
+        self.closing = False
+        self.acked = 0
+        self.window = asyncio.Event()
+        self.window.set()
 
         # Join room group
         await self.channel_layer.group_add(
@@ -57,35 +117,104 @@ class StockConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept(subprotocol=MSGPACK if self.binary else None)
+        self.sender = asyncio.create_task(self.send_pending())
+        self.stats_flusher = asyncio.create_task(self.flush_stats_periodically())
+        self.fallback = needs_fallback(self.channel_layer)
+        if self.fallback:
+            fallback_poller.join(self.user.id)
 
-        # Start sending updates
-        asyncio.create_task(self.send_watchlist_updates())
+        # Send the watchlist and follow price updates for its symbols
+        await self.load_watchlist()
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
+            
         # Leave room group upon disconnection
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        
+        self.stats_flusher.cancel()
+        if self.fallback:
+            fallback_poller.leave(self.user.id)
+            
+        # Stop sending and count whatever was still waiting
+        self.sender.cancel()
+        try:
+            await self.sender
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("WebSocket sender for user %s failed", self.user.id)
+        self.outbound.discard()
+        await self.flush_stats()
+        
+        # Drop any symbol subscriptions so the poller stops tracking them
+        for symbol in list(self.subscriptions):
+            await self.unsubscribe_stock(symbol)
+        for symbol in self.watchlist:
+            await self.unfollow(symbol)
+        self.watchlist = {}
     
     # Handle messages from the WebSocket
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            text_data_json = msgpack.unpackb(bytes_data) if self.binary else {}
+        else:
+            text_data_json = json.loads(text_data)
         message_type = text_data_json.get('type')
+        symbol = (text_data_json.get('symbol') or '').strip().upper()
         
-        if message_type == 'subscribe_stock':
-            symbol = text_data_json.get('symbol')
-            await self.channel_layer.group_add(
-                f"stock_{symbol}",
-                self.channel_name
-            )
-        elif message_type == 'unsubscribe_stock':
-            symbol = text_data_json.get('symbol')
-            await self.channel_layer.group_discard(
-                f"stock_{symbol}",
-                self.channel_name
-            )
+        if message_type == 'subscribe_stock' and symbol:
+            await self.subscribe_stock(symbol)
+        elif message_type == 'unsubscribe_stock' and symbol:
+            await self.unsubscribe_stock(symbol)
+        elif message_type == 'resync':
+            await self.send_snapshot()
+        elif message_type == 'ack':
+            self.acknowledge(text_data_json.get('seq'))
+    
+    def acknowledge(self, seq):
+        """Record the last seq the client has handled, reopening the send window"""
+        if not isinstance(seq, int):
+            return
+        self.acked = max(self.acked, min(seq, self.seq))
+        if self.seq - self.acked < settings.WS_UNACKED_MAX_FRAMES:
+            self.window.set()
+    
+    async def subscribe_stock(self, symbol):
+        if symbol in self.subscriptions:
+            return
+        self.subscriptions.add(symbol)
+        await sync_to_async(add_live_symbol)(symbol)
+        if symbol not in self.watchlist:
+            await self.follow(symbol)
+    
+    async def unsubscribe_stock(self, symbol):
+        if symbol not in self.subscriptions:
+            return
+        self.subscriptions.discard(symbol)
+        await sync_to_async(remove_live_symbol)(symbol)
+        if symbol not in self.watchlist:
+            await self.unfollow(symbol)
+    
+    async def follow(self, symbol):
+        """Join a symbol's price group"""
+        await self.channel_layer.group_add(stock_group_name(symbol), self.channel_name)
+        if self.binary:
+            await sync_to_async(add_binary_subscriber)(symbol)
+        if self.fallback:
+            fallback_poller.follow(symbol)
+    
+    async def unfollow(self, symbol):
+        await self.channel_layer.group_discard(stock_group_name(symbol), self.channel_name)
+        if self.binary:
+            await sync_to_async(remove_binary_subscriber)(symbol)
+        if self.fallback:
+            fallback_poller.unfollow(symbol)
     
     # Fetch the user's watchlist stocks from the database
     @database_sync_to_async
@@ -98,30 +227,144 @@ class StockConsumer(AsyncWebsocketConsumer):
             'stock__last_price',
             'stock__change_percent'
         ))
+        # Prices go out as floats, convert them once here so deltas can compare them
+        for row in watchlist:
+            row['stock__last_price'] = float(to_decimal(row['stock__last_price']))
+            row['stock__change_percent'] = float(to_decimal(row['stock__change_percent']))
         return watchlist
     
-    # Periodically send stock updates over the WebSocket
-    async def send_watchlist_updates(self):
-        try:
-            while True:
-                stocks = await self.get_watchlist_stocks()
-                if stocks:
-                    payload = json.dumps({
-                        'type': 'watchlist_update',
-                        'stocks': stocks
-                    }, default=custom_serializer)
-                    await self.send(text_data=payload)
-                
-                # Wait 5 seconds before the next update
-                await asyncio.sleep(5)
-        except asyncio.CancelledError:
-            # Gracefully handle task cancellation, if needed.
-            pass
+    async def load_watchlist(self):
+        """Reload the watchlist, follow its symbols' groups and send it"""
+        watchlist = {
+            row['stock__symbol'].upper(): row
+            for row in await self.get_watchlist_stocks()
+        }
+        for symbol in watchlist.keys() - self.watchlist.keys() - self.subscriptions:
+            await self.follow(symbol)
+        for symbol in self.watchlist.keys() - watchlist.keys() - self.subscriptions:
+            await self.unfollow(symbol)
+        self.watchlist = watchlist
+        await self.send_snapshot()
+    
+    async def send_message(self, message, key=None):
+        """Queue a message, replacing any pending one with the same key"""
+        await self.enqueue((message, None, None), key)
+    
+    async def send_encoded(self, text, packed, key=None):
+        """Queue a message encoded once for all sockets, in JSON text and msgpack bytes"""
+        if self.binary and packed is None:
+            # Published before this socket was counted as a msgpack subscriber
+            packed = pack(json.loads(text))
+        await self.enqueue((None, text, packed), key)
+    
+    async def enqueue(self, frame, key):
+        if self.closing:
+            return
+        if not self.outbound.put(frame, key):
+            # Something was dropped, bring the client back in line once it catches up
+            self.resync_due = True
+        # Conflated frames still mean the client is behind, so check on every frame
+        full = self.outbound.full_since is not None
+        if full and self.outbound.full_for() >= settings.WS_SLOW_CLIENT_TIMEOUT:
+            await self.close_slow_client()
+    
+    async def close_slow_client(self):
+        self.closing = True
+        self.outbound.counts['disconnected'] += 1
+        logger.warning("Closing WebSocket for user %s, %d frames behind", self.user.id, len(self.outbound))
+        self.sender.cancel()
+        await self.close(code=SLOW_CLIENT_CLOSE_CODE)
+    
+    async def send_pending(self):
+        """Send queued frames in order, while the client keeps up with acks, until cancelled"""
+        while True:
+            await self.window.wait()
+            if self.resync_due and not len(self.outbound):
+                self.resync_due = False
+                await self.transmit(self.snapshot_message(), None, None)
+                continue
+            frame = await self.outbound.get()
+            await self.transmit(*frame)
+    
+    async def flush_stats_periodically(self):
+        """Record counts every STATS_FLUSH_INTERVAL, even while the sender waits on a slow client"""
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            try:
+                await self.flush_stats()
+            except Exception:
+                logger.exception("Recording WebSocket stats for user %s failed", self.user.id)
+    
+    async def transmit(self, message, text, packed):
+        """Write one frame to the socket, stamped with the next sequence number"""
+        self.seq += 1
+        if self.seq - self.acked >= settings.WS_UNACKED_MAX_FRAMES:
+            self.window.clear()
+        if message is not None:
+            message['seq'] = self.seq
+            if self.binary:
+                await self.send(bytes_data=pack(message))
+            else:
+                await self.send(text_data=json.dumps(message, default=custom_serializer))
+        elif self.binary:
+            await self.send(bytes_data=with_seq(packed, self.seq))
+        else:
+            await self.send(text_data=with_seq(text, self.seq))
+    
+    async def flush_stats(self):
+        await sync_to_async(record_stats)(self.outbound.take_counts())
+    
+    def snapshot_message(self):
+        message = {
+            'type': 'watchlist_snapshot',
+            'stocks': list(self.watchlist.values()),
+            'ack_every': ack_every()
+        }
+        if self.binary:
+            message['price_scale'] = PRICE_SCALE
+        return message
+    
+    async def send_snapshot(self):
+        await self.send_message(self.snapshot_message(), key='snapshot')
     
     # Handle stock update messages from the room group (if you send group messages)
     async def watchlist_update(self, event):
-        stocks = event['stocks']
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'watchlist_update',
-            'stocks': stocks
-        }, default=custom_serializer))
+            'stocks': event['stocks']
+        })
+    
+    # Handle a watchlist item being added or removed elsewhere
+    async def watchlist_changed(self, event):
+        await self.load_watchlist()
+    
+    # Handle price updates published by the market data poller, encoded once for all sockets
+    async def stock_update(self, event):
+        symbol = event['symbol']
+        
+        if symbol in self.subscriptions:
+            await self.send_encoded(event['text'], event.get('packed'), key=('stock', symbol))
+            
+        row = self.watchlist.get(symbol)
+        if row is None:
+            return
+        changes = {
+            field: value for field, value in zip(DELTA_FIELDS.values(), event['prices'])
+            if value != row[field]
+        }
+        if not changes:
+            return
+        row.update(changes)
+        key = ('delta', symbol)
+        if key in self.outbound:
+            # This replaces a pending delta, so carry the fields it had too
+            changes = {field: row[field] for field in DELTA_FIELDS.values()}
+        
+        # The shared delta fits unless this socket's rows were out of step with the publisher
+        if list(changes) == event['moved']:
+            await self.send_encoded(event['delta_text'], event.get('delta_packed'), key=key)
+        else:
+            await self.send_message({
+                'type': 'watchlist_delta',
+                'stocks': [{'stock__symbol': row['stock__symbol'], **changes}]
+            }, key=key)
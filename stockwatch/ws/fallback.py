@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from collections import Counter
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from stocks.buffer import PRICE_FIELDS
+from stocks.models import Stock, WatchlistItem
+from stocks.publisher import encode_stock_updates
+from stocks.subscriptions import binary_symbols, stock_group_name, user_group_name
+from stocks.utils import to_decimal
+
+logger = logging.getLogger(__name__)
+
+
+def needs_fallback(channel_layer):
+    """Whether the poller's events cannot reach this process through the channel layer"""
+    return isinstance(channel_layer, InMemoryChannelLayer)
+
+
+class FallbackPoller:
+    """Process-wide stand-in for the market data poller's events.
+
+    With a channel layer that stays inside one process, the worker's price
+    updates never reach this process's sockets. One task per process then
+    reads the stored prices of every symbol its sockets follow, and the
+    watchlists of their users, every WS_FALLBACK_POLL_INTERVAL seconds,
+    and sends the changes to the same groups the poller would. Consumers
+    only register what they follow, so the cost per cycle does not grow
+    with the number of connections.
+    """
+
+    def __init__(self):
+        self.symbols = Counter()
+        self.users = Counter()
+        self.prices = {}      # symbol -> {field: value} last sent
+        self.watchlists = {}  # user id -> set of symbols last seen
+        self.task = None
+
+    def follow(self, symbol):
+        self.symbols[symbol] += 1
+        self.start()
+
+    def unfollow(self, symbol):
+        self.symbols[symbol] -= 1
+        if self.symbols[symbol] <= 0:
+            del self.symbols[symbol]
+            self.prices.pop(symbol, None)
+
+    def join(self, user_id):
+        self.users[user_id] += 1
+        self.start()
+
+    def leave(self, user_id):
+        self.users[user_id] -= 1
+        if self.users[user_id] <= 0:
+            del self.users[user_id]
+            self.watchlists.pop(user_id, None)
+
+    def start(self):
+        """Run the polling task in the current event loop unless it already is"""
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+
+    async def run(self):
+        channel_layer = get_channel_layer()
+        while self.symbols or self.users:
+            await asyncio.sleep(settings.WS_FALLBACK_POLL_INTERVAL)
+            try:
+                await self.poll(channel_layer)
+            except Exception:
+                logger.exception("Fallback price poll failed")
+
+    async def poll(self, channel_layer):
+        """Read one cycle of changes and send them to the symbol and user groups"""
+        events, changed_users = await self.read_changes(set(self.symbols), set(self.users))
+        for event in events:
+            await channel_layer.group_send(stock_group_name(event['symbol']), event)
+        for user_id in changed_users:
+            await channel_layer.group_send(user_group_name(user_id), {'type': 'watchlist_changed'})
+
+    @database_sync_to_async
+    def read_changes(self, symbols, user_ids):
+        """Return stock_update events for moved prices and the users whose watchlist changed"""
+        updates = []
+        if symbols:
+            stocks = {}
+            for stock in Stock.objects.filter(symbol__in=symbols):
+                stocks.setdefault(stock.symbol.upper(), stock)
+            for symbol, stock in stocks.items():
+                values = {field: to_decimal(getattr(stock, field)) for field in PRICE_FIELDS}
+                previous = self.prices.get(symbol, {})
+                moved = {field for field, value in values.items() if previous.get(field) != value}
+                self.prices[symbol] = values
+                if moved:
+                    updates.append((stock, moved))
+
+        changed_users = []
+        if user_ids:
+            watchlists = {user_id: set() for user_id in user_ids}
+            rows = WatchlistItem.objects.filter(user_id__in=user_ids).values_list('user_id', 'stock__symbol')
+            for user_id, symbol in rows:
+                watchlists[user_id].add(symbol.upper())
+            changed_users = [
+                user_id for user_id, symbols in watchlists.items()
+                if user_id in self.watchlists and self.watchlists[user_id] != symbols
+            ]
+            self.watchlists = watchlists
+        binary = binary_symbols([stock.symbol for stock, _ in updates]) if updates else set()
+        return encode_stock_updates(updates, binary), changed_users
+
+
+fallback_poller = FallbackPoller()
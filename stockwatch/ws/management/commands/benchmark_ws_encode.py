@@ -0,0 +1,57 @@
+import json
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from stocks.publisher import encode_stock_updates, msgpack
+from ws.consumers import custom_serializer
+
+
+class Command(BaseCommand):
+    help = 'Compare per-socket JSON encoding of price updates with encoding once per broadcast'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 1000, 5000])
+        parser.add_argument('--symbols', type=int, default=50, help='Symbols changed per poll')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stocks = [
+            SimpleNamespace(symbol=f'S{i:03d}', name=f'Stock {i}', last_price=Decimal('123.45') + i,
+                            change_percent=Decimal('-1.25'), volume=100_000 + i, updated_at=now)
+            for i in range(options['symbols'])
+        ]
+        self.stdout.write(f"{'subscribers':>11} {'per-socket':>12} {'encode-once':>12} {'speedup':>8}")
+
+        for subscribers in options['subscribers']:
+            # Before: every socket serializes the Decimal payload itself
+            started = time.perf_counter()
+            for stock in stocks:
+                payload = {
+                    'symbol': stock.symbol, 'name': stock.name, 'last_price': stock.last_price,
+                    'change_percent': stock.change_percent, 'volume': stock.volume,
+                    'updated_at': stock.updated_at.isoformat(),
+                }
+                for seq in range(subscribers):
+                    json.dumps({'type': 'stock_update', 'stock': payload, 'seq': seq}, default=custom_serializer)
+            per_socket = (time.perf_counter() - started) / len(stocks)
+
+            # After: one encode per symbol, sockets only splice in their seq
+            started = time.perf_counter()
+            for event in encode_stock_updates([(stock, {'last_price'}) for stock in stocks]):
+                text = event['text'][1:]
+                for seq in range(subscribers):
+                    f'{{"seq":{seq},{text}'
+            encode_once = (time.perf_counter() - started) / len(stocks)
+
+            self.stdout.write(
+                f"{subscribers:>11} {per_socket * 1000:>10.3f}ms {encode_once * 1000:>10.3f}ms "
+                f"{per_socket / encode_once:>7.0f}x"
+            )
+
+        if msgpack is not None:
+            events = encode_stock_updates([(stock, {'last_price'}) for stock in stocks], {stock.symbol for stock in stocks})
+            json_size = sum(len(event['text'].encode()) for event in events) / len(events)
+            msgpack_size = sum(len(event['packed']) for event in events) / len(events)
+            self.stdout.write(f"stock_update size: {json_size:.0f} bytes JSON, {msgpack_size:.0f} bytes msgpack")
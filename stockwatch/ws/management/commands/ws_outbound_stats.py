@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from ws.outbound import outbound_stats, reset_outbound_stats
+
+
+class Command(BaseCommand):
+    help = 'Show WebSocket outbound buffer counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = outbound_stats()
+        self.stdout.write(f"queue depth:  {stats['depth']}")
+        self.stdout.write(f"queued:       {stats['queued']}")
+        self.stdout.write(f"sent:         {stats['sent']}")
+        self.stdout.write(f"conflated:    {stats['conflated']}")
+        self.stdout.write(f"dropped:      {stats['dropped']}")
+        self.stdout.write(f"discarded:    {stats['discarded']}")
+        self.stdout.write(f"disconnected: {stats['disconnected']}")
+        if options['reset']:
+            reset_outbound_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
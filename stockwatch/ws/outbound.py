@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+
+STATS_KEY_PREFIX = 'ws:outbound:stats'
+STATS_NAMES = ('queued', 'conflated', 'dropped', 'sent', 'discarded', 'disconnected')
+STATS_FLUSH_INTERVAL = 5.0  # seconds
+
+
+class OutboundBuffer:
+    """Bounded queue of unsent frames for one WebSocket.
+
+    Frames put with a key replace a pending frame with the same key in
+    place, so a client that falls behind holds only the latest price per
+    symbol instead of every tick. Other frames queue in order. Once
+    `max_size` frames are pending, new ones are dropped and the buffer
+    remembers since when it has been full.
+
+    Counts are kept locally and added to the shared counters by
+    record_stats(), so the hot path never touches the cache.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = settings.WS_OUTBOUND_MAX_SIZE if max_size is None else max_size
+        self.pending = OrderedDict()
+        self.full_since = None
+        self.counts = Counter()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, key):
+        return key in self.pending
+
+    def put(self, frame, key=None):
+        """Queue a frame, returning False if it was dropped because the buffer is full"""
+        if key is not None and key in self.pending:
+            self.pending[key] = frame
+            self.counts['conflated'] += 1
+            return True
+        if len(self.pending) >= self.max_size:
+            self.counts['dropped'] += 1
+            return False
+
+        self.pending[object() if key is None else key] = frame
+        self.counts['queued'] += 1
+        if len(self.pending) >= self.max_size and self.full_since is None:
+            self.full_since = time.monotonic()
+        self._ready.set()
+        return True
+
+    async def get(self):
+        """Wait for and return the oldest pending frame"""
+        while not self.pending:
+            self._ready.clear()
+            await self._ready.wait()
+        _, frame = self.pending.popitem(last=False)
+        self.counts['sent'] += 1
+        if len(self.pending) < self.max_size:
+            self.full_since = None
+        return frame
+
+    def full_for(self):
+        """Seconds the buffer has been full, 0 if it is not"""
+        return 0.0 if self.full_since is None else time.monotonic() - self.full_since
+
+    def discard(self):
+        """Forget every pending frame, e.g. when the socket goes away"""
+        self.counts['discarded'] += len(self.pending)
+        self.pending.clear()
+        self.full_since = None
+
+    def take_counts(self):
+        counts, self.counts = self.counts, Counter()
+        return counts
+
+
+def record_stats(counts):
+    """Add a buffer's local counts to the shared counters"""
+    for name, value in counts.items():
+        if not value:
+            continue
+        key = f"{STATS_KEY_PREFIX}:{name}"
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            pass
+
+
+def outbound_stats():
+    """Return the shared counters and the frames currently waiting across all sockets"""
+    values = cache.get_many([f"{STATS_KEY_PREFIX}:{name}" for name in STATS_NAMES])
+    stats = {name: values.get(f"{STATS_KEY_PREFIX}:{name}", 0) for name in STATS_NAMES}
+    stats['depth'] = max(stats['queued'] - stats['sent'] - stats['discarded'], 0)
+    return stats
+
+
+def reset_outbound_stats():
+    cache.delete_many([f"{STATS_KEY_PREFIX}:{name}" for name in STATS_NAMES])
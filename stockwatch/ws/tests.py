@@ -0,0 +1,349 @@
+import asyncio
+import time
+import unittest
+from collections import Counter
+from decimal import Decimal
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from stocks.models import Stock, WatchlistItem
+from stocks.publisher import MSGPACK, PRICE_SCALE, dumps, encode_stock_updates, msgpack, pack, with_seq
+from stocks.subscriptions import binary_symbols, stock_group_name, user_group_name
+from ws.consumers import SLOW_CLIENT_CLOSE_CODE, StockConsumer
+from ws.fallback import fallback_poller
+from ws.outbound import OutboundBuffer, outbound_stats, reset_outbound_stats
+
+
+class StockConsumerTestCase(TransactionTestCase):
+    """Test cases for the pushed watchlist and price updates"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.aapl = Stock.objects.create(symbol='AAPL', name='Apple Inc.', last_price=Decimal('150.00'),
+                                         change_percent=Decimal('0.50'), volume=1000)
+        self.msft = Stock.objects.create(symbol='MSFT', name='Microsoft Corp.', last_price=Decimal('400.00'),
+                                         change_percent=Decimal('-0.25'), volume=500)
+        WatchlistItem.objects.create(user=self.user, stock=self.aapl)
+
+    async def connect(self, subprotocols=None):
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        communicator = WebsocketCommunicator(StockConsumer.as_asgi(), f'/ws/stocks/?token={token}',
+                                             subprotocols=subprotocols)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def stock_event(self, symbol, price, changed=('last_price', 'change_percent')):
+        stock = Stock(symbol=symbol, name=symbol, last_price=Decimal(str(price)), change_percent=Decimal('1.00'),
+                      volume=100, updated_at=timezone.now())
+        event, = encode_stock_updates([(stock, set(changed))], binary_symbols([symbol]))
+        return event
+
+    async def test_snapshot_then_deltas(self):
+        """Test a snapshot is sent on connect, then only changed fields with rising seq"""
+        communicator = await self.connect()
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['seq']), ('watchlist_snapshot', 1))
+        self.assertEqual([row['stock__symbol'] for row in message['stocks']], ['AAPL'])
+        self.assertEqual(message['stocks'][0]['stock__last_price'], 150.0)
+
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send(stock_group_name('MSFT'), self.stock_event('MSFT', 401.0))
+        await channel_layer.group_send(stock_group_name('AAPL'), self.stock_event('AAPL', 151.0))
+        message = await communicator.receive_json_from()
+        self.assertEqual(message, {
+            'type': 'watchlist_delta', 'seq': 2,
+            'stocks': [{'stock__symbol': 'AAPL', 'stock__last_price': 151.0, 'stock__change_percent': 1.0}],
+        })
+
+        # Only the field that moved is sent, and an unchanged quote sends nothing
+        await channel_layer.group_send(stock_group_name('AAPL'), self.stock_event('AAPL', 152.0, ['last_price']))
+        message = await communicator.receive_json_from()
+        self.assertEqual(message, {
+            'type': 'watchlist_delta', 'seq': 3, 'stocks': [{'stock__symbol': 'AAPL', 'stock__last_price': 152.0}],
+        })
+        await channel_layer.group_send(stock_group_name('AAPL'), self.stock_event('AAPL', 152.0, []))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_resync(self):
+        """Test a client that missed a message can ask for a fresh snapshot"""
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', 151.0))
+        await communicator.receive_json_from()
+
+        await communicator.send_json_to({'type': 'resync'})
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['seq']), ('watchlist_snapshot', 3))
+        self.assertEqual(message['stocks'][0]['stock__last_price'], 151.0)
+        await communicator.disconnect()
+
+    async def test_watchlist_changes_are_followed(self):
+        """Test adding a stock elsewhere reloads the watchlist and follows its prices"""
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+
+        # Saving the item notifies the user's group once the write commits
+        await sync_to_async(WatchlistItem.objects.create)(user=self.user, stock=self.msft)
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['type'], 'watchlist_snapshot')
+        self.assertEqual(sorted(row['stock__symbol'] for row in message['stocks']), ['AAPL', 'MSFT'])
+
+        await get_channel_layer().group_send(stock_group_name('MSFT'), self.stock_event('MSFT', 401.0))
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['stocks'][0]['stock__symbol'], 'MSFT')
+        await communicator.disconnect()
+
+    async def test_in_memory_layer_falls_back_to_polling(self):
+        """Test one poller per process reads stored prices for every socket when events cannot reach them"""
+        with self.settings(WS_FALLBACK_POLL_INTERVAL=0.05):
+            first = await self.connect()
+            second = await self.connect()
+            await first.receive_json_from()
+            await second.receive_json_from()
+            self.assertEqual(fallback_poller.symbols['AAPL'], 2)
+
+            await Stock.objects.filter(pk=self.aapl.pk).aupdate(last_price=Decimal('155.00'))
+            for communicator in (first, second):
+                message = await communicator.receive_json_from()
+                self.assertEqual(message['stocks'], [{'stock__symbol': 'AAPL', 'stock__last_price': 155.0}])
+
+            await first.send_json_to({'type': 'subscribe_stock', 'symbol': 'msft'})
+            message = await first.receive_json_from()
+            self.assertEqual((message['type'], message['stock']['last_price']), ('stock_update', 400.0))
+
+            # Watchlist changes whose signal never reached this process are noticed too
+            await WatchlistItem.objects.abulk_create([WatchlistItem(user=self.user, stock=self.msft)])
+            message = await second.receive_json_from()
+            self.assertEqual(message['type'], 'watchlist_snapshot')
+            await first.disconnect()
+            await second.disconnect()
+        self.assertEqual((fallback_poller.symbols, fallback_poller.users), (Counter(), Counter()))
+
+    async def test_shared_layer_does_not_poll(self):
+        """Test sockets leave prices to the poller's events when the layer is shared"""
+        with self.settings(WS_FALLBACK_POLL_INTERVAL=0.05), patch('ws.consumers.needs_fallback', return_value=False):
+            communicator = await self.connect()
+            await communicator.receive_json_from()
+            self.assertNotIn('AAPL', fallback_poller.symbols)
+            await Stock.objects.filter(pk=self.aapl.pk).aupdate(last_price=Decimal('155.00'))
+            self.assertTrue(await communicator.receive_nothing(0.2))
+            await communicator.disconnect()
+
+    async def test_unauthenticated_socket_is_closed(self):
+        """Test sockets without a valid token are refused"""
+        communicator = WebsocketCommunicator(StockConsumer.as_asgi(), '/ws/stocks/?token=bad')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_subscribed_symbols_get_encoded_updates(self):
+        """Test stock_update text is passed through with this socket's seq spliced in"""
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'type': 'subscribe_stock', 'symbol': 'msft'})
+        await communicator.receive_nothing()
+
+        # Without msgpack subscribers only the JSON frames are published
+        event = self.stock_event('MSFT', 401.5)
+        self.assertEqual(set(event), {'type', 'symbol', 'prices', 'moved', 'text', 'delta_text'})
+        await get_channel_layer().group_send(stock_group_name('MSFT'), event)
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['seq']), ('stock_update', 2))
+        self.assertEqual(message['stock']['last_price'], 401.5)
+        await communicator.disconnect()
+
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    async def test_msgpack_subprotocol(self):
+        """Test sockets asking for msgpack get binary frames with scaled integer prices"""
+        communicator = await self.connect(subprotocols=[MSGPACK])
+        message = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual((message['type'], message['seq'], message['price_scale']),
+                         ('watchlist_snapshot', 1, PRICE_SCALE))
+        self.assertEqual(message['stocks'][0]['stock__last_price'], 150 * PRICE_SCALE)
+
+        await communicator.send_to(bytes_data=msgpack.packb({'type': 'subscribe_stock', 'symbol': 'msft'}))
+        await communicator.receive_nothing()
+        self.assertEqual(await sync_to_async(binary_symbols)(['AAPL', 'MSFT', 'TSLA']), {'AAPL', 'MSFT'})
+        self.assertIn('packed', self.stock_event('MSFT', 401.5))
+        await get_channel_layer().group_send(stock_group_name('MSFT'), self.stock_event('MSFT', 401.5))
+        message = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual((message['type'], message['seq']), ('stock_update', 2))
+        self.assertEqual(message['stock']['last_price'], 4_015_000)
+
+        await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', 151.25))
+        message = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(message, {
+            'seq': 3, 'type': 'watchlist_delta',
+            'stocks': [{'stock__symbol': 'AAPL', 'stock__last_price': 1_512_500, 'stock__change_percent': 10_000}],
+        })
+        await communicator.disconnect()
+        self.assertEqual(await sync_to_async(binary_symbols)(['AAPL', 'MSFT']), set())
+
+    async def test_json_stays_the_default(self):
+        """Test sockets that ask for no or an unknown subprotocol get JSON text"""
+        communicator = await self.connect(subprotocols=['v2.example'])
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['type'], 'watchlist_snapshot')
+        self.assertNotIn('price_scale', message)
+        await communicator.disconnect()
+
+
+    async def test_slow_client_gets_latest_price(self):
+        """Test price updates held back while the client has not acknowledged are conflated to the latest"""
+        with self.settings(WS_UNACKED_MAX_FRAMES=1):
+            communicator = await self.connect()
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['ack_every'], 1)
+            for price in (151.0, 152.0, 153.0, 154.0):
+                await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', price))
+            self.assertTrue(await communicator.receive_nothing())
+
+            await communicator.send_json_to({'type': 'ack', 'seq': 1})
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['seq'], 2)
+            self.assertEqual(message['stocks'][0]['stock__last_price'], 154.0)
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+    async def test_acknowledging_client_keeps_receiving(self):
+        """Test a client that acknowledges every ack_every-th frame is never held back"""
+        with self.settings(WS_UNACKED_MAX_FRAMES=4, WS_ACK_EVERY=10):
+            communicator = await self.connect()
+            ack_every = (await communicator.receive_json_from())['ack_every']
+            self.assertEqual(ack_every, 2)
+            for price in range(151, 161):
+                await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', price))
+                message = await communicator.receive_json_from()
+                self.assertEqual(message['stocks'][0]['stock__last_price'], price)
+                if message['seq'] % ack_every == 0:
+                    await communicator.send_json_to({'type': 'ack', 'seq': message['seq']})
+            await communicator.disconnect()
+
+    async def test_unacknowledging_client_is_disconnected(self):
+        """Test a socket that stays full past the timeout is closed and counted"""
+        await sync_to_async(reset_outbound_stats)()
+        with self.settings(WS_UNACKED_MAX_FRAMES=1, WS_OUTBOUND_MAX_SIZE=2, WS_SLOW_CLIENT_TIMEOUT=0.1):
+            communicator = await self.connect()
+            await communicator.receive_json_from()
+            for _ in range(4):
+                await get_channel_layer().group_send(
+                    user_group_name(self.user.id), {'type': 'watchlist_update', 'stocks': []}
+                )
+            self.assertTrue(await communicator.receive_nothing(0.15))
+            await get_channel_layer().group_send(
+                user_group_name(self.user.id), {'type': 'watchlist_update', 'stocks': []}
+            )
+            output = await communicator.receive_output()
+            self.assertEqual(output, {'type': 'websocket.close', 'code': SLOW_CLIENT_CLOSE_CODE})
+            await communicator.disconnect()
+
+        stats = await sync_to_async(outbound_stats)()
+        self.assertEqual(stats['disconnected'], 1)
+        self.assertGreaterEqual(stats['dropped'], 1)
+        self.assertEqual(stats['depth'], 0)
+
+    async def test_client_behind_on_conflated_frames_is_disconnected(self):
+        """Test a full socket is closed even when new frames only replace pending ones"""
+        with self.settings(WS_UNACKED_MAX_FRAMES=1, WS_OUTBOUND_MAX_SIZE=1, WS_SLOW_CLIENT_TIMEOUT=0.1):
+            communicator = await self.connect()
+            await communicator.receive_json_from()
+            for price in (151.0, 152.0, 153.0):
+                await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', price))
+            self.assertTrue(await communicator.receive_nothing(0.15))
+            await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', 154.0))
+            output = await communicator.receive_output()
+            self.assertEqual(output, {'type': 'websocket.close', 'code': SLOW_CLIENT_CLOSE_CODE})
+            await communicator.disconnect()
+
+    async def test_stats_are_recorded_while_held_back(self):
+        """Test counts reach the shared stats while the sender waits on a slow client"""
+        await sync_to_async(reset_outbound_stats)()
+        with self.settings(WS_UNACKED_MAX_FRAMES=1), patch('ws.consumers.STATS_FLUSH_INTERVAL', 0.05):
+            communicator = await self.connect()
+            await communicator.receive_json_from()
+            for price in (151.0, 152.0, 153.0):
+                await get_channel_layer().group_send(stock_group_name('AAPL'), self.stock_event('AAPL', price))
+            await asyncio.sleep(0.2)
+            stats = await sync_to_async(outbound_stats)()
+            # The snapshot and the first price were queued, the later prices replaced it
+            self.assertEqual((stats['queued'], stats['conflated'], stats['sent']), (2, 2, 1))
+            await communicator.disconnect()
+
+
+@unittest.skipUnless(msgpack, 'msgpack is not installed')
+class WireFormatTestCase(SimpleTestCase):
+    """Compare the JSON and msgpack encodings of a full watchlist snapshot"""
+
+    def setUp(self):
+        self.snapshot = {
+            'type': 'watchlist_snapshot',
+            'seq': 1,
+            'stocks': [
+                {'stock__symbol': f'S{i:03d}', 'stock__name': f'Stock {i}',
+                 'stock__last_price': 123.45 + i, 'stock__change_percent': -1.25}
+                for i in range(50)
+            ],
+        }
+
+    def test_msgpack_is_smaller(self):
+        """Test the msgpack snapshot is smaller than the compact JSON one"""
+        json_size = len(dumps(self.snapshot).encode())
+        msgpack_size = len(pack(self.snapshot))
+        self.assertLess(msgpack_size, json_size * 0.9)
+
+    def test_encode_time(self):
+        """Test msgpack encoding stays in the same range as JSON, prices being scaled on the way"""
+        def best_of(encode):
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                for _ in range(100):
+                    encode(self.snapshot)
+                timings.append(time.perf_counter() - started)
+            return min(timings)
+
+        self.assertLess(best_of(pack), best_of(dumps) * 3)
+
+    def test_seq_splice_matches_full_encode(self):
+        """Test splicing seq into pre-encoded frames gives the same message as encoding it in"""
+        message = {'type': 'stock_update', 'stock': {'symbol': 'AAPL', 'last_price': 150.5}}
+        self.assertEqual(msgpack.unpackb(with_seq(pack(message), 7)), {'seq': 7, **msgpack.unpackb(pack(message))})
+        self.assertEqual(with_seq(dumps(message), 7), dumps({'seq': 7, **message}))
+
+
+class OutboundBufferTestCase(SimpleTestCase):
+    """Test cases for the per-socket outbound buffer"""
+
+    async def test_keyed_frames_are_conflated_in_place(self):
+        """Test a keyed frame replaces the pending one without losing its place"""
+        buffer = OutboundBuffer(max_size=10)
+        buffer.put('aapl 151', key='AAPL')
+        buffer.put('snapshot')
+        buffer.put('aapl 152', key='AAPL')
+        self.assertEqual([await buffer.get(), await buffer.get()], ['aapl 152', 'snapshot'])
+        self.assertEqual((buffer.counts['queued'], buffer.counts['conflated']), (2, 1))
+
+    async def test_full_buffer_drops_frames(self):
+        """Test frames are dropped once the buffer is full, and how long it was full is tracked"""
+        buffer = OutboundBuffer(max_size=2)
+        self.assertTrue(buffer.put('a'))
+        self.assertEqual(buffer.full_for(), 0.0)
+        self.assertTrue(buffer.put('b', key='B'))
+        self.assertFalse(buffer.put('c'))
+        self.assertGreaterEqual(buffer.full_for(), 0.0)
+        self.assertIsNotNone(buffer.full_since)
+        # Newer prices still replace pending ones in a full buffer
+        self.assertTrue(buffer.put('b2', key='B'))
+        self.assertEqual((buffer.counts['dropped'], buffer.counts['conflated']), (1, 1))
+
+        self.assertEqual(await buffer.get(), 'a')
+        self.assertIsNone(buffer.full_since)
+        buffer.discard()
+        self.assertEqual((len(buffer), buffer.counts['discarded']), (0, 1))